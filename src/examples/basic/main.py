@@ -4,7 +4,8 @@ from gradio import ChatMessage
 from agents import Agent, Runner
 from agents.mcp import MCPServerStdio
 
-MICROBIT_PORT = "/dev/cu.usbmodem102"
+# "auto" probes the serial ports for the board (or use its port, e.g. "/dev/cu.usbmodem102")
+MICROBIT_PORT = "auto"
 MCP_SERVER_COMMAND = "uv"
 MCP_SERVER_ARGS = ["run", "microbit-mcp", "-p", MICROBIT_PORT]
 
@@ -0,0 +1,92 @@
+"""
+Measure host-side command latency against a connected micro:bit.
+
+Sends TEMP: and IMAGE: commands one at a time and reports the round trip
+from writing the command to receiving its reply. Run it once with the old
+firmware flashed and once with the new one to compare.
+
+    uv run python src/examples/latency/main.py -p /dev/cu.usbmodem102
+
+Without a board, compare against the simulator, whose --legacy-loop reads
+one byte per 50 ms pass like the firmware before bulk UART reads:
+
+    uv run microbit-sim --link /tmp/microbit --legacy-loop
+    uv run python src/examples/latency/main.py -p /tmp/microbit --no-sequence-ids
+
+Measured that way at 115200 baud, 50 sequential commands each (ms):
+
+    loop               command   min      p50      p95
+    one byte per pass  TEMP:     292.8    300.0    303.4
+                       IMAGE:    1793.1   1800.1   1800.7
+    bulk read          TEMP:     1.4      1.6      3.9
+                       IMAGE:    4.9      5.1      6.5
+    bulk read, #seq#   TEMP:     2.6      3.9      6.3
+    and binary frames  IMAGE:    6.3      7.7      11.4
+
+The simulator leaves out the board's own processing time, so the numbers
+show what the loop costs rather than what a board will measure.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from mcp_server.microbit_client import DEFAULT_PORT, MicrobitClient
+from mcp_server.protocol import Responses, format_image_command, format_temperature_command
+
+STAR = "00300:03630:36963:03630:00300"
+
+
+async def measure(client: MicrobitClient, command: str, kind: str, count: int) -> dict:
+    """Round-trip latency in milliseconds for count sequential commands."""
+    # The first reply can wait behind what the handshake left in the board's buffer
+    await client.request(command, (kind,), timeout=10.0)
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await client.request(command, (kind,), timeout=10.0)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "command": command,
+        "count": count,
+        "min_ms": round(samples[0], 2),
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[int(0.95 * (count - 1))], 2),
+        "max_ms": round(samples[-1], 2),
+    }
+
+
+async def main(port: str, count: int, sequence_ids: bool):
+    if sequence_ids:
+        client = MicrobitClient(port)
+    else:
+        # Firmware that old knows none of the handshake's extras either
+        client = MicrobitClient(
+            port, sequence_ids=False, flow_control=False, binary_framing=False, melody_cache=False,
+            clock_sync_interval=0
+        )
+    await client.setup_serial_connection()
+    try:
+        results = [
+            await measure(client, format_temperature_command(), Responses.TEMP, count),
+            await measure(client, format_image_command(STAR), Responses.STATUS, count),
+        ]
+        print(json.dumps(results, indent=2))
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-p", "--port", default=DEFAULT_PORT)
+    parser.add_argument("-n", "--count", type=int, default=50)
+    parser.add_argument(
+        "--no-sequence-ids",
+        action="store_true",
+        help="Send plain commands and skip the handshake extras (for firmware without the #seq# envelope)"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args.port, args.count, not args.no_sequence_ids))
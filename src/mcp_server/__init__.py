@@ -5,9 +5,12 @@ This package provides an MCP (Model Context Protocol) server for interacting
 with micro:bit devices over serial connections.
 """
 
+# First, so the startup timings include importing everything below
+from .startup import IMPORT_STARTED as IMPORT_STARTED
 from .server import MicrobitMCPServer
 from .microbit_client import MicrobitClient
+from .device_pool import DevicePool
 from .protocol import Commands, Responses
 
 __version__ = "0.1.0"
-__all__ = ["MicrobitMCPServer", "MicrobitClient", "Commands", "Responses"]
+__all__ = ["MicrobitMCPServer", "MicrobitClient", "DevicePool", "Commands", "Responses"]
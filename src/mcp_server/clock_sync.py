@@ -0,0 +1,172 @@
+"""
+Host-side estimate of the micro:bit's clock.
+
+Every reply from the micro:bit carries its running_time() in milliseconds,
+counted from the board's last reset at the rate of the board's own
+oscillator. This module maps those timestamps to host time using ping/echo
+exchanges, the way NTP does: an exchange brackets the device timestamp
+between the host's send and receive times, and only the exchanges with
+the smallest round trip (the least queueing on either side) are trusted.
+A line fitted through those over a long enough span gives the drift.
+"""
+
+import collections
+import time
+from typing import Optional
+
+# Exchanges kept, and how much longer than the shortest round trip an
+# exchange may take and still be used
+DEFAULT_WINDOW = 32
+RTT_TOLERANCE = 0.002
+
+# Shortest span of exchanges a drift is fitted over, and the largest drift
+# believed (anything above is noise, not a crystal)
+MIN_DRIFT_SPAN = 10.0
+MAX_DRIFT_PPM = 1000.0
+
+# A device timestamp this far off the current estimate means the board restarted
+RESET_THRESHOLD = 1.0
+
+
+class ClockSync:
+    """Offset and drift of the micro:bit's running_time() against the host clock."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        """
+        Initialize an unsynchronized clock.
+
+        Args:
+            window: Number of recent exchanges the estimate is based on
+        """
+        self.window = window
+        # (host monotonic time of the device timestamp, device seconds, round trip)
+        self._samples: collections.deque[tuple[float, float, float]] = collections.deque(maxlen=window)
+        # Host epoch time at monotonic time 0
+        self._epoch = time.time() - time.monotonic()
+        # device seconds = rate * host monotonic seconds + intercept
+        self._rate = 1.0
+        self._intercept: Optional[float] = None
+        self._min_rtt: Optional[float] = None
+        self._synced_at: Optional[float] = None
+
+    @property
+    def synced(self) -> bool:
+        """Whether at least one exchange has been measured since the last reset."""
+        return self._intercept is not None
+
+    def reset(self) -> None:
+        """Forget every exchange, e.g. when the board restarted its running_time()."""
+        self._samples.clear()
+        self._rate = 1.0
+        self._intercept = None
+        self._min_rtt = None
+        self._synced_at = None
+
+    def add_sample(
+        self,
+        sent: float,
+        received: float,
+        device_ms: int,
+        uplink: float = 0.0,
+        downlink: float = 0.0
+    ) -> float:
+        """
+        Add a ping/echo exchange and update the estimate.
+
+        Args:
+            sent: Host monotonic time the ping was written
+            received: Host monotonic time the echo arrived
+            device_ms: Device timestamp carried by the echo
+            uplink: Time the ping's bytes take on the wire, at least
+            downlink: Time the echo's bytes take on the wire, at least
+
+        Returns:
+            Round trip time in seconds
+        """
+        rtt = received - sent
+        # The timestamp is taken once the ping has fully arrived and before
+        # the echo is sent; split the rest of the round trip evenly. Integer
+        # milliseconds truncate, so the true device time is half a tick later.
+        stamped = sent + uplink + max(rtt - uplink - downlink, 0.0) / 2
+        device = (device_ms + 0.5) / 1000
+
+        if self.synced and abs(self._device_seconds(stamped) - device) > RESET_THRESHOLD + rtt:
+            self.reset()
+
+        self._samples.append((stamped, device, rtt))
+        self._estimate()
+        self._synced_at = received
+        return rtt
+
+    def _estimate(self) -> None:
+        """Fit the clock model to the exchanges with the shortest round trips."""
+        self._min_rtt = min(rtt for _, _, rtt in self._samples)
+        best = [sample for sample in self._samples if sample[2] <= self._min_rtt + RTT_TOLERANCE]
+
+        rate = 1.0
+        span = best[-1][0] - best[0][0]
+        if len(best) > 1 and span >= MIN_DRIFT_SPAN:
+            mean_host = sum(host for host, _, _ in best) / len(best)
+            mean_device = sum(device for _, device, _ in best) / len(best)
+            variance = sum((host - mean_host) ** 2 for host, _, _ in best)
+            covariance = sum((host - mean_host) * (device - mean_device) for host, device, _ in best)
+            slope = covariance / variance
+            if abs(slope - 1.0) * 1e6 <= MAX_DRIFT_PPM:
+                rate = slope
+
+        # Anchor the line on the single most trustworthy exchange
+        host, device, _ = min(best, key=lambda sample: sample[2])
+        self._rate = rate
+        self._intercept = device - rate * host
+
+    def _device_seconds(self, host: float) -> float:
+        return self._rate * host + self._intercept
+
+    def to_monotonic(self, device_ms: int) -> Optional[float]:
+        """
+        Convert a device timestamp to host monotonic time.
+
+        Args:
+            device_ms: micro:bit running_time() in milliseconds
+
+        Returns:
+            Host time.monotonic() value, or None if not synchronized
+        """
+        if not self.synced:
+            return None
+        return ((device_ms + 0.5) / 1000 - self._intercept) / self._rate
+
+    def to_host_time(self, device_ms: int) -> Optional[float]:
+        """
+        Convert a device timestamp to host epoch time.
+
+        Args:
+            device_ms: micro:bit running_time() in milliseconds
+
+        Returns:
+            Seconds since the epoch, as time.time(), or None if not synchronized
+        """
+        host = self.to_monotonic(device_ms)
+        return None if host is None else host + self._epoch
+
+    def describe(self) -> dict:
+        """
+        Summarize the estimate.
+
+        Returns:
+            Dictionary with whether the clock is synchronized, the host epoch
+            time the board's running_time() started, the drift in parts per
+            million, the shortest round trip and the resulting uncertainty in
+            milliseconds, the number of exchanges and the age of the last one
+        """
+        if not self.synced:
+            return {"synced": False, "samples": 0}
+        return {
+            "synced": True,
+            "device_start_time": round(self._epoch - self._intercept / self._rate, 6),
+            "drift_ppm": round((self._rate - 1.0) * 1e6, 1),
+            "min_rtt_ms": round(self._min_rtt * 1000, 3),
+            "uncertainty_ms": round(self._min_rtt * 500, 3),
+            "samples": len(self._samples),
+            "age_seconds": round(time.monotonic() - self._synced_at, 3)
+        }
@@ -0,0 +1,137 @@
+"""
+Pool of micro:bit devices managed by one MCP server.
+
+This module keeps one MicrobitClient (with its own serial connection and
+reader task) per board, and resolves the device selectors that tools
+accept: a device ID, a tag shared by several boards, or "all".
+"""
+
+import asyncio
+import os
+import sys
+from typing import Optional
+
+from .microbit_client import MicrobitClient
+
+# Selector matching every device in the pool
+ALL_DEVICES = "all"
+
+
+def parse_port_spec(spec: str) -> tuple[str, str]:
+    """
+    Split a [ID=]PORT command line value into a device ID and a port.
+
+    Without an explicit ID the device is named after the port's file name
+    (e.g. "cu.usbmodem102").
+    """
+    device_id, separator, port = spec.partition("=")
+    if not separator:
+        port = spec
+        device_id = os.path.basename(port.rstrip("/")) or port
+    return device_id, port
+
+
+class DevicePool:
+    """Collection of micro:bit clients addressed by ID or tag."""
+
+    def __init__(self):
+        """Initialize an empty device pool."""
+        self.clients: dict[str, MicrobitClient] = {}
+        self.tags: dict[str, set[str]] = {}
+
+    def add(self, device_id: str, client: MicrobitClient, tags: tuple = ()) -> None:
+        """
+        Add a device to the pool.
+
+        Args:
+            device_id: Unique name used to address the device
+            client: Client for the device's serial connection
+            tags: Group names the device can also be addressed by
+
+        Raises:
+            ValueError: If the ID is already used or reserved
+        """
+        if device_id in self.clients or device_id == ALL_DEVICES:
+            raise ValueError(f"Invalid or duplicate device ID: {device_id}")
+        self.clients[device_id] = client
+        self.tags[device_id] = set(tags)
+
+    @property
+    def default_id(self) -> Optional[str]:
+        """ID of the device used when a tool call doesn't select one (the first added)."""
+        return next(iter(self.clients), None)
+
+    def select(self, selector: Optional[str] = None) -> list[tuple[str, MicrobitClient]]:
+        """
+        Resolve a device selector.
+
+        Args:
+            selector: Device ID, tag, "all", or None for the default device
+
+        Returns:
+            List of (device ID, client) pairs, in pool order
+
+        Raises:
+            ValueError: If no device matches
+        """
+        if selector is None:
+            selector = self.default_id
+        if selector == ALL_DEVICES:
+            selected = list(self.clients.items())
+        elif selector in self.clients:
+            selected = [(selector, self.clients[selector])]
+        else:
+            selected = [
+                (device_id, client) for device_id, client in self.clients.items()
+                if selector in self.tags[device_id]
+            ]
+        if not selected:
+            raise ValueError(f"No micro:bit matches device selector: {selector}")
+        return selected
+
+    def describe(self) -> list[dict]:
+        """Summary of every device: ID, port, tags, connection state, reconnects, flow control, clock and latencies."""
+        return [
+            {
+                "device": device_id,
+                "port": client.serial_port,
+                "tags": sorted(self.tags[device_id]),
+                "connected": client.is_connected(),
+                "reconnects": client.reconnects,
+                "flow": client.flow_stats(),
+                "clock": client.clock.describe(),
+                "latency": client.latency_stats(),
+                "default": device_id == self.default_id
+            }
+            for device_id, client in self.clients.items()
+        ]
+
+    async def setup(self) -> None:
+        """
+        Connect to every device concurrently.
+
+        Devices that fail to connect are reported and left disconnected;
+        the next tool call addressing one tries again.
+
+        Raises:
+            Exception: If no device could be connected
+        """
+        results = await asyncio.gather(
+            *(client.connect() for client in self.clients.values()),
+            return_exceptions=True
+        )
+        failures = [
+            device_id for device_id, result in zip(self.clients, results)
+            if isinstance(result, BaseException)
+        ]
+        for device_id in failures:
+            print(f"micro:bit {device_id} is unavailable", file=sys.stderr)
+        if self.clients and len(failures) == len(self.clients):
+            raise Exception("Failed to connect to any micro:bit")
+
+    async def close(self) -> None:
+        """Close every device connection."""
+        await asyncio.gather(
+            *(client.close() for client in self.clients.values()),
+            return_exceptions=True
+        )
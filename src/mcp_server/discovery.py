@@ -0,0 +1,228 @@
+"""
+Serial port discovery for micro:bit boards.
+
+Instead of a configured port, the server can find its board: every
+candidate serial port (those that look like a micro:bit, or every USB
+serial port if asked to) is opened and sent IDENTIFY: concurrently, and each
+board that answers reports its unique ID, firmware version and
+capabilities. The fastest responder is used. The board last used is
+cached on disk with its port, so the next start probes that one port and
+only scans them all when the board has moved.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Optional
+
+import serial.tools.list_ports
+import serial_asyncio
+
+from .microbit_client import BAUD_RATE
+from .protocol import Responses, format_identify_command, parse_response
+
+# Port spec asking for discovery instead of a fixed port (-p auto)
+AUTO_PORT = "auto"
+
+# USB vendor ID of the micro:bit's interface chip (Arm mbed DAPLink)
+MICROBIT_USB_VID = 0x0D28
+
+# Seconds a port has to answer IDENTIFY:; a board that just booted takes
+# about a second to reach its main loop
+IDENTIFY_TIMEOUT = 1.5
+
+_IDENTIFY_REPLY = Responses.STATUS + "identify:"
+
+
+def default_cache_path() -> str:
+    """Path of the board cache, under $XDG_CACHE_HOME (or ~/.cache)."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "microbit-mcp", "boards.json")
+
+
+def is_likely_microbit(port) -> bool:
+    """Whether a pyserial ListPortInfo looks like a micro:bit, by USB ID or name."""
+    description = (port.description or "").lower()
+    device = port.device.lower()
+    if port.vid == MICROBIT_USB_VID:
+        return True
+    if any(keyword in description for keyword in ['microbit', 'micro:bit', 'daplink', 'mbed']):
+        return True
+    # Also check for common USB serial patterns that micro:bit uses
+    return 'usb' in device and 'modem' in device
+
+
+def candidate_ports(all_usb: bool = False) -> list[str]:
+    """
+    Serial ports worth probing, likely micro:bits first.
+
+    Args:
+        all_usb: Also probe USB serial ports that don't look like a
+            micro:bit (writing IDENTIFY: to whatever is on them)
+
+    Returns:
+        Serial port paths
+    """
+    ports = [
+        port for port in serial.tools.list_ports.comports()
+        if is_likely_microbit(port) or (all_usb and port.vid is not None)
+    ]
+    ports.sort(key=lambda port: not is_likely_microbit(port))
+    return [port.device for port in ports]
+
+
+async def identify(port: str, timeout: float = IDENTIFY_TIMEOUT) -> Optional[dict]:
+    """
+    Ask whatever is on a serial port to identify itself as a micro:bit.
+
+    Args:
+        port: Serial port path
+        timeout: Seconds to wait for the port to open and for the reply
+
+    Returns:
+        Dictionary with port, board_id, version, capabilities and
+        response_ms, or None if no micro:bit answered
+    """
+    try:
+        reader, writer = await asyncio.wait_for(
+            serial_asyncio.open_serial_connection(url=port, baudrate=BAUD_RATE),
+            timeout=timeout
+        )
+    except Exception:
+        return None
+
+    try:
+        start = time.perf_counter()
+        # The leading newline ends any partial line left in the board's buffer
+        writer.write(f"\n{format_identify_command()}\n".encode())
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=start + timeout - time.perf_counter())
+            if not line:
+                return None
+            # A board still running a session may interleave events and frames
+            text = line.decode("utf-8", "ignore")
+            index = text.find(_IDENTIFY_REPLY)
+            if index < 0:
+                continue
+            _, status = parse_response(text[index:].strip())
+            board_id, version, capabilities = status["message"][len("identify:"):].split(":", 2)
+            return {
+                "port": port,
+                "board_id": board_id,
+                "version": version,
+                "capabilities": capabilities.split(",") if capabilities else [],
+                "response_ms": round((time.perf_counter() - start) * 1000, 3)
+            }
+    except (asyncio.TimeoutError, OSError, ValueError):
+        return None
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            # The port may already be gone
+            pass
+
+
+async def probe(ports: list[str], timeout: float = IDENTIFY_TIMEOUT) -> list[dict]:
+    """
+    Identify the boards on several ports concurrently.
+
+    Args:
+        ports: Serial port paths
+        timeout: Seconds each port has to answer
+
+    Returns:
+        Identity of every board that answered (see identify), fastest first
+    """
+    results = await asyncio.gather(*(identify(port, timeout) for port in ports))
+    return sorted(filter(None, results), key=lambda board: board["response_ms"])
+
+
+def load_cache(path: str) -> dict:
+    """Read the board cache, or an empty one if it is missing or unreadable."""
+    try:
+        with open(path) as file:
+            cache = json.load(file)
+        if isinstance(cache.get("boards"), dict):
+            return cache
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {"last": None, "boards": {}}
+
+
+def save_cache(path: str, cache: dict) -> None:
+    """Write the board cache, replacing the file atomically."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(cache, file, indent=2)
+        os.replace(temporary, path)
+    except OSError as e:
+        print(f"Failed to write board cache {path}: {e}", file=sys.stderr)
+
+
+async def discover(cache_path: Optional[str] = None, timeout: float = IDENTIFY_TIMEOUT, all_usb: bool = False) -> str:
+    """
+    Find the serial port of a micro:bit.
+
+    The board used last is tried first, on its cached port. Otherwise every
+    candidate port (and every cached one) is probed concurrently and the
+    fastest board to answer is used, falling back to the first port that
+    looks like a micro:bit when none answers (firmware without IDENTIFY:).
+
+    Args:
+        cache_path: Board cache file, default_cache_path() if None
+        timeout: Seconds each port has to answer
+        all_usb: Probe every USB serial port, not only those that look
+            like a micro:bit (see candidate_ports)
+
+    Returns:
+        Serial port path
+
+    Raises:
+        Exception: If no micro:bit was found
+    """
+    cache_path = cache_path or default_cache_path()
+    cache = load_cache(cache_path)
+    last = cache["boards"].get(cache.get("last"))
+
+    boards = []
+    if last:
+        board = await identify(last["port"], timeout)
+        if board and board["board_id"] == cache["last"]:
+            boards = [board]
+    if not boards:
+        ports = candidate_ports(all_usb)
+        ports += [entry["port"] for entry in cache["boards"].values() if entry["port"] not in ports]
+        boards = await probe(ports, timeout)
+
+    if not boards:
+        likely = [port.device for port in serial.tools.list_ports.comports() if is_likely_microbit(port)]
+        if not likely:
+            raise Exception("No micro:bit found on any serial port")
+        print(f"No board answered IDENTIFY:, trying {likely[0]}", file=sys.stderr)
+        return likely[0]
+
+    now = time.time()
+    for board in boards:
+        cache["boards"][board["board_id"]] = {
+            "port": board["port"],
+            "version": board["version"],
+            "capabilities": board["capabilities"],
+            "seen": now
+        }
+    fastest = boards[0]
+    cache["last"] = fastest["board_id"]
+    save_cache(cache_path, cache)
+
+    others = ", ".join(f"{board['board_id']} on {board['port']}" for board in boards[1:])
+    print(
+        f"Found micro:bit {fastest['board_id']} (firmware {fastest['version']}) on {fastest['port']}"
+        f" in {fastest['response_ms']} ms" + (f"; also answering: {others}" if others else ""),
+        file=sys.stderr
+    )
+    return fastest["port"]
@@ -0,0 +1,131 @@
+"""
+Host-side bus for events pushed by the micro:bit.
+
+The firmware reports every button press and release as it happens, not
+only while a tool is waiting. This module keeps the most recent events in
+a bounded history, numbered by a cursor that only ever increases, and
+hands each new event to any number of subscriber queues. Tools answer
+"was a button pressed since ..." from the history and wait on a
+subscription only when nothing matching has happened yet.
+"""
+
+import asyncio
+import collections
+import time
+from typing import Callable, Optional
+
+
+class EventBus:
+    """Bounded, cursor-addressed event history with publish/subscribe."""
+
+    def __init__(self, capacity: int = 1000):
+        """
+        Initialize an empty bus.
+
+        Args:
+            capacity: Maximum number of events kept; the oldest are dropped
+        """
+        self.capacity = capacity
+        self._events: collections.deque[dict] = collections.deque(maxlen=capacity)
+        self._subscribers: list[asyncio.Queue] = []
+        self.cursor = 0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def publish(self, event: dict) -> dict:
+        """
+        Add an event to the history and deliver it to every subscriber.
+
+        Subscribers whose queue is full lose their oldest undelivered event.
+
+        Args:
+            event: Event data; an "id" (the new cursor) is added, and a
+                "host_time" of now unless the event has one
+
+        Returns:
+            The stored event
+        """
+        self.cursor += 1
+        event = {"id": self.cursor, "host_time": time.time(), **event}
+        self._events.append(event)
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+        return event
+
+    def subscribe(self, maxsize: int = 100) -> asyncio.Queue:
+        """
+        Get a queue receiving every event published from now on.
+
+        Args:
+            maxsize: Events kept for a slow subscriber before the oldest are dropped
+
+        Returns:
+            Queue of events; pass it to unsubscribe when done
+        """
+        queue = asyncio.Queue(maxsize=maxsize)
+        self._subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        """Stop delivering events to a queue returned by subscribe."""
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def since(self, cursor: int = 0, predicate: Optional[Callable[[dict], bool]] = None) -> list[dict]:
+        """
+        Get the buffered events after a cursor.
+
+        Args:
+            cursor: ID of the last event already seen (0 for everything buffered)
+            predicate: Optional filter
+
+        Returns:
+            Matching events, oldest first
+        """
+        return [
+            event for event in self._events
+            if event["id"] > cursor and (predicate is None or predicate(event))
+        ]
+
+    def truncated(self, cursor: int) -> bool:
+        """Whether events after the cursor have already been dropped from the history."""
+        oldest = self._events[0]["id"] if self._events else self.cursor + 1
+        return cursor + 1 < oldest
+
+    async def wait_for(
+        self,
+        predicate: Callable[[dict], bool],
+        cursor: int = 0,
+        timeout: Optional[float] = None
+    ) -> dict:
+        """
+        Get the first event after a cursor that matches, waiting for one if needed.
+
+        Args:
+            predicate: Filter the event must match
+            cursor: ID of the last event already seen
+            timeout: Maximum time to wait in seconds, or None to wait forever
+
+        Returns:
+            The matching event
+
+        Raises:
+            asyncio.TimeoutError: If no matching event arrives in time
+        """
+        buffered = self.since(cursor, predicate)
+        if buffered:
+            return buffered[0]
+
+        queue = self.subscribe()
+        try:
+            async def next_match() -> dict:
+                while True:
+                    event = await queue.get()
+                    if predicate(event):
+                        return event
+            return await asyncio.wait_for(next_match(), timeout=timeout)
+        finally:
+            self.unsubscribe(queue)
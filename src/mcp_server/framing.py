@@ -0,0 +1,427 @@
+"""
+Compact binary framing for micro:bit serial communication.
+
+Binary frames are an alternative encoding of the text protocol in
+protocol.py for the payloads where it matters most (images, animations,
+music and melodies, button waits, sensor readings). Both ends accept text
+lines and binary frames at any time, so every command without a binary
+encoding simply stays a text line. The micro:bit only sends binary replies after the host has asked for
+them with PROTO:bin.
+
+Frame format:
+
+    0xFE <length> <type> <seq lo> <seq hi> <payload...>
+
+length counts the type, sequence and payload bytes; a sequence number of
+0 means the command carried no #seq# envelope. Frames are decoded back
+into the equivalent text line, so everything above the transport works
+with text only.
+"""
+
+import re
+import struct
+from typing import Callable, Optional
+
+from .protocol import (
+    NOTE_PATTERN,
+    Commands,
+    Responses,
+    format_sequenced_command,
+    parse_response,
+    split_sequence
+)
+
+FRAME_START = 0xFE
+
+# Largest length byte value: type, sequence and payload together
+MAX_FRAME_LENGTH = 255
+
+# Notes one MELODY: frame carries: two bytes each after the type, sequence
+# number and 4-byte melody ID
+MAX_MELODY_NOTES = (MAX_FRAME_LENGTH - 3 - 4) // 2
+
+
+class FrameTypes:
+    # Host to micro:bit
+    IMAGE = 0x01
+    TEMP = 0x02
+    WAIT_BUTTON = 0x03
+    MUSIC = 0x04
+    STREAM = 0x05
+    ANIMATION = 0x06
+    ANIMATION_FRAMES = 0x07
+    MELODY = 0x08
+    PLAY_ID = 0x09
+    # micro:bit to host
+    TEMP_REPLY = 0x81
+    BUTTON_REPLY = 0x82
+    BUTTON_TIMEOUT_REPLY = 0x83
+    SAMPLE_REPLY = 0x84
+
+
+BUTTON_CODES = {"any": 0, "a": 1, "b": 2}
+ACTION_CODES = {"pressed": 1, "released": 2}
+SENSOR_CODES = {"temp": 1}
+NOTE_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B", "R")
+
+# Octave nibble and duration byte used when a note leaves them unspecified
+NO_OCTAVE = 0x0F
+NO_DURATION = 0
+
+_IMAGE_PATTERN = re.compile(r"^\d{5}(:\d{5}){4}$")
+_FRAMES_PATTERN = re.compile(r"^\d{25}(,\d{25})*$")
+_MELODY_ID_PATTERN = re.compile(r"^[0-9a-f]{8}$")
+
+
+def _frame(frame_type: int, seq: int, payload: bytes) -> Optional[bytes]:
+    if 3 + len(payload) > MAX_FRAME_LENGTH:
+        return None
+    return bytes([FRAME_START, 3 + len(payload), frame_type]) + struct.pack("<H", seq) + payload
+
+
+def _lookup(codes: dict, code: int) -> str:
+    for name, value in codes.items():
+        if value == code:
+            return name
+    raise ValueError(f"Unknown code in frame: {code}")
+
+
+def _pack_image(image: str) -> Optional[bytes]:
+    """Pack 25 brightness digits two per byte (high nibble first)."""
+    if not _IMAGE_PATTERN.match(image):
+        return None
+    return _pack_digits(image.replace(":", ""))
+
+
+def _pack_digits(digits: str) -> bytes:
+    values = [int(d) for d in digits] + [0]
+    return bytes((values[i] << 4) | values[i + 1] for i in range(0, 26, 2))
+
+
+def _unpack_digits(payload: bytes) -> str:
+    return "".join(f"{b >> 4}{b & 0x0F}" for b in payload)[:25]
+
+
+def _unpack_image(payload: bytes) -> str:
+    digits = _unpack_digits(payload)
+    return ":".join(digits[i:i + 5] for i in range(0, 25, 5))
+
+
+def _pack_frames(frames: str) -> Optional[bytes]:
+    """Pack comma separated 25-digit animation frames into 13 bytes each."""
+    if not _FRAMES_PATTERN.match(frames):
+        return None
+    return b"".join(_pack_digits(frame) for frame in frames.split(","))
+
+
+def _unpack_frames(payload: bytes) -> str:
+    if len(payload) % 13:
+        raise ValueError(f"Truncated animation frames: {payload!r}")
+    return ",".join(_unpack_digits(payload[i:i + 13]) for i in range(0, len(payload), 13))
+
+
+def _pack_notes(notes: list[str]) -> Optional[bytes]:
+    """Pack each note into a pitch/octave byte and a duration byte."""
+    packed = bytearray()
+    for note in notes:
+        match = NOTE_PATTERN.match(note.strip())
+        if not match:
+            return None
+        letter, accidental, octave, duration = match.groups()
+        pitch = NOTE_NAMES.index(letter.upper())
+        if accidental == "#":
+            pitch += 1
+        elif accidental == "b":
+            pitch -= 1
+        if pitch < 0 or (letter.upper() != "R" and pitch > 11) or (letter.upper() == "R" and accidental):
+            return None
+        duration = int(duration) if duration else NO_DURATION
+        if duration > 255:
+            return None
+        packed += bytes([(int(octave) if octave else NO_OCTAVE) << 4 | pitch, duration])
+    return bytes(packed)
+
+
+def _unpack_notes(payload: bytes) -> str:
+    notes = []
+    for i in range(0, len(payload) - 1, 2):
+        note = NOTE_NAMES[payload[i] & 0x0F]
+        if payload[i] >> 4 != NO_OCTAVE:
+            note += str(payload[i] >> 4)
+        if payload[i + 1] != NO_DURATION:
+            note += ":" + str(payload[i + 1])
+        notes.append(note)
+    return ",".join(notes)
+
+
+def encode_command(command: str) -> Optional[bytes]:
+    """
+    Encode a command as a binary frame.
+
+    Args:
+        command: Command string, with or without a #seq# envelope
+
+    Returns:
+        The frame, or None if the command has no binary encoding and
+        should be sent as a text line
+    """
+    seq, command = split_sequence(command)
+    seq = seq or 0
+    if seq > 0xFFFF:
+        return None
+
+    if command.startswith(Commands.IMAGE):
+        payload = _pack_image(command[len(Commands.IMAGE):])
+        return None if payload is None else _frame(FrameTypes.IMAGE, seq, payload)
+
+    if command == Commands.TEMP:
+        return _frame(FrameTypes.TEMP, seq, b"")
+
+    if command.startswith(Commands.WAIT_BUTTON):
+        parts = command.split(":")
+        if len(parts) != 3 or parts[1] not in BUTTON_CODES:
+            return None
+        try:
+            timeout_ms = round(float(parts[2]) * 1000)
+        except ValueError:
+            return None
+        if not 0 <= timeout_ms <= 0xFFFFFFFF:
+            return None
+        return _frame(FrameTypes.WAIT_BUTTON, seq, struct.pack("<BI", BUTTON_CODES[parts[1]], timeout_ms))
+
+    if command.startswith(Commands.MUSIC):
+        notes_str = command[len(Commands.MUSIC):]
+        payload = _pack_notes(notes_str.split(",")) if notes_str else None
+        return None if payload is None else _frame(FrameTypes.MUSIC, seq, payload)
+
+    if command.startswith(Commands.STREAM):
+        parts = command.split(":")
+        if len(parts) != 3 or parts[1] not in SENSOR_CODES or not parts[2].isdigit():
+            return None
+        if int(parts[2]) > 0xFFFF:
+            return None
+        return _frame(FrameTypes.STREAM, seq, struct.pack("<BH", SENSOR_CODES[parts[1]], int(parts[2])))
+
+    if command.startswith(Commands.MELODY):
+        melody, _, notes_str = command[len(Commands.MELODY):].partition(":")
+        payload = _pack_notes(notes_str.split(",")) if notes_str else None
+        if payload is None or not _MELODY_ID_PATTERN.match(melody):
+            return None
+        return _frame(FrameTypes.MELODY, seq, bytes.fromhex(melody) + payload)
+
+    if command.startswith(Commands.PLAY_ID):
+        melody = command[len(Commands.PLAY_ID):]
+        if not _MELODY_ID_PATTERN.match(melody):
+            return None
+        return _frame(FrameTypes.PLAY_ID, seq, bytes.fromhex(melody))
+
+    if command.startswith(Commands.ANIMATION):
+        parts = command.split(":", 4)
+        if len(parts) != 5 or not all(part.isdigit() for part in parts[1:4]):
+            return None
+        if int(parts[1]) > 0xFFFF or int(parts[2]) > 0xFF or int(parts[3]) > 0xFF:
+            return None
+        frames = _pack_frames(parts[4])
+        if frames is None:
+            return None
+        return _frame(
+            FrameTypes.ANIMATION, seq, struct.pack("<HBB", int(parts[1]), int(parts[2]), int(parts[3])) + frames
+        )
+
+    if command.startswith(Commands.ANIMATION_FRAMES):
+        parts = command.split(":", 2)
+        if len(parts) != 3 or not parts[1].isdigit() or int(parts[1]) > 0xFF:
+            return None
+        frames = _pack_frames(parts[2])
+        if frames is None:
+            return None
+        return _frame(FrameTypes.ANIMATION_FRAMES, seq, bytes([int(parts[1])]) + frames)
+
+    return None
+
+
+def decode_command(frame: bytes) -> str:
+    """
+    Decode a command frame (without start and length bytes) into its text form.
+
+    Raises:
+        ValueError: If the frame is malformed or of an unknown type
+    """
+    if len(frame) < 3:
+        raise ValueError(f"Truncated frame: {frame!r}")
+    frame_type = frame[0]
+    seq, = struct.unpack_from("<H", frame, 1)
+    payload = frame[3:]
+
+    try:
+        if frame_type == FrameTypes.IMAGE and len(payload) == 13:
+            command = Commands.IMAGE + _unpack_image(payload)
+        elif frame_type == FrameTypes.TEMP:
+            command = Commands.TEMP
+        elif frame_type == FrameTypes.WAIT_BUTTON:
+            button, timeout_ms = struct.unpack("<BI", payload)
+            command = f"{Commands.WAIT_BUTTON}{_lookup(BUTTON_CODES, button)}:{timeout_ms / 1000}"
+        elif frame_type == FrameTypes.MUSIC:
+            command = Commands.MUSIC + _unpack_notes(payload)
+        elif frame_type == FrameTypes.STREAM:
+            sensor, interval_ms = struct.unpack("<BH", payload)
+            command = f"{Commands.STREAM}{_lookup(SENSOR_CODES, sensor)}:{interval_ms}"
+        elif frame_type == FrameTypes.MELODY and len(payload) > 4:
+            command = f"{Commands.MELODY}{payload[:4].hex()}:{_unpack_notes(payload[4:])}"
+        elif frame_type == FrameTypes.PLAY_ID and len(payload) == 4:
+            command = f"{Commands.PLAY_ID}{payload.hex()}"
+        elif frame_type == FrameTypes.ANIMATION:
+            frame_delay_ms, loops, staged = struct.unpack_from("<HBB", payload)
+            command = f"{Commands.ANIMATION}{frame_delay_ms}:{loops}:{staged}:{_unpack_frames(payload[4:])}"
+        elif frame_type == FrameTypes.ANIMATION_FRAMES and payload:
+            command = f"{Commands.ANIMATION_FRAMES}{payload[0]}:{_unpack_frames(payload[1:])}"
+        else:
+            raise ValueError(f"Unknown command frame type: {frame_type:#x}")
+    except struct.error as e:
+        raise ValueError(f"Malformed frame: {frame!r}") from e
+
+    return format_sequenced_command(seq, command) if seq else command
+
+
+def encode_response(line: str) -> Optional[bytes]:
+    """
+    Encode a response line as a binary frame.
+
+    Args:
+        line: Response line, with or without a #seq# envelope
+
+    Returns:
+        The frame, or None if the response has no binary encoding (e.g.
+        STATUS) and should be sent as a text line
+    """
+    seq, line = split_sequence(line)
+    seq = seq or 0
+    try:
+        kind, data = parse_response(line)
+    except ValueError:
+        return None
+
+    try:
+        if kind == Responses.TEMP:
+            payload = struct.pack("<bI", data["temperature_celsius"], data["timestamp"])
+            return _frame(FrameTypes.TEMP_REPLY, seq, payload)
+        if kind == Responses.BUTTON:
+            payload = struct.pack(
+                "<BBI",
+                BUTTON_CODES[data["button"]],
+                ACTION_CODES[data["action"]],
+                data["timestamp"]
+            )
+            return _frame(FrameTypes.BUTTON_REPLY, seq, payload)
+        if kind == Responses.BUTTON_TIMEOUT:
+            payload = struct.pack(
+                "<BI",
+                BUTTON_CODES[data["waited_for"]],
+                round(data["timeout_duration"] * 1000)
+            )
+            return _frame(FrameTypes.BUTTON_TIMEOUT_REPLY, seq, payload)
+        if kind == Responses.SAMPLE:
+            payload = struct.pack(
+                "<BhI",
+                SENSOR_CODES[data["sensor"]],
+                round(data["value"]),
+                data["timestamp"]
+            )
+            return _frame(FrameTypes.SAMPLE_REPLY, seq, payload)
+    except (KeyError, struct.error):
+        return None
+    return None
+
+
+def decode_response(frame: bytes) -> str:
+    """
+    Decode a response frame (without start and length bytes) into its text form.
+
+    Raises:
+        ValueError: If the frame is malformed or of an unknown type
+    """
+    if len(frame) < 3:
+        raise ValueError(f"Truncated frame: {frame!r}")
+    frame_type = frame[0]
+    seq, = struct.unpack_from("<H", frame, 1)
+    payload = frame[3:]
+
+    try:
+        if frame_type == FrameTypes.TEMP_REPLY:
+            temperature, timestamp = struct.unpack("<bI", payload)
+            line = f"{Responses.TEMP}{temperature}|{timestamp}"
+        elif frame_type == FrameTypes.BUTTON_REPLY:
+            button, action, timestamp = struct.unpack("<BBI", payload)
+            line = f"{Responses.BUTTON}{_lookup(BUTTON_CODES, button)}|{_lookup(ACTION_CODES, action)}|{timestamp}"
+        elif frame_type == FrameTypes.BUTTON_TIMEOUT_REPLY:
+            button, timeout_ms = struct.unpack("<BI", payload)
+            line = f"{Responses.BUTTON_TIMEOUT}{_lookup(BUTTON_CODES, button)}|{timeout_ms / 1000}"
+        elif frame_type == FrameTypes.SAMPLE_REPLY:
+            sensor, value, timestamp = struct.unpack("<BhI", payload)
+            line = f"{Responses.SAMPLE}{_lookup(SENSOR_CODES, sensor)}|{value}|{timestamp}"
+        else:
+            raise ValueError(f"Unknown response frame type: {frame_type:#x}")
+    except struct.error as e:
+        raise ValueError(f"Malformed frame: {frame!r}") from e
+
+    return format_sequenced_command(seq, line) if seq else line
+
+
+class FrameParser:
+    """Incremental splitter for a byte stream of mixed text lines and binary frames."""
+
+    def __init__(self, decode: Callable[[bytes], str]):
+        """
+        Initialize the parser.
+
+        Args:
+            decode: decode_command or decode_response, depending on which
+                end of the link is parsing
+        """
+        self.decode = decode
+        self.errors = 0
+        self._buffer = bytearray()
+
+    @property
+    def buffered(self) -> int:
+        """Number of received bytes not yet part of a complete line or frame."""
+        return len(self._buffer)
+
+    def peek(self, count: int) -> bytes:
+        """The first bytes of the incomplete line or frame received so far."""
+        return bytes(self._buffer[:count])
+
+    def clear(self) -> None:
+        """Discard the incomplete line or frame received so far."""
+        self._buffer.clear()
+
+    def feed(self, data: bytes) -> list[str]:
+        """
+        Add received bytes and return every complete line, frames decoded to text.
+
+        Args:
+            data: Bytes read from the serial connection
+
+        Returns:
+            Complete lines, stripped, in the order received
+        """
+        self._buffer += data
+        lines = []
+        while self._buffer:
+            if self._buffer[0] == FRAME_START:
+                if len(self._buffer) < 2 or len(self._buffer) < 2 + self._buffer[1]:
+                    break
+                end = 2 + self._buffer[1]
+                frame = bytes(self._buffer[2:end])
+                del self._buffer[:end]
+                try:
+                    lines.append(self.decode(frame))
+                except ValueError:
+                    self.errors += 1
+            else:
+                end = self._buffer.find(b"\n")
+                if end < 0:
+                    break
+                lines.append(self._buffer[:end].decode("utf-8", "ignore").strip())
+                del self._buffer[:end + 1]
+        return lines
@@ -0,0 +1,111 @@
+"""
+Host-side mirror of the micro:bit's melody store.
+
+The firmware keeps recently played melodies in RAM under a short ID, so a
+tune it already holds can be replayed with a PLAY_ID: command instead of
+the whole note list. The store is bounded by a total number of notes and
+evicts the least recently used melodies first. This module applies the
+same policy to the acknowledged uploads and plays, so the host knows which
+IDs the board holds without asking.
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+from .framing import MAX_MELODY_NOTES
+from .protocol import MAX_LINE_BYTES, NOTE_PATTERN
+
+# Notes the firmware's melody store holds (MELODY_CACHE_NOTES in main.py):
+# as many as one MELODY: command can upload, so any melody stored fits it
+DEFAULT_CAPACITY_NOTES = MAX_MELODY_NOTES
+
+
+def melody_id(notes: list[str]) -> Optional[str]:
+    """
+    Get the ID a note list is stored under.
+
+    Args:
+        notes: Notes in micro:bit format (e.g. "C4:4")
+
+    Returns:
+        8 hex digits derived from the notes, or None if any note isn't in
+        a format the host can validate (such melodies are never cached)
+    """
+    normalized = [note.strip() for note in notes]
+    if not normalized or not all(NOTE_PATTERN.match(note) for note in normalized):
+        return None
+    return hashlib.sha1(",".join(normalized).encode()).hexdigest()[:8]
+
+
+class MelodyCache:
+    """Least recently used set of melody IDs, bounded by their total note count."""
+
+    def __init__(self, capacity_notes: int = DEFAULT_CAPACITY_NOTES):
+        """
+        Initialize an empty cache.
+
+        Args:
+            capacity_notes: Total notes the board can hold
+        """
+        self.capacity_notes = capacity_notes
+        self._melodies: OrderedDict[str, int] = OrderedDict()
+        self._notes = 0
+
+    def __contains__(self, melody: str) -> bool:
+        return melody in self._melodies
+
+    def __len__(self) -> int:
+        return len(self._melodies)
+
+    def fits(self, note_count: int, size: int = 0) -> bool:
+        """
+        Whether a melody can be stored at all.
+
+        Args:
+            note_count: Number of notes in the melody
+            size: Bytes its MELODY: command takes on the link, as a frame or
+                a line (0 to only check the note count); one longer than the
+                board's receive buffer would be discarded
+
+        Returns:
+            True if the board's store can hold it and one command can upload it
+        """
+        return 0 < note_count <= self.capacity_notes and size <= MAX_LINE_BYTES
+
+    def touch(self, melody: str) -> None:
+        """Mark a melody as just played."""
+        if melody in self._melodies:
+            self._melodies.move_to_end(melody)
+
+    def add(self, melody: str, note_count: int) -> None:
+        """
+        Record a melody stored by the board, evicting the least recently used.
+
+        Args:
+            melody: Melody ID
+            note_count: Number of notes in the melody
+        """
+        self.discard(melody)
+        while self._melodies and self._notes + note_count > self.capacity_notes:
+            _, evicted = self._melodies.popitem(last=False)
+            self._notes -= evicted
+        if self.fits(note_count):
+            self._melodies[melody] = note_count
+            self._notes += note_count
+
+    def discard(self, melody: str) -> None:
+        """Forget a melody, e.g. when the board no longer has it."""
+        self._notes -= self._melodies.pop(melody, 0)
+
+    def load(self, capacity_notes: int, melodies: list[tuple[str, int]]) -> None:
+        """
+        Replace the contents with what the board reports.
+
+        Args:
+            capacity_notes: Total notes the board can hold
+            melodies: (ID, note count) pairs, least recently used first
+        """
+        self.capacity_notes = capacity_notes
+        self._melodies = OrderedDict(melodies)
+        self._notes = sum(self._melodies.values())
@@ -0,0 +1,306 @@
+"""
+Metrics for the micro:bit MCP server.
+
+This module provides the latency histogram used for tool calls and device
+commands, renders the server's metrics snapshot in the Prometheus text
+exposition format, and serves or dumps that text for scraping.
+
+Histograms use HDR-style log-linear buckets: every value is kept to within
+1/16 of its size, so a histogram costs a few dozen counters whatever the
+number of calls, and percentiles stay accurate from microseconds to minutes.
+"""
+
+import asyncio
+import math
+import os
+import sys
+from typing import Callable, Optional
+
+# Sub-buckets per power of two (2 ** bits): the relative precision of a value
+_SUB_BUCKET_BITS = 4
+
+# Quantiles reported for every histogram
+QUANTILES = (0.5, 0.9, 0.99)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class LatencyHistogram:
+    """Log-linear histogram of durations with exact count, sum, min and max."""
+
+    def __init__(self):
+        """Initialize an empty histogram."""
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max = 0.0
+        # Bucket key -> count; keys sort in the order of the values they hold
+        self._buckets: dict[int, int] = {}
+
+    @staticmethod
+    def _bucket(micros: int) -> int:
+        """Key of the bucket holding a value in microseconds."""
+        shift = max(micros.bit_length() - _SUB_BUCKET_BITS - 1, 0)
+        return (shift << (_SUB_BUCKET_BITS + 1)) + (micros >> shift)
+
+    @staticmethod
+    def _upper_bound(bucket: int) -> int:
+        """Largest value in microseconds a bucket holds."""
+        shift = bucket >> (_SUB_BUCKET_BITS + 1)
+        mantissa = bucket & ((1 << (_SUB_BUCKET_BITS + 1)) - 1)
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        """
+        Add a duration.
+
+        Args:
+            seconds: Duration in seconds
+        """
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        bucket = self._bucket(max(int(seconds * 1e6), 0))
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Get a quantile of the recorded durations.
+
+        Args:
+            q: Quantile between 0 and 1 (e.g. 0.99)
+
+        Returns:
+            Duration in seconds, within the bucket precision, or None if empty
+        """
+        if not self.count:
+            return None
+        rank = max(math.ceil(q * self.count), 1)
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return min(max(self._upper_bound(bucket) / 1e6, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """
+        Summarize the histogram.
+
+        Returns:
+            Dictionary with count, sum_ms, mean_ms, p50_ms, p90_ms, p99_ms
+            and max_ms (only count when empty)
+        """
+        if not self.count:
+            return {"count": 0}
+        summary = {
+            "count": self.count,
+            "sum_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total / self.count * 1000, 3)
+        }
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}_ms"] = round(self.quantile(q) * 1000, 3)
+        summary["max_ms"] = round(self.max * 1000, 3)
+        return summary
+
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    """Format Prometheus labels."""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _summary_lines(name: str, summary: dict, **labels: str) -> list[str]:
+    """Prometheus summary samples (quantiles, sum, count) for a histogram summary."""
+    lines = []
+    if summary["count"]:
+        for q in QUANTILES:
+            value = round(summary[f"p{round(q * 100)}_ms"] / 1000, 6)
+            lines.append(f"{name}{_labels(**labels, quantile=str(q))} {value}")
+    lines.append(f"{name}_sum{_labels(**labels)} {round(summary.get('sum_ms', 0) / 1000, 6)}")
+    lines.append(f"{name}_count{_labels(**labels)} {summary['count']}")
+    return lines
+
+
+# Per-device counters and gauges: snapshot key, metric name, type, help
+_DEVICE_METRICS = (
+    ("connected", "microbit_connected", "gauge", "Whether the serial link is up"),
+    ("lines_received", "microbit_lines_received_total", "counter", "Lines and frames received"),
+    ("frame_errors", "microbit_frame_errors_total", "counter", "Malformed binary frames skipped"),
+    ("unparsed_lines", "microbit_unparsed_lines_total", "counter", "Received lines that aren't part of the protocol"),
+    ("memory_errors", "microbit_memory_errors_total", "counter", "Times the board reported running out of memory"),
+    ("dropped_lines", "microbit_dropped_lines_total", "counter", "Unclaimed replies dropped from full queues"),
+    ("reconnects", "microbit_reconnects_total", "counter", "Reconnections after the link dropped"),
+    ("dropped_commands", "microbit_dropped_commands_total", "counter", "Commands dropped from the full outbox"),
+    ("request_timeouts", "microbit_request_timeouts_total", "counter", "Requests that got no reply in time"),
+    ("cancels_sent", "microbit_cancels_sent_total", "counter", "CANCEL: commands sent for abandoned requests"),
+    ("cancels_stopped", "microbit_cancels_stopped_total", "counter", "Abandoned requests the board stopped running"),
+    ("outstanding_requests", "microbit_outstanding_requests", "gauge", "Requests waiting for a reply"),
+    ("outbox_depth", "microbit_outbox_depth", "gauge", "Commands held while the link is down"),
+    ("backlog_bytes", "microbit_flow_backlog_bytes", "gauge", "Command bytes waiting for credit from the board"),
+    ("flow_stalls", "microbit_flow_stalls_total", "counter", "Waits for credit that timed out"),
+)
+
+
+def render_prometheus(snapshot: dict) -> str:
+    """
+    Render a metrics snapshot in the Prometheus text exposition format.
+
+    Args:
+        snapshot: Dictionary from MicrobitMCPServer.metrics()
+
+    Returns:
+        Exposition text, one sample per line
+    """
+    lines = [
+        "# HELP microbit_uptime_seconds Seconds since the server started",
+        "# TYPE microbit_uptime_seconds gauge",
+        f"microbit_uptime_seconds {snapshot['uptime_seconds']}",
+        "# HELP microbit_startup_seconds Seconds from importing the server to each startup milestone",
+        "# TYPE microbit_startup_seconds gauge"
+    ]
+    lines += [
+        f"microbit_startup_seconds{_labels(phase=phase)} {seconds}"
+        for phase, seconds in snapshot["startup_seconds"].items() if seconds is not None
+    ]
+
+    tools = snapshot["tools"]
+    for key, name, kind, description in (
+        ("calls", "microbit_tool_calls_total", "counter", "Tool calls handled"),
+        ("errors", "microbit_tool_errors_total", "counter", "Tool calls that raised an error"),
+        ("cancelled", "microbit_tool_cancelled_total", "counter", "Tool calls cancelled by the client"),
+        ("in_flight", "microbit_tool_calls_in_flight", "gauge", "Tool calls being handled"),
+    ):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{_labels(tool=tool)} {stats[key]}" for tool, stats in tools.items()]
+    lines += [
+        "# HELP microbit_tool_latency_seconds Tool call latency",
+        "# TYPE microbit_tool_latency_seconds summary"
+    ]
+    for tool, stats in tools.items():
+        lines += _summary_lines("microbit_tool_latency_seconds", stats["latency"], tool=tool)
+
+    devices = snapshot["devices"]
+    lines += [
+        "# HELP microbit_serial_bytes_total Bytes read from and written to the serial link",
+        "# TYPE microbit_serial_bytes_total counter"
+    ]
+    for device, stats in devices.items():
+        lines.append(f"microbit_serial_bytes_total{_labels(device=device, direction='in')} {stats['bytes_in']}")
+        lines.append(f"microbit_serial_bytes_total{_labels(device=device, direction='out')} {stats['bytes_out']}")
+    for key, name, kind, description in _DEVICE_METRICS:
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{_labels(device=device)} {int(stats[key])}" for device, stats in devices.items()]
+    lines += [
+        "# HELP microbit_response_queue_depth Unclaimed replies kept per response type",
+        "# TYPE microbit_response_queue_depth gauge"
+    ]
+    for device, stats in devices.items():
+        for kind, depth in stats["response_queue_depth"].items():
+            lines.append(f"microbit_response_queue_depth{_labels(device=device, kind=kind)} {depth}")
+    lines += [
+        "# HELP microbit_command_latency_seconds Time from writing a command to its reply",
+        "# TYPE microbit_command_latency_seconds summary"
+    ]
+    for device, stats in devices.items():
+        for command, summary in stats["commands"].items():
+            lines += _summary_lines("microbit_command_latency_seconds", summary, device=device, command=command)
+
+    lines += [
+        "# HELP microbit_command_queue_target_seconds Latency target for commands waiting for the link",
+        "# TYPE microbit_command_queue_target_seconds gauge"
+    ]
+    for device, stats in devices.items():
+        for priority, summary in stats["scheduler"]["classes"].items():
+            lines.append(
+                f"microbit_command_queue_target_seconds{_labels(device=device, priority=priority)} {summary['target_ms'] / 1000}"
+            )
+    for key, name, kind, description in (
+        ("queued", "microbit_commands_queued", "gauge", "Commands waiting for the link"),
+        ("over_target", "microbit_commands_over_target_total", "counter", "Commands that waited for the link longer than their target"),
+    ):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        for device, stats in devices.items():
+            for priority, summary in stats["scheduler"]["classes"].items():
+                lines.append(f"{name}{_labels(device=device, priority=priority)} {summary[key]}")
+    lines += [
+        "# HELP microbit_command_queue_seconds Time from scheduling a command to writing its last byte",
+        "# TYPE microbit_command_queue_seconds summary"
+    ]
+    for device, stats in devices.items():
+        for priority, summary in stats["scheduler"]["classes"].items():
+            lines += _summary_lines("microbit_command_queue_seconds", summary["queue_latency"], device=device, priority=priority)
+    lines += [
+        "# HELP microbit_commands_superseded_total Queued commands replaced by a newer one for the same resource",
+        "# TYPE microbit_commands_superseded_total counter"
+    ]
+    for device, stats in devices.items():
+        for resource, summary in stats["scheduler"]["resources"].items():
+            lines.append(f"microbit_commands_superseded_total{_labels(device=device, resource=resource)} {summary['superseded']}")
+
+    return "\n".join(lines) + "\n"
+
+
+async def serve_prometheus(render: Callable[[], str], host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Serve metrics over HTTP for Prometheus to scrape.
+
+    Args:
+        render: Called for the exposition text on every request
+        host: Address to listen on
+        port: TCP port to listen on
+
+    Returns:
+        The listening server; close it to stop serving
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await reader.readline()
+            # Skip the headers; the request has no body
+            while (await reader.readline()).strip():
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+                status, body, content_type = "200 OK", render().encode(), PROMETHEUS_CONTENT_TYPE
+            else:
+                status, body, content_type = "404 Not Found", b"Not found\n", "text/plain"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            print(f"Metrics request failed: {e}", file=sys.stderr)
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def dump_periodically(render: Callable[[], str], path: str, interval: float) -> None:
+    """
+    Write metrics to a file every interval, until cancelled.
+
+    The file is replaced atomically, as Prometheus' node exporter textfile
+    collector expects.
+
+    Args:
+        render: Called for the file contents on every write
+        path: File to write
+        interval: Seconds between writes
+    """
+    while True:
+        try:
+            temporary = f"{path}.tmp"
+            with open(temporary, "w") as file:
+                file.write(render())
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"Failed to write metrics to {path}: {e}", file=sys.stderr)
+        await asyncio.sleep(interval)
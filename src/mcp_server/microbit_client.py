@@ -3,203 +3,1879 @@ Micro:bit serial communication client.
 
 This module handles all serial communication with the micro:bit device,
 including connection management and protocol handling.
+
+A single background task owns the serial reader. It parses every incoming
+line once and hands it to the first registered waiter that wants it; lines
+nobody is waiting for are kept in a bounded queue per response type.
+
+Samples pushed by the micro:bit's streaming mode never reach the waiters;
+they are stored in a SampleRingBuffer per sensor. Button presses and
+releases the firmware reports on its own are published on an EventBus,
+as are the reports of micro-programs the board runs (see program.py).
+
+Commands sent with send_request carry a sequence number that the micro:bit
+echoes on its replies, so any number of them can be in flight at once and
+each reply resolves exactly the request that caused it.
+
+After connecting, the client asks the micro:bit for compact binary replies
+(see framing.py) and sends commands that have a binary encoding as frames;
+firmware that doesn't answer keeps using the text protocol.
+
+The connection is supervised: when the serial link hits EOF or a write
+fails, the client reconnects with exponential backoff, waits for the
+board's STATUS|ready and repeats the handshake (framing, running streams).
+Commands sent while the link is down are held in a bounded outbox and
+written, in order, once it is back.
+
+Once the firmware has advertised its receive window (FLOW:), commands
+are written only as far as the board's credits allow; the rest waits
+until CREDIT replies report the board has read what came before, so
+bursts can't overrun the board's small UART receive buffer. Waiting
+commands are released by a CommandScheduler (scheduler.py): by priority
+across device resources, in order within each.
+
+A sequenced request that is abandoned (cancelled, or timed out) before
+its command was written is withdrawn from the scheduler; once written,
+a command that left something running on the board (a button wait, a
+scroll or animation, music, a program) is followed by CANCEL: with its
+sequence number, so the board stops it instead of spending time on it
+and answering a request nobody waits for.
+
+Ping/echo exchanges on connect and at a regular interval keep a ClockSync
+estimate of the board's clock, so device timestamps can be reported as
+host time and each request's latency split into its way to the board and
+its way back.
 """
 
 import asyncio
+import collections
+import itertools
+import statistics
+import sys
+import time
 import serial_asyncio
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 
+from .clock_sync import ClockSync
+from .event_bus import EventBus
+from .framing import FrameParser, decode_response, encode_command
+from .melody_cache import MelodyCache, melody_id
+from .metrics import LatencyHistogram
+from .program import compile_program, format_program_command, parse_program_event
+from .recording import RecordingStream
+from .scheduler import SUPERSEDED, CommandScheduler, ScheduledCommand
 from .protocol import (
+    ANIMATION_CHUNK_FRAMES,
+    CANCELLABLE_COMMANDS,
+    MAX_ANIMATION_FRAMES,
+    MAX_LINE_BYTES,
+    Commands,
     Responses,
-    parse_temperature_response,
-    parse_button_response,
-    parse_button_timeout_response
+    format_animation_command,
+    format_animation_frames_command,
+    format_button_wait_command,
+    format_cancel_command,
+    format_events_command,
+    format_flow_command,
+    format_image_command,
+    format_melodies_command,
+    format_melody_command,
+    format_message_command,
+    format_music_command,
+    format_ping_command,
+    format_play_id_command,
+    format_protocol_command,
+    format_sequenced_command,
+    format_stream_command,
+    format_temperature_command,
+    music_seconds,
+    parse_response,
+    scroll_seconds,
+    split_sequence
 )
+from .sensor_buffer import SampleRingBuffer
+
+# Port used when none is configured: the usual macOS name of a micro:bit
+DEFAULT_PORT = "/dev/cu.usbmodem2114202"
+
+BAUD_RATE = 115200
+# Time one byte takes on the wire: start bit, 8 data bits and stop bit
+BYTE_SECONDS = 10 / BAUD_RATE
+
+# Seconds without a credit, while commands wait for one, after which the
+# credit is taken as lost and everything written as read by the board
+FLOW_STALL_TIMEOUT = 2.0
+
+
+def _is_press(event: dict) -> bool:
+    """Whether an event from the event bus is a button press."""
+    return event["type"] == "button" and event["action"] == "pressed"
+
+
+class _ResponseWaiter:
+    """A pending interest in the next matching response from the micro:bit."""
+
+    def __init__(self, kinds: tuple, predicate: Optional[Callable[[str, dict], bool]]):
+        self.kinds = kinds
+        self.predicate = predicate
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Command name and host monotonic time it was written, for sequenced
+        # requests sent while connected
+        self.command: Optional[str] = None
+        self.sent: Optional[float] = None
+
+    def matches(self, kind: str, data: dict) -> bool:
+        if kind not in self.kinds or self.future.done():
+            return False
+        return self.predicate is None or self.predicate(kind, data)
 
 
 class MicrobitClient:
     """Client for communicating with micro:bit over serial connection."""
-    
-    def __init__(self, serial_port: str = "/dev/tty.usbmodem2114202"):
+
+    def __init__(
+        self,
+        serial_port: str = DEFAULT_PORT,
+        queue_size: int = 100,
+        sequence_ids: bool = True,
+        stream_capacity: int = 3600,
+        temperature_ttl: float = 1.0,
+        binary_framing: bool = True,
+        auto_reconnect: bool = True,
+        reconnect_delay: float = 0.5,
+        max_reconnect_delay: float = 5.0,
+        ready_timeout: float = 2.0,
+        outbox_size: int = 100,
+        drop_policy: str = "oldest",
+        melody_cache: bool = True,
+        event_capacity: int = 1000,
+        clock_sync_interval: float = 30.0,
+        latency_history: int = 100,
+        recording: Optional[RecordingStream] = None,
+        open_connection: Optional[Callable] = None,
+        flow_control: bool = True,
+        locate: Optional[Callable[[], Awaitable[str]]] = None
+    ):
         """
         Initialize the micro:bit client.
-        
+
         Args:
             serial_port: Serial port path for micro:bit connection
+            queue_size: Maximum number of unclaimed responses kept per response type
+            sequence_ids: Tag requests with sequence numbers (requires firmware
+                support); when False, replies are matched by type only
+            stream_capacity: Number of streamed samples kept per sensor
+            temperature_ttl: Seconds a temperature reading is served from
+                memory before the device is asked again (0 to always ask)
+            binary_framing: Negotiate compact binary frames on connect,
+                falling back to text if the firmware doesn't support them
+            auto_reconnect: Reconnect in the background when the link drops
+            reconnect_delay: Seconds before the first reconnection attempt;
+                doubled after every failed attempt
+            max_reconnect_delay: Upper bound for the delay between attempts
+            ready_timeout: Seconds to wait for STATUS|ready after reconnecting
+                (a link blip without a board reset never sends one)
+            outbox_size: Maximum number of commands held while disconnected
+            drop_policy: What to do with a command when the outbox is full:
+                "oldest" drops the oldest held command, "newest" rejects the
+                new one
+            melody_cache: Keep played melodies on the board and replay them
+                by ID instead of resending their notes
+            event_capacity: Number of button events kept in the event history
+            clock_sync_interval: Seconds between clock measurements after the
+                one made on connect (0 to only measure on connect)
+            latency_history: Number of request latencies kept per command
+            recording: Stream of a Recorder that logs the serial traffic
+            open_connection: Replacement for serial_asyncio.open_serial_connection,
+                e.g. a Replay connector
+            flow_control: Negotiate credit-based flow control on connect,
+                writing without limit if the firmware doesn't support it
+            locate: Coroutine function finding the serial port (e.g.
+                discovery.discover), called before connecting in place of
+                a fixed serial_port
+
+        Raises:
+            ValueError: If the drop policy is unknown
         """
+        if drop_policy not in ("oldest", "newest"):
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
         self.serial_port = serial_port
+        self.locate = locate
+        self.queue_size = queue_size
+        self.sequence_ids = sequence_ids
+        self.stream_capacity = stream_capacity
+        self.streams: dict[str, SampleRingBuffer] = {}
+        self.temperature_ttl = temperature_ttl
+        self.binary_framing = binary_framing
+        self.binary = False
+        self._temperature_cache: Optional[tuple[float, dict]] = None
+        self._temperature_request: Optional[asyncio.Future] = None
         self.reader: Optional[asyncio.StreamReader] = None
         self.writer: Optional[asyncio.StreamWriter] = None
-    
+        self._reader_task: Optional[asyncio.Task] = None
+        self._waiters: list[_ResponseWaiter] = []
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._pending: dict[int, _ResponseWaiter] = {}
+        # Sequence numbers fit the 16-bit field of binary frames; 0 means none
+        self._sequence = itertools.cycle(range(1, 0x10000))
+
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.ready_timeout = ready_timeout
+        self.outbox_size = outbox_size
+        self.drop_policy = drop_policy
+        self.reconnects = 0
+        self.dropped_commands = 0
+        # Commands waiting for the link: (line, future of the request or None)
+        self._outbox: collections.deque[tuple[str, Optional[asyncio.Future]]] = collections.deque()
+        self._supervisor_task: Optional[asyncio.Task] = None
+        self._connect_task: Optional[asyncio.Task] = None
+        self._handshake_task: Optional[asyncio.Task] = None
+        # Streams to restart after the board resets: sensor -> interval_ms
+        self._active_streams: dict[str, int] = {}
+        # Mirror of the board's melody store, reloaded on every handshake
+        self.melodies: Optional[MelodyCache] = MelodyCache() if melody_cache else None
+        # Button presses and releases, and whether the firmware reports them
+        # unprompted (otherwise button waits fall back to WAIT_BUTTON:)
+        self.events = EventBus(event_capacity)
+        self.button_events = False
+        # Presses returned by wait_for_button_press: every press up to the
+        # cursor (where the first wait started, None until then) was either
+        # returned or made before it, and the IDs of those returned after it
+        self._button_cursor: Optional[int] = None
+        self._returned_presses: set[int] = set()
+
+        # Estimate of the board's clock, and recent request latencies per command
+        self.clock = ClockSync()
+        self.clock_sync_interval = clock_sync_interval
+        self.latency_history = latency_history
+        self.latencies: dict[str, collections.deque[dict]] = {}
+        self._clock_task: Optional[asyncio.Task] = None
+        # Host monotonic time the last chunk of serial data arrived
+        self._received_at = 0.0
+
+        # Counters since the client was created, and reply latency per command
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lines_received = 0
+        self.frame_errors = 0
+        self.unparsed_lines = 0
+        self.memory_errors = 0
+        self.dropped_lines = 0
+        self.request_timeouts = 0
+        self.cancels_sent = 0
+        self.cancels_stopped = 0
+        self.command_latency: dict[str, LatencyHistogram] = {}
+
+        self.recording = recording
+        self.open_connection = open_connection or serial_asyncio.open_serial_connection
+
+        # Flow control: the board's receive window (None while off), the
+        # bytes_out value at the end of each FLOW: line not yet answered (by
+        # sequence number) and of the last one answered, the bytes the board
+        # has reported reading since then (modulo 65536), the commands
+        # waiting for credit and the one partly written
+        self.flow_control = flow_control
+        self.flow_window: Optional[int] = None
+        self._flow_marks: dict[Optional[int], int] = {}
+        self._flow_mark = 0
+        self._flow_consumed = 0
+        self.scheduler = CommandScheduler()
+        self._current: Optional[ScheduledCommand] = None
+        self._written = asyncio.Event()
+        self.flow_stalls = 0
+
+        # Last scheduled command of each sequenced request still pending, and
+        # CANCEL: requests for abandoned ones, still waiting for the board
+        self._scheduled: dict[int, ScheduledCommand] = {}
+        self._cancel_tasks: set[asyncio.Task] = set()
+
+    async def _open_connection(self) -> None:
+        """Open the serial port and start the reader task."""
+        self.reader, self.writer = await self.open_connection(
+            url=self.serial_port,
+            baudrate=BAUD_RATE
+        )
+        if self.recording:
+            self.recording.opened()
+        # A freshly opened link may face a freshly reset board
+        self.binary = False
+        self._reset_flow()
+        self._reader_task = asyncio.create_task(self._read_loop())
+
     async def setup_serial_connection(self) -> None:
         """
         Establish serial connection to the micro:bit.
-        
+
         Raises:
             Exception: If connection fails
         """
         try:
-            self.reader, self.writer = await serial_asyncio.open_serial_connection(
-                url=self.serial_port, 
-                baudrate=115200
+            if self.locate:
+                self.serial_port = await self.locate()
+            await self._open_connection()
+            # stdout carries the MCP stdio transport, so report on stderr
+            print(f"Connected to micro:bit on {self.serial_port}", file=sys.stderr)
+        except Exception as e:
+            print(f"Failed to connect to micro:bit: {e}", file=sys.stderr)
+            raise
+
+        await self._start_handshake()
+
+        if self.auto_reconnect:
+            self._supervisor_task = asyncio.create_task(self._supervise())
+        if self.clock_sync_interval > 0:
+            self._clock_task = asyncio.create_task(self._clock_loop())
+
+    async def connect(self) -> None:
+        """
+        Connect unless the client is connected (or reconnecting) already.
+
+        Concurrent callers share one attempt, and a failed attempt is made
+        again by the next call, so tools can connect a board on first use.
+
+        Raises:
+            Exception: If connection fails
+        """
+        if self._connect_task is None or (self._connect_task.done() and not self._accepting_commands()):
+            self._connect_task = asyncio.create_task(self.setup_serial_connection())
+        # A cancelled caller leaves the attempt running for the others
+        await asyncio.shield(self._connect_task)
+
+    def _start_handshake(self) -> asyncio.Task:
+        """Start a handshake unless one is already running, and return it."""
+        if self._handshake_task is None or self._handshake_task.done():
+            self._handshake_task = asyncio.create_task(self._handshake())
+        return self._handshake_task
+
+    async def _handshake(self) -> None:
+        """Bring the board back to the state the host expects: events, framing, melodies and streams."""
+        self.binary = False
+        # Independent requests, pipelined so old firmware costs one timeout;
+        # the clock's first ping queues behind the others, but later ones
+        # go out alone and the shortest round trips win
+        steps = [self.enable_button_events(), self.sync_clock(8)]
+        if self.flow_control:
+            steps.insert(0, self.negotiate_flow_control())
+        if self.binary_framing:
+            steps.append(self.negotiate_framing())
+        if self.melodies is not None:
+            steps.append(self.sync_melodies())
+        await asyncio.gather(*steps)
+
+        for sensor, interval_ms in list(self._active_streams.items()):
+            try:
+                await self.start_stream(sensor, interval_ms)
+            except Exception as e:
+                print(f"Failed to restart {sensor} stream: {e}", file=sys.stderr)
+
+    async def _supervise(self) -> None:
+        """Reconnect whenever the link drops, until the client is closed."""
+        while True:
+            await asyncio.wait({self._reader_task})
+            self._drop_link()
+            print(f"Lost connection to micro:bit on {self.serial_port}, reconnecting", file=sys.stderr)
+
+            delay = self.reconnect_delay
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    await self._open_connection()
+                    break
+                except Exception:
+                    delay = min(delay * 2, self.max_reconnect_delay)
+
+            self.reconnects += 1
+            print(f"Reconnected to micro:bit on {self.serial_port}", file=sys.stderr)
+            try:
+                await self._resume()
+            except Exception as e:
+                print(f"Handshake after reconnecting failed: {e}", file=sys.stderr)
+
+    async def _resume(self) -> None:
+        """Wait for the board to boot, send the held commands and handshake again."""
+        try:
+            await self.wait_for_response(
+                (Responses.STATUS,),
+                lambda kind, data: data["message"] == "ready",
+                timeout=self.ready_timeout
+            )
+        except asyncio.TimeoutError:
+            # The link blipped but the board kept running
+            pass
+
+        # Held commands come out in a burst, so let the board pace them
+        if self.flow_control:
+            await self.negotiate_flow_control()
+        await self._flush_outbox()
+        await self._start_handshake()
+
+    def _drop_link(self) -> None:
+        """Forget a broken serial link; the supervisor opens a new one."""
+        if self.writer:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+        self.writer = None
+        self.reader = None
+        self._reset_flow()
+        if self._reader_task and not self._reader_task.done():
+            self._reader_task.cancel()
+
+    def _accepting_commands(self) -> bool:
+        """Whether commands can be sent now or held until the link is back."""
+        if self._reader_task is not None and not self._reader_task.done():
+            return True
+        return self._supervisor_task is not None and not self._supervisor_task.done()
+
+    async def negotiate_framing(self) -> bool:
+        """
+        Ask the micro:bit to send binary replies.
+
+        Returns:
+            True if the firmware switched to binary replies, False if it
+            didn't answer (older firmware) and the text protocol stays in use
+        """
+        try:
+            _, status = await self.request(
+                format_protocol_command("bin"),
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith("proto:"),
+                timeout=1.0
+            )
+        except asyncio.TimeoutError:
+            self.binary = False
+            return False
+
+        self.binary = status["message"] == "proto:bin"
+        return self.binary
+
+    async def negotiate_flow_control(self) -> bool:
+        """
+        Ask the micro:bit for its receive window and credits.
+
+        The command goes straight to the link, ahead of any held commands,
+        so they can be paced by the credits.
+
+        Returns:
+            True if the firmware advertised a window, False if it didn't
+            answer (older firmware) and commands are written without limit
+        """
+        if self.writer is None:
+            return False
+        waiter = self._add_waiter(
+            (Responses.STATUS,),
+            lambda kind, data: data["message"].startswith("flow:")
+        )
+        line = format_flow_command()
+        if self.sequence_ids:
+            line = format_sequenced_command(next(self._sequence), line)
+        try:
+            self._write(line)
+            await asyncio.wait_for(waiter.future, timeout=1.0)
+        except asyncio.TimeoutError:
+            return False
+        return self.flow_window is not None
+
+    async def enable_button_events(self) -> bool:
+        """
+        Ask the micro:bit to report every button press and release.
+
+        Returns:
+            True if the firmware acknowledged, False if it didn't answer
+            (older firmware) and button waits use WAIT_BUTTON: commands
+        """
+        try:
+            await self.request(
+                format_events_command(True),
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith("events:"),
+                timeout=1.0
+            )
+        except asyncio.TimeoutError:
+            self.button_events = False
+            return False
+
+        self.button_events = True
+        return True
+
+    async def sync_melodies(self) -> None:
+        """
+        Reload the mirror of the board's melody store from the board.
+
+        Firmware without a melody store doesn't answer; melodies are then
+        always sent in full.
+        """
+        try:
+            _, status = await self.request(
+                format_melodies_command(),
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith("melodies:"),
+                timeout=1.0
             )
-            print(f"Connected to micro:bit on {self.serial_port}")
+        except asyncio.TimeoutError:
+            self.melodies.load(0, [])
+            return
+
+        # Format: melodies:capacity_notes:id/count,id/count,... (least recently used first)
+        capacity, _, entries = status["message"][len("melodies:"):].partition(":")
+        melodies = []
+        for entry in filter(None, entries.split(",")):
+            melody, _, count = entry.partition("/")
+            melodies.append((melody, int(count)))
+        self.melodies.load(int(capacity), melodies)
+
+    async def sync_clock(self, count: int = 4) -> dict:
+        """
+        Measure the micro:bit's clock against the host's with ping/echo exchanges.
+
+        Pings are sent one at a time so none waits behind another. Firmware
+        without PING: doesn't answer and the clock stays unsynchronized.
+
+        Args:
+            count: Number of exchanges
+
+        Returns:
+            Summary of the clock estimate (see ClockSync.describe)
+        """
+        for _ in range(count):
+            # A ping held while disconnected, or behind commands waiting for
+            # credit, would time the wait, not the link
+            if self.writer is None or self._outbox or self._backlog_bytes():
+                break
+            try:
+                await self.request(
+                    format_ping_command(),
+                    (Responses.STATUS,),
+                    lambda kind, data: data["message"] == "pong",
+                    timeout=1.0
+                )
+            except asyncio.TimeoutError:
+                break
+        return self.clock.describe()
+
+    async def _clock_loop(self) -> None:
+        """Measure the clock again every clock_sync_interval seconds to follow its drift."""
+        while True:
+            await asyncio.sleep(self.clock_sync_interval)
+            try:
+                await self.sync_clock()
+            except Exception as e:
+                print(f"Clock sync with micro:bit failed: {e}", file=sys.stderr)
+
+    def _host_time(self, timestamp: int) -> float:
+        """Host epoch time of a device timestamp, or now if the clock isn't synchronized."""
+        host_time = self.clock.to_host_time(timestamp)
+        return time.time() if host_time is None else host_time
+
+    def _record_timing(self, seq: int, request: _ResponseWaiter, kind: str, data: dict) -> None:
+        """Feed a reply to the clock estimate and record its request's latency breakdown."""
+        if request.sent is None:
+            return
+        received = self._received_at
+
+        if kind == Responses.STATUS and data["message"] == "pong":
+            # Lines spend at least their length on the wire, each way
+            reply = format_sequenced_command(seq, f"{Responses.STATUS}pong|{data['timestamp']}")
+            self.clock.add_sample(
+                request.sent,
+                received,
+                data["timestamp"],
+                (len(format_sequenced_command(seq, format_ping_command())) + 1) * BYTE_SECONDS,
+                (len(reply) + 1) * BYTE_SECONDS
+            )
+
+        if request.command not in self.command_latency:
+            self.command_latency[request.command] = LatencyHistogram()
+        self.command_latency[request.command].record(received - request.sent)
+
+        latency = {"total_ms": round((received - request.sent) * 1000, 3)}
+        stamped = self.clock.to_monotonic(data["timestamp"]) if "timestamp" in data else None
+        if stamped is not None:
+            latency["to_device_ms"] = round((stamped - request.sent) * 1000, 3)
+            latency["from_device_ms"] = round((received - stamped) * 1000, 3)
+        if request.command not in self.latencies:
+            self.latencies[request.command] = collections.deque(maxlen=self.latency_history)
+        self.latencies[request.command].append(latency)
+
+    def latency_stats(self) -> dict:
+        """
+        Summarize recent request latencies per command.
+
+        The device timestamp on a reply splits the request's round trip into
+        the time until the micro:bit stamped its reply (transit to the board
+        and processing) and the time the reply took back to the host. Only
+        sequenced requests written while connected are recorded, and the
+        split needs a synchronized clock.
+
+        Returns:
+            Dictionary per command (e.g. "TEMP") with the number of requests
+            and the median total_ms, to_device_ms and from_device_ms
+        """
+        stats = {}
+        for command, history in self.latencies.items():
+            summary = {"count": len(history)}
+            for part in ("total_ms", "to_device_ms", "from_device_ms"):
+                values = [latency[part] for latency in history if part in latency]
+                summary[part] = round(statistics.median(values), 3) if values else None
+            stats[command] = summary
+        return stats
+
+    async def _read_loop(self) -> None:
+        """Read lines and frames from the micro:bit until the connection closes."""
+        error = Exception("Serial connection closed")
+        parser = FrameParser(decode_response)
+        try:
+            while True:
+                data = await self.reader.read(4096)
+                if not data:
+                    break
+                self._received_at = time.monotonic()
+                self.bytes_in += len(data)
+                if self.recording:
+                    self.recording.received(data)
+                frame_errors = parser.errors
+                lines = parser.feed(data)
+                self.frame_errors += parser.errors - frame_errors
+                for line in lines:
+                    self._dispatch_line(line)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"Failed to connect to micro:bit: {e}")
+            error = e
+        finally:
+            if self.recording:
+                self.recording.closed()
+            # Requests still in the outbox get their reply on the next link
+            held = {id(future) for _, future in self._outbox}
+            for waiter in [*self._waiters, *self._pending.values()]:
+                if not waiter.future.done() and id(waiter.future) not in held:
+                    waiter.future.set_exception(error)
+
+    def _dispatch_line(self, line: str) -> None:
+        """
+        Route a single line received from the micro:bit.
+
+        Args:
+            line: Decoded and stripped line from the serial connection
+        """
+        if not line:
+            return
+
+        self.lines_received += 1
+        seq, line = split_sequence(line)
+        try:
+            kind, data = parse_response(line)
+        except ValueError:
+            # Not part of the protocol (e.g. MicroPython tracebacks)
+            self.unparsed_lines += 1
+            if line.startswith("MemoryError"):
+                self._out_of_memory(line)
+            return
+
+        if kind == Responses.SAMPLE:
+            self.get_stream(data["sensor"]).append(
+                data["value"], data["timestamp"], self._host_time(data["timestamp"])
+            )
+            return
+
+        # Credits pace the writes and are nobody's reply
+        if kind == Responses.CREDIT:
+            if self.flow_window is not None:
+                self._flow_consumed = data["consumed"]
+                self._pump()
+            return
+
+        # The board advertised its window, counting from the end of this FLOW:
+        if kind == Responses.STATUS and data["message"].startswith("flow:") and seq in self._flow_marks:
+            self._flow_mark = self._flow_marks.pop(seq)
+            self._flow_consumed = 0
+            self.flow_window = int(data["message"][len("flow:"):])
+            self._pump()
+
+        # Button events without a sequence number weren't asked for by a request
+        if kind == Responses.BUTTON and seq is None:
+            self.events.publish({"type": "button", **data, "host_time": self._host_time(data["timestamp"])})
+
+        # Reports from an on-device program are events; only the replies
+        # its PROG: request waits for go on to the request
+        if kind == Responses.STATUS and data["message"].startswith("prog_"):
+            data["seq"] = seq
+            self.events.publish({
+                "type": "program",
+                **parse_program_event(data["message"]),
+                "seq": seq,
+                "timestamp": data["timestamp"],
+                "host_time": self._host_time(data["timestamp"])
+            })
+            request = self._pending.get(seq)
+            if seq is not None and (request is None or not request.matches(kind, data)):
+                return
+
+        if kind == Responses.STATUS and data["message"] == "error:memory":
+            self._out_of_memory("a command didn't fit in the heap")
+
+        # The board (re)booted: its clock restarted, and it forgot the
+        # framing and streams we set up
+        if kind == Responses.STATUS and data["message"] == "ready":
+            self.clock.reset()
+            self.flow_window = None
+            self._pump()
+            self._start_handshake()
+
+        # Replies to a sequenced request go straight to that request
+        request = self._pending.get(seq)
+        if request is not None and request.matches(kind, data):
+            self._record_timing(seq, request, kind, data)
+            request.future.set_result((kind, data))
+            return
+
+        # A command the board couldn't run is answered with an error that
+        # carries its sequence number, instead of the reply it waits for
+        if request is not None and kind == Responses.STATUS and data["message"].startswith("error:"):
+            request.future.set_exception(Exception(f"micro:bit couldn't run the command: {data['message'][6:]}"))
+            return
+
+        for waiter in self._waiters:
+            if waiter.matches(kind, data):
+                waiter.future.set_result((kind, data))
+                return
+
+        queue = self.get_response_queue(kind)
+        if queue.full():
+            queue.get_nowait()
+            self.dropped_lines += 1
+        queue.put_nowait(data)
+
+    def get_response_queue(self, kind: str) -> asyncio.Queue:
+        """
+        Get the queue of unclaimed responses of one type.
+
+        Args:
+            kind: Response type, one of the Responses prefixes (e.g. Responses.STATUS)
+
+        Returns:
+            Queue of parsed responses nobody was waiting for, oldest first
+        """
+        if kind not in self._queues:
+            self._queues[kind] = asyncio.Queue(maxsize=self.queue_size)
+        return self._queues[kind]
+
+    def _add_waiter(self, kinds: tuple, predicate: Optional[Callable[[str, dict], bool]] = None) -> _ResponseWaiter:
+        """Register interest in a response before the command that triggers it is sent."""
+        if not self._accepting_commands():
+            raise Exception("Serial connection not established")
+
+        waiter = _ResponseWaiter(kinds, predicate)
+        self._waiters.append(waiter)
+        waiter.future.add_done_callback(lambda _: self._waiters.remove(waiter))
+        return waiter
+
+    async def wait_for_response(
+        self,
+        kinds: tuple,
+        predicate: Optional[Callable[[str, dict], bool]] = None,
+        timeout: Optional[float] = None
+    ) -> tuple[str, dict]:
+        """
+        Wait for the next response of the given types.
+
+        Args:
+            kinds: Response types to accept (Responses prefixes)
+            predicate: Optional filter called with the type and parsed data
+            timeout: Maximum time to wait in seconds, or None to wait forever
+
+        Returns:
+            Tuple of the response type and the parsed response data
+
+        Raises:
+            Exception: If no connection is established or it closes while waiting
+            asyncio.TimeoutError: If no matching response arrives in time
+        """
+        waiter = self._add_waiter(kinds, predicate)
+        return await asyncio.wait_for(waiter.future, timeout=timeout)
+
+    async def send_request(
+        self,
+        command: str,
+        kinds: tuple,
+        predicate: Optional[Callable[[str, dict], bool]] = None,
+        coalesce: bool = True
+    ) -> asyncio.Future:
+        """
+        Send a command and return a future for its reply without waiting for it.
+
+        Many requests can be in flight at once. With sequence IDs enabled the
+        command is tagged with a fresh sequence number and the future is
+        resolved by the reply carrying the same number; otherwise it is
+        resolved by the next reply of a matching type.
+
+        Args:
+            command: Command string to send
+            kinds: Response types that complete the request (Responses prefixes)
+            predicate: Optional filter called with the type and parsed data
+            coalesce: Let a newer command of the same kind replace this one
+                while it waits for the link (see scheduler.py); the future
+                then resolves to a STATUS "superseded" reply
+
+        Returns:
+            Future resolving to a tuple of the response type and parsed data;
+            cancel it (or let asyncio.wait_for time out) to abandon the request,
+            which also stops what the command started on the board (see
+            _abandoned). While the link is down the command is held in the
+            outbox and the future fails if the command is dropped from it
+
+        Raises:
+            Exception: If no connection is established
+        """
+        if self.sequence_ids:
+            if not self._accepting_commands():
+                raise Exception("Serial connection not established")
+            seq = next(self._sequence)
+            waiter = _ResponseWaiter(kinds, predicate)
+            waiter.command = command.partition(":")[0]
+            self._pending[seq] = waiter
+            waiter.future.add_done_callback(lambda _: self._pending.pop(seq, None))
+            waiter.future.add_done_callback(lambda future: self._abandoned(seq, command, future))
+            line = format_sequenced_command(seq, command)
+        else:
+            waiter = self._add_waiter(kinds, predicate)
+            line = command
+
+        try:
+            waiter.sent = time.monotonic()
+            if not await self._send_line(line, waiter.future, coalesce):
+                # Held in the outbox; timing it would measure the outage
+                waiter.sent = None
+        except BaseException:
+            waiter.future.cancel()
             raise
-    
+        return waiter.future
+
+    async def request(
+        self,
+        command: str,
+        kinds: tuple,
+        predicate: Optional[Callable[[str, dict], bool]] = None,
+        timeout: Optional[float] = None,
+        coalesce: bool = True
+    ) -> tuple[str, dict]:
+        """
+        Send a command and wait for its reply.
+
+        Args:
+            command: Command string to send
+            kinds: Response types that complete the request (Responses prefixes)
+            predicate: Optional filter called with the type and parsed data
+            timeout: Maximum time to wait in seconds, or None to wait forever
+            coalesce: Let a newer command of the same kind replace this one
+                while it waits for the link (see send_request)
+
+        Returns:
+            Tuple of the response type and the parsed response data
+
+        Raises:
+            Exception: If no connection is established
+            asyncio.TimeoutError: If no reply arrives in time
+        """
+        future = await self.send_request(command, kinds, predicate, coalesce)
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self.request_timeouts += 1
+            raise
+
+    def _abandoned(self, seq: int, command: str, future: asyncio.Future) -> None:
+        """
+        Free the board from a sequenced request that was cancelled.
+
+        A command still waiting for credit is withdrawn, and one already
+        written (or being written) that left something running on the
+        board is followed by CANCEL:. A command held in the outbox is
+        skipped when it is flushed.
+
+        Args:
+            seq: Sequence number of the request
+            command: Command string sent
+            future: The request's future, now done
+        """
+        scheduled = self._scheduled.pop(seq, None)
+        if not future.cancelled() or scheduled is None or scheduled.dropped:
+            return
+        if self.scheduler.withdraw(scheduled):
+            return
+        if not scheduled.offset or not command.startswith(CANCELLABLE_COMMANDS) or self.writer is None:
+            return
+        task = asyncio.create_task(self._cancel_on_device(seq))
+        self._cancel_tasks.add(task)
+        task.add_done_callback(self._cancel_tasks.discard)
+
+    async def _cancel_on_device(self, seq: int) -> None:
+        """Send CANCEL: for an abandoned request and wait for the board's acknowledgement."""
+        self.cancels_sent += 1
+        try:
+            _, status = await self.request(
+                format_cancel_command(seq),
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith("cancelled:"),
+                timeout=5.0
+            )
+        except Exception as e:
+            # Older firmware ignores CANCEL:; whatever it runs ends on its own
+            print(f"micro:bit didn't acknowledge cancelling request {seq}: {e or 'timeout'}", file=sys.stderr)
+            return
+        # Format: cancelled:seq:what, what being "none" if it had already ended
+        if not status["message"].endswith(":none"):
+            self.cancels_stopped += 1
+
     async def send_command(self, command: str) -> None:
         """
         Send a command to the micro:bit.
-        
+
+        While the link is down the command is held in the outbox and sent
+        once the client has reconnected.
+
         Args:
             command: Command string to send
-            
+
         Raises:
-            Exception: If no connection is established
+            Exception: If no connection is established, or the outbox is
+                full and the drop policy is "newest"
         """
-        if not self.writer:
-            raise Exception("Serial connection not established")
-        
-        self.writer.write(f"{command}\n".encode())
-        await self.writer.drain()
-    
+        await self._send_line(command)
+
+    async def _send_line(self, line: str, future: Optional[asyncio.Future] = None, coalesce: bool = True) -> bool:
+        """Write a line now, or hold it if the link is down or older lines are still held; True if written."""
+        # The board would discard a line that overflows its receive buffer
+        size = len(line.encode()) + 1
+        if size > MAX_LINE_BYTES and not (self.binary and encode_command(line)):
+            raise ValueError(
+                f"Command of {size} bytes doesn't fit the micro:bit's {MAX_LINE_BYTES}-byte receive buffer: {line[:40]}..."
+            )
+        if self.writer is None or self._outbox:
+            if not self._accepting_commands():
+                raise Exception("Serial connection not established")
+            self._hold(line, future)
+            return False
+
+        try:
+            await self._wait_written(self._write(line, future, coalesce))
+            await self.writer.drain()
+        except Exception:
+            if not self.auto_reconnect or self._supervisor_task is None:
+                raise
+            # The line may or may not have made it out; send it again after reconnecting
+            self._drop_link()
+            self._hold(line, future)
+            return False
+        return True
+
+    def _write(self, line: str, future: Optional[asyncio.Future] = None, coalesce: bool = True) -> ScheduledCommand:
+        """Schedule a line and write what the credit allows; returns the scheduled command."""
+        data = (encode_command(line) if self.binary else None) or f"{line}\n".encode()
+        command, superseded = self.scheduler.submit(line, data, future, coalesce)
+        seq, _ = split_sequence(line)
+        if seq is not None and future is not None:
+            self._scheduled[seq] = command
+        for stale in superseded:
+            if stale.future is not None and not stale.future.done():
+                stale.future.set_result((Responses.STATUS, {"message": SUPERSEDED, "timestamp": None}))
+        if superseded:
+            self._written.set()
+        self._pump()
+        return command
+
+    def _credit(self) -> Optional[int]:
+        """Bytes the board has room for now, or None without flow control."""
+        if self.flow_window is None:
+            return None
+        unread = (self.bytes_out - self._flow_mark - self._flow_consumed) & 0xFFFF
+        return max(self.flow_window - unread, 0)
+
+    def _pump(self) -> None:
+        """Write the scheduled commands, in the scheduler's order, as far as the credit allows."""
+        if self.writer is None:
+            return
+        credit = self._credit()
+        chunks = []
+        while credit is None or credit > 0:
+            # A command is finished before the next starts: bytes can't interleave
+            if self._current is None:
+                self._current = self.scheduler.next()
+                if self._current is None:
+                    break
+            command = self._current
+            count = len(command.data) - command.offset
+            if credit is not None:
+                count = min(count, credit)
+                credit -= count
+            chunks.append(command.data[command.offset:command.offset + count])
+            command.offset += count
+            self.bytes_out += count
+            if command.offset == len(command.data):
+                self._current = None
+                self.scheduler.written(command)
+                seq, line = split_sequence(command.line)
+                if line == Commands.FLOW:
+                    # The board counts the bytes it reads from the end of this line
+                    self._flow_marks[seq] = self.bytes_out
+        if not chunks:
+            return
+        data = b"".join(chunks)
+        self.writer.write(data)
+        if self.recording:
+            self.recording.sent(data)
+        self._written.set()
+
+    def _backlog_bytes(self) -> int:
+        """Bytes of scheduled commands not written yet."""
+        current = len(self._current.data) - self._current.offset if self._current else 0
+        return current + self.scheduler.queued_bytes()
+
+    async def _wait_written(self, command: ScheduledCommand) -> None:
+        """
+        Wait until a scheduled command has been written, or superseded.
+
+        Raises:
+            Exception: If the link closes first
+        """
+        while not command.done:
+            if self.writer is None:
+                raise Exception("Serial connection closed")
+            self._written.clear()
+            try:
+                await asyncio.wait_for(self._written.wait(), timeout=FLOW_STALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                # A lost credit would stall the link for good
+                self.flow_stalls += 1
+                self._flow_consumed = (self.bytes_out - self._flow_mark) & 0xFFFF
+                self._pump()
+        if command.dropped:
+            raise Exception("Serial connection closed")
+
+    def _reset_flow(self) -> None:
+        """Forget the board's window and the commands waiting for credit, as for a new link."""
+        self.flow_window = None
+        self._flow_marks.clear()
+        if self._current:
+            self._current.dropped = True
+            self._current = None
+        self.scheduler.clear()
+        self._written.set()
+
+    def _hold(self, line: str, future: Optional[asyncio.Future]) -> None:
+        """Add a line to the outbox, applying the drop policy when it is full."""
+        if len(self._outbox) >= self.outbox_size:
+            self.dropped_commands += 1
+            if self.drop_policy == "newest":
+                raise Exception("micro:bit is disconnected and the command queue is full")
+            _, dropped = self._outbox.popleft()
+            if dropped is not None and not dropped.done():
+                dropped.set_exception(Exception("Command dropped while micro:bit was disconnected"))
+        self._outbox.append((line, future))
+
+    async def _flush_outbox(self) -> None:
+        """Send the held lines in order, skipping requests that were abandoned meanwhile."""
+        while self._outbox and self.writer is not None:
+            line, future = self._outbox.popleft()
+            if future is not None and future.done():
+                continue
+            await self._wait_written(self._write(line, future))
+            await self.writer.drain()
+
     async def read_temperature_response(self) -> dict:
         """
         Read and parse temperature response from micro:bit.
-        
+
         Returns:
             Dictionary with temperature data
-            
+
         Raises:
             Exception: If no connection is established
         """
-        if not self.reader:
-            raise Exception("Serial connection not established")
-        
-        while True:
-            line = await self.reader.readline()
-            if line:
-                response = line.decode('utf-8').strip()
-                if response.startswith(Responses.TEMP):
-                    return parse_temperature_response(response)
-    
+        _, data = await self.wait_for_response((Responses.TEMP,))
+        return data
+
     async def read_button_response(self, expected_button: str) -> dict:
         """
         Read and parse button response from micro:bit.
-        
+
         Args:
             expected_button: The button we're waiting for ("a", "b", or "any")
-            
+
         Returns:
             Dictionary with button press data
-            
+
         Raises:
             Exception: If no connection is established
         """
-        if not self.reader:
-            raise Exception("Serial connection not established")
-        
-        while True:
-            line = await self.reader.readline()
-            if line:
-                response = line.decode('utf-8').strip()
-                
-                if response.startswith(Responses.BUTTON):
-                    button_data = parse_button_response(response)
-                    button_pressed = button_data["button"]
-                    action = button_data["action"]
-                    
-                    # Check if this is the button we're waiting for
-                    if (expected_button == "any" or 
-                        expected_button == button_pressed) and action == "pressed":
-                        return {
-                            "button_pressed": button_pressed,
-                            "timeout": False,
-                            "timestamp": button_data["timestamp"],
-                            "waited_for": expected_button
-                        }
-                
-                elif response.startswith(Responses.BUTTON_TIMEOUT):
-                    timeout_data = parse_button_timeout_response(response)
-                    return {
-                        "button_pressed": None,
-                        "timeout": True,
-                        "timestamp": None,
-                        "waited_for": timeout_data["waited_for"],
-                        "timeout_duration": timeout_data["timeout_duration"]
-                    }
-    
-    async def get_temperature(self) -> dict:
+        waiter = self._add_waiter(
+            (Responses.BUTTON, Responses.BUTTON_TIMEOUT),
+            self._button_predicate(expected_button)
+        )
+        return self._button_result(expected_button, *await waiter.future)
+
+    @staticmethod
+    def _button_predicate(expected_button: str) -> Callable[[str, dict], bool]:
+        """Build a filter accepting presses of the expected button or its timeout."""
+        def predicate(kind: str, data: dict) -> bool:
+            if kind == Responses.BUTTON_TIMEOUT:
+                return data["waited_for"] == expected_button
+            # Check if this is the button we're waiting for
+            return (expected_button == "any" or
+                    expected_button == data["button"]) and data["action"] == "pressed"
+        return predicate
+
+    def _button_result(self, expected_button: str, kind: str, data: dict) -> dict:
+        """Convert a button response into the wait_for_button_press result."""
+        if kind == Responses.BUTTON_TIMEOUT:
+            return {
+                "button_pressed": None,
+                "timeout": True,
+                "timestamp": None,
+                "host_time": None,
+                "waited_for": data["waited_for"],
+                "timeout_duration": data["timeout_duration"]
+            }
+        return {
+            "button_pressed": data["button"],
+            "timeout": False,
+            "timestamp": data["timestamp"],
+            "host_time": self._host_time(data["timestamp"]),
+            "waited_for": expected_button
+        }
+
+    def _cached_temperature(self, max_age: float) -> Optional[dict]:
+        """
+        Get the freshest known temperature if it is no older than max_age.
+
+        Both direct TEMP: replies and streamed samples count as readings.
+        """
+        candidates = []
+        if self._temperature_cache is not None:
+            received, response = self._temperature_cache
+            candidates.append((time.monotonic() - received, response))
+
+        sample = self.streams["temp"].latest() if "temp" in self.streams else None
+        if sample is not None:
+            candidates.append((sample["age_seconds"], {
+                "temperature_celsius": int(sample["value"]),
+                "timestamp": sample["timestamp"],
+                "host_time": sample["host_time"]
+            }))
+
+        if not candidates:
+            return None
+        age, response = min(candidates, key=lambda candidate: candidate[0])
+        if age > max_age:
+            return None
+        return {**response, "cached": True, "age_seconds": round(age, 3)}
+
+    async def _read_temperature(self) -> dict:
+        """Send one TEMP: request and remember its reply."""
+        # Send temperature request and wait for response with timeout
+        try:
+            _, response = await self.request(
+                format_temperature_command(),
+                (Responses.TEMP,),
+                timeout=5.0
+            )
+        except asyncio.TimeoutError:
+            raise Exception("Timeout waiting for temperature response from micro:bit")
+
+        response = {**response, "host_time": self._host_time(response["timestamp"])}
+        self._temperature_cache = (time.monotonic(), response)
+        return {**response, "cached": False, "age_seconds": 0.0}
+
+    async def get_temperature(self, max_age: Optional[float] = None) -> dict:
         """
         Request and get temperature reading from micro:bit.
-        
+
+        A reading younger than max_age is served from memory. Otherwise
+        concurrent callers share a single TEMP: request to the device.
+
+        Args:
+            max_age: Oldest acceptable reading in seconds (default: temperature_ttl)
+
         Returns:
-            Dictionary with temperature data
-            
+            Dictionary with temperature data, whether it was served from the
+            cache and how old it is
+
         Raises:
             Exception: If connection fails or timeout occurs
         """
-        if not self.reader or not self.writer:
+        cached = self._cached_temperature(self.temperature_ttl if max_age is None else max_age)
+        if cached is not None:
+            return cached
+
+        if not self._accepting_commands():
             raise Exception("Serial connection not established")
-        
-        # Send temperature request
-        await self.send_command("TEMP:")
-        
-        # Wait for response with timeout
-        try:
-            response = await asyncio.wait_for(
-                self.read_temperature_response(), 
-                timeout=5.0
+
+        if self._temperature_request is None or self._temperature_request.done():
+            self._temperature_request = asyncio.ensure_future(self._read_temperature())
+            # Avoid "exception never retrieved" when every caller gave up
+            self._temperature_request.add_done_callback(
+                lambda task: task.cancelled() or task.exception()
             )
-            return response
-        except asyncio.TimeoutError:
-            raise Exception("Timeout waiting for temperature response from micro:bit")
-    
-    async def wait_for_button_press(self, button: str, timeout: float) -> dict:
+
+        # Shield so one caller giving up doesn't cancel the read for the others
+        return dict(await asyncio.shield(self._temperature_request))
+
+    async def wait_for_button_press(self, button: str, timeout: float, since: Optional[int] = None) -> dict:
         """
         Wait for a button press on the micro:bit.
-        
+
+        With firmware that reports button events, a press already in the
+        event history is returned immediately; otherwise the next one is
+        awaited without sending anything to the board. The first wait only
+        accepts presses made after it started.
+
         Args:
             button: Button to wait for ("a", "b", or "any")
             timeout: Maximum time to wait in seconds
-            
+            since: Event cursor to accept presses after (default: presses
+                made since the first wait began that no wait has returned,
+                so a press of B stays for a later wait on B while one waits
+                on A)
+
         Returns:
             Dictionary with button press result
-            
+
         Raises:
             Exception: If connection fails
         """
-        if not self.reader or not self.writer:
+        if not self._accepting_commands():
             raise Exception("Serial connection not established")
-        
-        # Send button wait request
-        await self.send_command(f"WAIT_BUTTON:{button}:{timeout}")
-        
-        # Wait for response with timeout (add 1 second buffer)
-        try:
-            response = await asyncio.wait_for(
-                self.read_button_response(button), 
+
+        if self.button_events:
+            if self._button_cursor is None:
+                self._button_cursor = self.events.cursor
+            cursor = self._button_cursor if since is None else since
+            try:
+                # A press another wait returned is skipped, but one of another
+                # button than this wait's stays for the wait that wants it
+                event = await self.events.wait_for(
+                    lambda event: (_is_press(event) and button in ("any", event["button"])
+                                   and (since is not None or event["id"] not in self._returned_presses)),
+                    cursor,
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                return {
+                    "button_pressed": None,
+                    "timeout": True,
+                    "timestamp": None,
+                    "host_time": None,
+                    "waited_for": button,
+                    "timeout_duration": timeout,
+                    "cursor": self.events.cursor
+                }
+            self._returned_press(event["id"])
+            return {
+                "button_pressed": event["button"],
+                "timeout": False,
+                "timestamp": event["timestamp"],
+                "host_time": event["host_time"],
+                "waited_for": button,
+                "cursor": event["id"]
+            }
+
+        # Send button wait request and wait for response with timeout
+        # (add 1 second buffer)
+        try:
+            kind, data = await self.request(
+                format_button_wait_command(button, timeout),
+                (Responses.BUTTON, Responses.BUTTON_TIMEOUT),
+                self._button_predicate(button),
                 timeout=timeout + 1.0
             )
-            return response
+            return self._button_result(button, kind, data)
         except asyncio.TimeoutError:
             return {
                 "button_pressed": None,
                 "timeout": True,
                 "timestamp": None,
+                "host_time": None,
                 "waited_for": button,
                 "timeout_duration": timeout
             }
-    
+
+    def _returned_press(self, event_id: int) -> None:
+        """Mark a press as returned, moving the cursor past the presses all returned."""
+        self._returned_presses.add(event_id)
+        buffered = self.events.since(self._button_cursor)
+        for event in buffered:
+            if _is_press(event) and event["id"] not in self._returned_presses:
+                break
+            self._button_cursor = event["id"]
+        # Presses dropped from the history can't be returned again anyway
+        kept = {event["id"] for event in buffered}
+        self._returned_presses = {
+            returned for returned in self._returned_presses if returned > self._button_cursor and returned in kept
+        }
+
+    def button_counts(self, since: int = 0) -> dict:
+        """
+        Count button presses in the event history.
+
+        Args:
+            since: Event cursor to count presses after (0 for the whole history)
+
+        Returns:
+            Dictionary with press counts per button, the current cursor and
+            whether older events after the cursor were already dropped
+        """
+        counts = {"a": 0, "b": 0}
+        for event in self.events.since(since, lambda event: event["type"] == "button"):
+            if event["action"] == "pressed":
+                counts[event["button"]] = counts.get(event["button"], 0) + 1
+        return {
+            "since_cursor": since,
+            "cursor": self.events.cursor,
+            "counts": counts,
+            "truncated": self.events.truncated(since)
+        }
+
+    def button_history(self, since: int = 0, limit: int = 50) -> dict:
+        """
+        Get button presses and releases from the event history.
+
+        Args:
+            since: Event cursor to list events after (0 for the whole history)
+            limit: Maximum number of events to return, oldest first
+
+        Returns:
+            Dictionary with the events, the cursor to pass next time, whether
+            more events follow and whether older events were already dropped
+        """
+        events = self.events.since(since, lambda event: event["type"] == "button")
+        page = events[:limit]
+        return {
+            "since_cursor": since,
+            "cursor": page[-1]["id"] if page else max(since, self.events.cursor),
+            "events": page,
+            "more": len(events) > limit,
+            "truncated": self.events.truncated(since)
+        }
+
+    def get_stream(self, sensor: str) -> SampleRingBuffer:
+        """
+        Get the buffer of streamed samples for a sensor.
+
+        Args:
+            sensor: Sensor name as used in the STREAM: command (e.g. "temp")
+
+        Returns:
+            Ring buffer of samples received so far
+        """
+        if sensor not in self.streams:
+            self.streams[sensor] = SampleRingBuffer(self.stream_capacity)
+        return self.streams[sensor]
+
+    async def start_stream(self, sensor: str, interval_ms: int) -> dict:
+        """
+        Start streaming samples from a sensor into its ring buffer.
+
+        Args:
+            sensor: Sensor name (e.g. "temp")
+            interval_ms: Time between samples in milliseconds; 0 stops the stream
+
+        Returns:
+            Dictionary with the device's status message and timestamp
+
+        Raises:
+            Exception: If connection fails or timeout occurs
+        """
+        try:
+            _, status = await self.request(
+                format_stream_command(sensor, interval_ms),
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith("stream"),
+                timeout=5.0
+            )
+            if status["message"].startswith("streaming:"):
+                self._active_streams[sensor] = interval_ms
+            else:
+                self._active_streams.pop(sensor, None)
+            return status
+        except asyncio.TimeoutError:
+            raise Exception("Timeout waiting for stream response from micro:bit")
+
+    async def stop_stream(self, sensor: str) -> dict:
+        """
+        Stop streaming samples from a sensor; buffered samples are kept.
+
+        Args:
+            sensor: Sensor name (e.g. "temp")
+
+        Returns:
+            Dictionary with the device's status message and timestamp
+        """
+        return await self.start_stream(sensor, 0)
+
+    async def _start_background(
+        self,
+        command: str,
+        started: tuple,
+        finished: tuple,
+        wait: bool,
+        duration: float,
+        coalesce: bool = True
+    ) -> dict:
+        """
+        Send a command the micro:bit carries out in the background (scroll, music).
+
+        Args:
+            command: Command string to send
+            started: STATUS message prefixes acknowledging the start
+            finished: STATUS message prefixes reporting the end, or being cut short
+            wait: Wait for the end instead of the acknowledgement
+            duration: Expected run time in seconds, added to the timeout when waiting
+            coalesce: Let a newer command of the same kind replace this one
+                before it is sent
+
+        Returns:
+            Dictionary with the device's status message and timestamp, or the
+            message "superseded" if a newer command replaced it before it was sent
+
+        Raises:
+            Exception: If the micro:bit doesn't answer
+        """
+        accepted = (finished if wait else started) + ("music_error",)
+        try:
+            _, status = await self.request(
+                command,
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith(accepted),
+                timeout=5.0 + (duration if wait else 0.0),
+                coalesce=coalesce
+            )
+        except asyncio.TimeoutError:
+            raise Exception("Timeout waiting for response from micro:bit")
+        return status
+
+    async def show_image(self, image: str, coalesce: bool = True) -> dict:
+        """
+        Show an image on the display.
+
+        Args:
+            image: Image pattern (e.g. "00300:03630:36963:03630:00300")
+            coalesce: Skip the image if a newer display command arrives
+                before it could be sent (False to show every image)
+
+        Returns:
+            Dictionary with the device's status message ("displayed:" and
+            the image, or "superseded") and timestamp
+
+        Raises:
+            Exception: If connection fails or timeout occurs
+        """
+        try:
+            _, status = await self.request(
+                format_image_command(image),
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith("displayed:"),
+                timeout=5.0,
+                coalesce=coalesce
+            )
+        except asyncio.TimeoutError:
+            raise Exception("Timeout waiting for response from micro:bit")
+        return status
+
+    async def scroll_message(self, message: str, wait: bool = False, coalesce: bool = True) -> dict:
+        """
+        Scroll a text message across the display without blocking the micro:bit.
+
+        Args:
+            message: Text to scroll (non-ASCII characters are transliterated or dropped)
+            wait: Return once the message has scrolled past (or was replaced)
+                instead of once it has started
+            coalesce: Skip the message if a newer display command arrives
+                before it could be sent (False to show every message)
+
+        Returns:
+            Dictionary with the device's status message ("scrolling:",
+            "displayed:" or "scroll_stopped:" and the message, or
+            "superseded") and timestamp
+
+        Raises:
+            Exception: If connection fails or timeout occurs
+        """
+        command = format_message_command(message)
+        return await self._start_background(
+            command,
+            ("scrolling:",),
+            ("displayed:", "scroll_stopped:"),
+            wait,
+            # The text the board scrolls, as transliterated
+            scroll_seconds(command[len(Commands.MESSAGE):]),
+            coalesce
+        )
+
+    async def play_music(self, notes: list[str], wait: bool = False) -> dict:
+        """
+        Play notes in the background on the micro:bit.
+
+        Melodies the board already holds are replayed by ID (PLAY_ID:);
+        others are uploaded with MELODY: so the board keeps them for next
+        time. Notes the host can't validate, and melodies the store can't
+        hold or one MELODY: command can't carry, are sent as a plain MUSIC:
+        command.
+
+        Args:
+            notes: Notes in micro:bit format (e.g. "C4:4")
+            wait: Return once the music has finished (or was replaced by
+                newer music) instead of once it has started
+
+        Returns:
+            Dictionary with the device's status message ("playing:",
+            "music_played:" or "music_stopped:" and the note count) and
+            timestamp, or the message "superseded" if newer music replaced
+            the notes before they were sent
+
+        Raises:
+            Exception: If the notes can't be played, or connection fails or
+                timeout occurs
+        """
+        started = ("playing:",)
+        finished = ("music_played:", "music_stopped:")
+        duration = music_seconds(notes)
+
+        melody = melody_id(notes) if self.melodies is not None else None
+        if melody is not None and not self.melodies.fits(
+            len(notes), self._wire_size(format_melody_command(melody, notes))
+        ):
+            melody = None
+
+        if melody is not None and melody in self.melodies:
+            status = await self._start_background(
+                format_play_id_command(melody), started, finished, wait, duration
+            )
+            if status["message"] == SUPERSEDED:
+                return status
+            if status["message"] != "music_error:unknown_melody":
+                self._check_music_status(status)
+                self.melodies.touch(melody)
+                return status
+            # Evicted by an upload we didn't know about yet: send it again
+            self.melodies.discard(melody)
+
+        command = format_melody_command(melody, notes) if melody else format_music_command(notes)
+        status = await self._start_background(command, started, finished, wait, duration)
+        self._check_music_status(status)
+        if melody is not None and status["message"] != SUPERSEDED:
+            self.melodies.add(melody, len(notes))
+        return status
+
+    def _wire_size(self, command: str) -> int:
+        """Bytes a command takes on the link, as a frame or a line, with the longest sequence envelope."""
+        line = format_sequenced_command(0xFFFF, command) if self.sequence_ids else command
+        frame = encode_command(line) if self.binary else None
+        return len(frame) if frame else len(line.encode()) + 1
+
+    @staticmethod
+    def _check_music_status(status: dict) -> None:
+        """Raise the error a music command was answered with, if any."""
+        if status["message"].startswith("music_error"):
+            raise Exception(f"micro:bit couldn't play the music: {status['message'][len('music_error:'):]}")
+
+    async def play_animation(
+        self,
+        frames: list[str],
+        frame_delay_ms: int = 100,
+        loops: int = 1,
+        wait: bool = False,
+        coalesce: bool = True
+    ) -> dict:
+        """
+        Upload animation frames and play them on the micro:bit's display timer.
+
+        Frames beyond the first chunk are staged with ANIM_ADD: commands,
+        pipelined with the final ANIM: command that starts playback. All of
+        them are scheduled at once, so a display command sent later can't
+        slip in between and be superseded by this animation. The ANIM:
+        carries the number of frames staged for it, so the board refuses to
+        play frames left behind by another upload.
+
+        Args:
+            frames: Image patterns (e.g. "00300:03630:36963:03630:00300")
+            frame_delay_ms: Time each frame is shown in milliseconds
+            loops: Number of times to play the frames, 0 to repeat until
+                another display command
+            wait: Return once the animation has finished (or was cut short)
+                instead of once it has started
+            coalesce: Skip the animation if a newer display command arrives
+                before it could be started (False to play every animation)
+
+        Returns:
+            Dictionary with the device's status message and timestamp, or
+            the message "superseded"
+
+        Raises:
+            ValueError: If the frames are invalid, or wait is set for an
+                endless animation
+            Exception: If the micro:bit rejects the animation or doesn't answer
+        """
+        if not 0 < len(frames) <= MAX_ANIMATION_FRAMES:
+            raise ValueError(f"An animation needs 1 to {MAX_ANIMATION_FRAMES} frames")
+        if wait and not loops:
+            raise ValueError("Can't wait for an animation that loops forever")
+
+        chunks = [frames[i:i + ANIMATION_CHUNK_FRAMES] for i in range(0, len(frames), ANIMATION_CHUNK_FRAMES)]
+        commands = [
+            format_animation_frames_command(i * ANIMATION_CHUNK_FRAMES, chunk)
+            for i, chunk in enumerate(chunks[:-1])
+        ]
+        staged = len(frames) - len(chunks[-1])
+        commands.append(format_animation_command(chunks[-1], frame_delay_ms, loops, staged))
+
+        final = ("animation_", "anim_error") if wait else ("animating:", "anim_error")
+        predicates = [lambda kind, data: data["message"].startswith(("anim_staged:", "anim_error"))] * (len(commands) - 1)
+        predicates.append(lambda kind, data: data["message"].startswith(final))
+        sent = await asyncio.gather(
+            *(
+                self.send_request(command, (Responses.STATUS,), predicate, coalesce)
+                for command, predicate in zip(commands, predicates)
+            ),
+            return_exceptions=True
+        )
+        futures = [future for future in sent if not isinstance(future, BaseException)]
+        if len(futures) < len(sent):
+            for future in futures:
+                future.cancel()
+            raise next(error for error in sent if isinstance(error, BaseException))
+
+        timeout = 5.0
+        if wait:
+            timeout += len(frames) * loops * frame_delay_ms / 1000
+        try:
+            replies = await asyncio.wait_for(asyncio.gather(*futures), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.request_timeouts += 1
+            raise Exception("Timeout waiting for animation response from micro:bit")
+        finally:
+            for future in futures:
+                future.cancel()
+
+        for _, status in replies:
+            if status["message"].startswith("anim_error"):
+                raise Exception(f"micro:bit rejected the animation: {status['message']}")
+        return replies[-1][1]
+
+    async def run_program(self, steps: list, wait: bool = False, timeout: float = 60.0) -> dict:
+        """
+        Run a micro-program on the micro:bit (see program.py).
+
+        The script is compiled and uploaded with one PROG: command, replacing
+        the program the board was running. The board then runs it on its own
+        and reports button presses, readings and marks as "program" events.
+
+        Args:
+            steps: Script steps
+            wait: Return once the program has ended instead of once it has started
+            timeout: Seconds to wait for the end; a program still running
+                then is stopped
+
+        Returns:
+            Dictionary with the program's status ("started", "done",
+            "stopped", "error" or "timeout"), its sequence number, the number
+            of instructions, the events it reported so far and the event
+            cursor to pass to program_events for later ones
+
+        Raises:
+            ValueError: If the script is invalid
+            Exception: If the micro:bit rejects the program or doesn't answer
+        """
+        instructions = compile_program(steps)
+        cursor = self.events.cursor
+        try:
+            _, status = await self.request(
+                format_program_command(instructions),
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith(("prog_started:", "prog_error")),
+                timeout=5.0
+            )
+        except asyncio.TimeoutError:
+            raise Exception("Timeout waiting for response from micro:bit")
+        if status["message"].startswith("prog_error"):
+            raise Exception(f"micro:bit rejected the program: {status['message'][len('prog_error:'):]}")
+        seq = status["seq"]
+
+        def ours(event: dict) -> bool:
+            return event["type"] == "program" and event["seq"] == seq
+
+        result = "started"
+        if wait:
+            try:
+                end = await self.events.wait_for(
+                    lambda event: ours(event) and event["event"] in ("done", "stopped", "error"),
+                    cursor,
+                    timeout
+                )
+                result = end["event"]
+            except asyncio.TimeoutError:
+                result = "timeout"
+                if seq is not None:
+                    await self._cancel_on_device(seq)
+            except asyncio.CancelledError:
+                # Nobody is left to report to: don't leave the program running
+                if seq is not None:
+                    task = asyncio.create_task(self._cancel_on_device(seq))
+                    self._cancel_tasks.add(task)
+                    task.add_done_callback(self._cancel_tasks.discard)
+                raise
+
+        events = self.events.since(cursor, ours)
+        return {
+            "status": result,
+            "seq": seq,
+            "instructions": len(instructions),
+            "events": events,
+            "cursor": events[-1]["id"] if events else self.events.cursor
+        }
+
+    async def stop_program(self) -> dict:
+        """
+        Stop the program the micro:bit is running, if any.
+
+        Returns:
+            Dictionary with the device's status message and timestamp; the
+            stopped program reports a "stopped" event
+
+        Raises:
+            Exception: If the micro:bit doesn't answer
+        """
+        try:
+            _, status = await self.request(
+                format_program_command([]),
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith("prog_idle"),
+                timeout=5.0
+            )
+        except asyncio.TimeoutError:
+            raise Exception("Timeout waiting for response from micro:bit")
+        return status
+
+    def program_events(self, since: int = 0, limit: int = 50) -> dict:
+        """
+        Get the reports of on-device programs from the event history.
+
+        Args:
+            since: Event cursor to list events after (0 for the whole history)
+            limit: Maximum number of events to return, oldest first
+
+        Returns:
+            Dictionary with the events, the cursor to pass next time, whether
+            more events follow and whether older events were already dropped
+        """
+        events = self.events.since(since, lambda event: event["type"] == "program")
+        page = events[:limit]
+        return {
+            "since_cursor": since,
+            "cursor": page[-1]["id"] if page else max(since, self.events.cursor),
+            "events": page,
+            "more": len(events) > limit,
+            "truncated": self.events.truncated(since)
+        }
+
+    def flow_stats(self) -> dict:
+        """
+        Get the state of flow control.
+
+        Returns:
+            Dictionary with the board's receive window (None while flow
+            control is off), the bytes waiting for credit and the number of
+            waits for credit that timed out
+        """
+        return {
+            "window": self.flow_window,
+            "backlog_bytes": self._backlog_bytes(),
+            "stalls": self.flow_stalls
+        }
+
+    def _out_of_memory(self, detail: str) -> None:
+        """Report that the board ran out of memory, as a micro:bit V1 may with the V2-only extras loaded."""
+        self.memory_errors += 1
+        print(
+            f"micro:bit on {self.serial_port} ran out of memory ({detail}); on a micro:bit V1, flash main.py"
+            " without extras.py",
+            file=sys.stderr
+        )
+
+    def metrics(self) -> dict:
+        """
+        Get the client's counters, queue depths and command latencies.
+
+        Returns:
+            Dictionary with byte, line and error counters (memory_errors
+            counting the board running out of memory), reconnects, dropped
+            commands, request timeouts and flow control stalls since the
+            client was created; the outstanding requests, outbox depth, bytes
+            waiting for credit, the board's receive window and unclaimed
+            replies per response type right now; CANCEL: commands sent for
+            abandoned requests and those that stopped something on the board;
+            and a latency summary per command
+        """
+        return {
+            "connected": self.is_connected(),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "lines_received": self.lines_received,
+            "frame_errors": self.frame_errors,
+            "unparsed_lines": self.unparsed_lines,
+            "memory_errors": self.memory_errors,
+            "dropped_lines": self.dropped_lines,
+            "reconnects": self.reconnects,
+            "dropped_commands": self.dropped_commands,
+            "request_timeouts": self.request_timeouts,
+            "cancels_sent": self.cancels_sent,
+            "cancels_stopped": self.cancels_stopped,
+            "outstanding_requests": len(self._pending) + len(self._waiters),
+            "outbox_depth": len(self._outbox),
+            "backlog_bytes": self._backlog_bytes(),
+            "flow_window": self.flow_window,
+            "flow_stalls": self.flow_stalls,
+            "scheduler": self.scheduler.stats(),
+            "response_queue_depth": {kind.rstrip("|"): queue.qsize() for kind, queue in self._queues.items()},
+            "commands": {command: histogram.summary() for command, histogram in self.command_latency.items()}
+        }
+
     def is_connected(self) -> bool:
         """Check if serial connection is established."""
         return self.reader is not None and self.writer is not None
-    
+
     async def close(self) -> None:
         """Close the serial connection."""
+        for task in (self._connect_task, self._supervisor_task, self._handshake_task, self._clock_task, *self._cancel_tasks):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._connect_task = None
+        self._supervisor_task = None
+        self._handshake_task = None
+        self._clock_task = None
+
+        for _, future in self._outbox:
+            if future is not None:
+                future.cancel()
+        self._outbox.clear()
+
+        if self._reader_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+
         if self.writer:
             self.writer.close()
-            await self.writer.wait_closed()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                # The link may already be broken
+                pass
             self.writer = None
             self.reader = None
@@ -0,0 +1,226 @@
+"""
+Micro-programs the micro:bit runs on its own.
+
+A program is a short script of steps (show an image, scroll text, sleep,
+play notes, wait for a button, show the temperature, repeat a block) that
+the host validates and compiles into a flat list of instructions, uploads
+with a single PROG: command, and the firmware interprets from its main
+loop. Loops, waits and reactions to buttons then take no host round trips:
+a "flash until A is pressed" loop stops within a loop pass of the press,
+and the board reports what happened as it happens.
+
+Script steps (JSON objects with an "op" key):
+
+    {"op": "show_image", "image": "00300:03630:36963:03630:00300"}
+    {"op": "scroll", "text": "Hi"}
+    {"op": "clear"}
+    {"op": "sleep", "ms": 200}
+    {"op": "play", "notes": ["C4:4", "E4:4"]}
+    {"op": "wait_for_button", "button": "a", "timeout_ms": 5000}
+    {"op": "show_temperature"}
+    {"op": "mark", "label": "round 1"}
+    {"op": "repeat", "times": 3, "until_button": "b", "steps": [...]}
+
+Instructions (joined with ";" after PROG:):
+
+    I<25 digits>          show an image
+    D<text>               scroll text in the background
+    X                     clear the display
+    S<ms>                 sleep
+    P<note,note,...>      play notes in the background
+    K<button>:<ms>        wait for a button, 0 ms waiting forever
+    T                     scroll the temperature and report it
+    M<label>              report a mark
+    L<times>:<button>:<end>  start a loop (times 0 repeats forever), ended
+                          early by a press of button ("-" for none) by
+                          jumping to instruction end
+    E                     end of the innermost loop
+
+The board reports with STATUS messages carrying the PROG: command's
+sequence number: prog_started:<instructions>, prog_button:<button>:<ms>
+(a press answering a wait or ending a loop, ms after the wait or loop
+started), prog_button_timeout:<button>, prog_temp:<celsius>,
+prog_mark:<label>, and finally prog_done:<ms>, prog_stopped:<ms> (replaced
+by another PROG: or stopped) or prog_error:<reason>:<instruction>.
+"""
+
+import re
+
+from .protocol import NOTE_PATTERN, Commands
+
+# Limits keeping a program within the firmware's receive buffer and RAM
+MAX_PROGRAM_INSTRUCTIONS = 64
+MAX_PROGRAM_LENGTH = 480
+MAX_PROGRAM_DEPTH = 4
+MAX_SLEEP_MS = 60000
+MAX_WAIT_MS = 600000
+MAX_REPEAT = 10000
+MAX_TEXT_LENGTH = 40
+
+BUTTONS = ("a", "b", "any")
+
+_IMAGE_PATTERN = re.compile(r"^\d{5}(:\d{5}){4}$")
+
+# Printable ASCII but the instruction separator
+_TEXT_PATTERN = re.compile(r"^[ -:<-~]+$")
+
+# Ops that hand the board back to its main loop for a while, one of
+# which every loop body needs so a loop can't flood the serial link
+_PAUSING_OPS = ("sleep", "wait_for_button")
+
+STEP_OPS = (
+    "show_image", "scroll", "clear", "sleep", "play",
+    "wait_for_button", "show_temperature", "mark", "repeat"
+)
+
+
+def _integer(step: dict, key: str, default, low: int, high: int, where: str) -> int:
+    """An integer argument of a step, checked against its range."""
+    value = step.get(key, default)
+    if value is None or isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high:
+        raise ValueError(f"{where}: {key} must be an integer from {low} to {high}")
+    return value
+
+
+def _text(step: dict, key: str, where: str) -> str:
+    """A text argument of a step: printable ASCII without ';'."""
+    value = step.get(key)
+    if not isinstance(value, str) or not 0 < len(value) <= MAX_TEXT_LENGTH or not _TEXT_PATTERN.match(value):
+        raise ValueError(f"{where}: {key} must be 1 to {MAX_TEXT_LENGTH} printable ASCII characters other than ';'")
+    return value
+
+
+def _button(step: dict, key: str, where: str) -> str:
+    """A button argument of a step."""
+    value = step.get(key, "any")
+    if value not in BUTTONS:
+        raise ValueError(f"{where}: {key} must be one of {', '.join(BUTTONS)}")
+    return value
+
+
+def _pauses(steps: list) -> bool:
+    """Whether any of the steps, or the steps they repeat, sleeps or waits."""
+    return any(
+        isinstance(step, dict)
+        and (step.get("op") in _PAUSING_OPS or (step.get("op") == "repeat" and _pauses(step.get("steps") or [])))
+        for step in steps
+    )
+
+
+def _compile(steps, instructions: list[str], depth: int, path: str) -> None:
+    """Append the instructions for steps, checking each one."""
+    if not isinstance(steps, list) or not steps:
+        raise ValueError(f"{path} must be a non-empty list of steps")
+    for index, step in enumerate(steps):
+        where = f"{path}[{index}]"
+        op = step.get("op") if isinstance(step, dict) else None
+        if op == "show_image":
+            image = step.get("image")
+            if not isinstance(image, str) or not _IMAGE_PATTERN.match(image):
+                raise ValueError(f"{where}: image must be 5 rows of 5 digits, e.g. 00300:03630:36963:03630:00300")
+            instructions.append("I" + image.replace(":", ""))
+        elif op == "scroll":
+            instructions.append("D" + _text(step, "text", where))
+        elif op == "clear":
+            instructions.append("X")
+        elif op == "sleep":
+            instructions.append(f"S{_integer(step, 'ms', None, 1, MAX_SLEEP_MS, where)}")
+        elif op == "play":
+            notes = step.get("notes")
+            if (
+                not isinstance(notes, list) or not notes
+                or not all(isinstance(note, str) and NOTE_PATTERN.match(note.strip()) for note in notes)
+            ):
+                raise ValueError(f"{where}: notes must be a non-empty list of notes like \"C4:4\"")
+            instructions.append("P" + ",".join(note.strip() for note in notes))
+        elif op == "wait_for_button":
+            button = _button(step, "button", where)
+            instructions.append(f"K{button}:{_integer(step, 'timeout_ms', 0, 0, MAX_WAIT_MS, where)}")
+        elif op == "show_temperature":
+            instructions.append("T")
+        elif op == "mark":
+            instructions.append("M" + _text(step, "label", where))
+        elif op == "repeat":
+            if depth >= MAX_PROGRAM_DEPTH:
+                raise ValueError(f"{where}: repeats can be nested {MAX_PROGRAM_DEPTH} deep at most")
+            times = _integer(step, "times", 0, 0, MAX_REPEAT, where)
+            until = _button(step, "until_button", where) if step.get("until_button") is not None else "-"
+            body = step.get("steps")
+            if isinstance(body, list) and body and not _pauses(body):
+                raise ValueError(f"{where}: a repeated block needs a sleep or wait_for_button step")
+            start = len(instructions)
+            instructions.append("")
+            _compile(body, instructions, depth + 1, f"{where}.steps")
+            instructions.append("E")
+            # The loop jumps past its E when it ends early
+            instructions[start] = f"L{times}:{until}:{len(instructions)}"
+        else:
+            raise ValueError(f"{where}: op must be one of {', '.join(STEP_OPS)}")
+
+
+def compile_program(steps: list) -> list[str]:
+    """
+    Validate a program script and compile it to firmware instructions.
+
+    Args:
+        steps: Script steps (see the module docstring)
+
+    Returns:
+        Instructions in execution order
+
+    Raises:
+        ValueError: If a step is invalid or the program is too large for the board
+    """
+    instructions: list[str] = []
+    _compile(steps, instructions, 0, "steps")
+    if len(instructions) > MAX_PROGRAM_INSTRUCTIONS:
+        raise ValueError(
+            f"The program compiles to {len(instructions)} instructions, the micro:bit holds {MAX_PROGRAM_INSTRUCTIONS}"
+        )
+    if len(format_program_command(instructions)) > MAX_PROGRAM_LENGTH:
+        raise ValueError(f"The program is longer than the {MAX_PROGRAM_LENGTH} characters one command can carry")
+    return instructions
+
+
+def format_program_command(instructions: list[str]) -> str:
+    """Format a command running instructions on the micro:bit (none stops the running program)."""
+    return Commands.PROGRAM + ";".join(instructions)
+
+
+def parse_program_event(message: str) -> dict:
+    """
+    Parse a program STATUS message.
+
+    Args:
+        message: STATUS message starting with "prog_"
+
+    Returns:
+        Dictionary with the event name ("started", "button", "temp", "done",
+        ...) and its fields: instructions, button and reaction_ms, celsius,
+        label, elapsed_ms, or reason and instruction for errors
+    """
+    name, _, value = message[len("prog_"):].partition(":")
+    event = {"event": name}
+    try:
+        if name == "started":
+            event["instructions"] = int(value)
+        elif name == "button":
+            button, _, reaction = value.partition(":")
+            event["button"] = button
+            event["reaction_ms"] = int(reaction)
+        elif name == "button_timeout":
+            event["button"] = value
+        elif name == "temp":
+            event["celsius"] = int(value)
+        elif name == "mark":
+            event["label"] = value
+        elif name in ("done", "stopped"):
+            event["elapsed_ms"] = int(value)
+        elif name == "error":
+            reason, _, instruction = value.partition(":")
+            event["reason"] = reason
+            if instruction:
+                event["instruction"] = int(instruction)
+    except ValueError:
+        event["value"] = value
+    return event
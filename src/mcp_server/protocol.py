@@ -5,6 +5,7 @@ This module defines the command and response formats used for serial
 communication between the MCP server and the micro:bit device.
 """
 
+import re
 import unicodedata
 
 # Command formats sent to micro:bit
@@ -15,6 +16,56 @@ class Commands:
     WAIT_BUTTON = "WAIT_BUTTON:"
     DISPLAY = "DISPLAY:"
     MUSIC = "MUSIC:"
+    STREAM = "STREAM:"
+    PROTO = "PROTO:"
+    ANIMATION = "ANIM:"
+    ANIMATION_FRAMES = "ANIM_ADD:"
+    MELODY = "MELODY:"
+    PLAY_ID = "PLAY_ID:"
+    MELODIES = "MELODIES:"
+    EVENTS = "EVENTS:"
+    PING = "PING:"
+    FLOW = "FLOW:"
+    IDENTIFY = "IDENTIFY:"
+    CANCEL = "CANCEL:"
+    PROGRAM = "PROG:"
+
+# Commands that leave something running on the micro:bit (a button wait, a
+# scroll or animation, music, a program), which CANCEL: stops when the
+# host gives up
+CANCELLABLE_COMMANDS = (
+    Commands.WAIT_BUTTON,
+    Commands.MESSAGE,
+    Commands.ANIMATION,
+    Commands.MUSIC,
+    Commands.MELODY,
+    Commands.PLAY_ID,
+    Commands.PROGRAM,
+)
+
+# Size of the firmware's receive buffer: a command line longer than this,
+# sequence envelope and newline included, is discarded and answered with
+# STATUS|error:command_too_long
+MAX_LINE_BYTES = 512
+
+# Animation frames the micro:bit can hold, and frames sent per command so
+# each one fits a binary frame and the firmware's receive buffer
+MAX_ANIMATION_FRAMES = 64
+ANIMATION_CHUNK_FRAMES = 16
+
+# display.scroll's delay per column and music's default tempo on the micro:bit
+SCROLL_DELAY_MS = 150
+MUSIC_TEMPO_BPM = 120
+MUSIC_TICKS_PER_BEAT = 4
+
+_IMAGE_PATTERN = re.compile(r"^[0-9]{5}(:[0-9]{5}){4}$")
+
+# A note the host can validate: name, optional accidental, octave and duration
+NOTE_PATTERN = re.compile(r"^([A-Ga-gRr])([#b]?)(\d?)(?::(\d+))?$")
+
+# Optional request correlation envelope: "#<seq>#" prefixed to a command,
+# echoed back by the micro:bit on every reply to that command
+SEQUENCE_MARKER = "#"
 
 # Response formats received from micro:bit
 class Responses:
@@ -22,6 +73,8 @@ class Responses:
     TEMP = "TEMP|"
     BUTTON = "BUTTON|"
     BUTTON_TIMEOUT = "BUTTON_TIMEOUT|"
+    SAMPLE = "SAMPLE|"
+    CREDIT = "CREDIT|"
 
 def parse_temperature_response(response: str) -> dict:
     """
@@ -72,6 +125,32 @@ def parse_button_response(response: str) -> dict:
         "timestamp": int(parts[3])
     }
 
+def parse_status_response(response: str) -> dict:
+    """
+    Parse status response from micro:bit.
+    
+    Format: STATUS|message|timestamp
+    
+    Args:
+        response: Raw response string from micro:bit
+        
+    Returns:
+        Dictionary with message and timestamp
+    """
+    if not response.startswith(Responses.STATUS):
+        raise ValueError(f"Invalid status response: {response}")
+    
+    # The message may itself contain "|" (e.g. a displayed text), so the
+    # timestamp is taken from the right-hand side
+    message, separator, timestamp = response[len(Responses.STATUS):].rpartition("|")
+    if not separator:
+        raise ValueError(f"Malformed status response: {response}")
+    
+    return {
+        "message": message,
+        "timestamp": int(timestamp)
+    }
+
 def parse_button_timeout_response(response: str) -> dict:
     """
     Parse button timeout response from micro:bit.
@@ -96,6 +175,113 @@ def parse_button_timeout_response(response: str) -> dict:
         "timeout_duration": float(parts[2])
     }
 
+def parse_sample_response(response: str) -> dict:
+    """
+    Parse streamed sensor sample from micro:bit.
+    
+    Format: SAMPLE|sensor|value|timestamp
+    
+    Args:
+        response: Raw response string from micro:bit
+        
+    Returns:
+        Dictionary with sensor, value, and timestamp
+    """
+    if not response.startswith(Responses.SAMPLE):
+        raise ValueError(f"Invalid sample response: {response}")
+    
+    parts = response.split("|")
+    if len(parts) < 4:
+        raise ValueError(f"Malformed sample response: {response}")
+    
+    return {
+        "sensor": parts[1],
+        "value": float(parts[2]),
+        "timestamp": int(parts[3])
+    }
+
+def parse_credit_response(response: str) -> dict:
+    """
+    Parse a flow control credit from micro:bit.
+    
+    Format: CREDIT|consumed
+    
+    Args:
+        response: Raw response string from micro:bit
+        
+    Returns:
+        Dictionary with the number of command bytes the micro:bit has taken
+        out of its receive buffer since FLOW:, modulo 65536
+    """
+    if not response.startswith(Responses.CREDIT):
+        raise ValueError(f"Invalid credit response: {response}")
+    
+    parts = response.split("|")
+    if len(parts) < 2:
+        raise ValueError(f"Malformed credit response: {response}")
+    
+    return {
+        "consumed": int(parts[1])
+    }
+
+# Parser for each response type, keyed by response prefix
+RESPONSE_PARSERS = {
+    Responses.STATUS: parse_status_response,
+    Responses.TEMP: parse_temperature_response,
+    Responses.BUTTON: parse_button_response,
+    Responses.BUTTON_TIMEOUT: parse_button_timeout_response,
+    Responses.SAMPLE: parse_sample_response,
+    Responses.CREDIT: parse_credit_response,
+}
+
+def split_sequence(line: str) -> tuple[int | None, str]:
+    """
+    Split the optional sequence envelope off a command or response line.
+    
+    Format: #seq#payload
+    
+    Args:
+        line: Raw line, with or without a sequence envelope
+        
+    Returns:
+        Tuple of the sequence number (None if absent) and the payload
+    """
+    if not line.startswith(SEQUENCE_MARKER):
+        return None, line
+    
+    end = line.find(SEQUENCE_MARKER, 1)
+    if end < 0:
+        return None, line
+    
+    try:
+        return int(line[1:end]), line[end + 1:]
+    except ValueError:
+        return None, line
+
+def parse_response(response: str) -> tuple[str, dict]:
+    """
+    Parse any response line from micro:bit.
+    
+    Args:
+        response: Raw response string from micro:bit
+        
+    Returns:
+        Tuple of the response type (one of the Responses prefixes) and
+        the parsed response data
+        
+    Raises:
+        ValueError: If the response type is unknown or malformed
+    """
+    kind = response.split("|", 1)[0] + "|"
+    parser = RESPONSE_PARSERS.get(kind)
+    if parser is None:
+        raise ValueError(f"Unknown response: {response}")
+    return kind, parser(response)
+
+def format_sequenced_command(seq: int, command: str) -> str:
+    """Wrap a command in a sequence envelope so its replies can be correlated."""
+    return f"{SEQUENCE_MARKER}{seq}{SEQUENCE_MARKER}{command}"
+
 def format_message_command(message: str) -> str:
     """Format a message command for the micro:bit."""
     # Try to transliterate unicode to ASCII equivalents, then filter
@@ -114,7 +300,9 @@ def format_message_command(message: str) -> str:
     return f"{Commands.MESSAGE}{ascii_message}"
 
 def format_image_command(image: str) -> str:
-    """Format an image command for the micro:bit."""
+    """Format an image command for the micro:bit; the pattern is checked here, as Image() on the board would reject it."""
+    if not _IMAGE_PATTERN.match(image):
+        raise ValueError(f"Invalid image: {image!r}, expected 5 rows of 5 digits separated by colons")
     return f"{Commands.IMAGE}{image}"
 
 def format_temperature_command() -> str:
@@ -130,3 +318,75 @@ def format_music_command(notes: list) -> str:
     # Join notes with comma separator
     notes_str = ",".join(notes)
     return f"{Commands.MUSIC}{notes_str}"
+
+def format_melody_command(melody_id: str, notes: list) -> str:
+    """Format a command storing a melody on the micro:bit under an ID and playing it."""
+    return f"{Commands.MELODY}{melody_id}:{','.join(notes)}"
+
+def format_play_id_command(melody_id: str) -> str:
+    """Format a command playing a melody the micro:bit has stored."""
+    return f"{Commands.PLAY_ID}{melody_id}"
+
+def format_melodies_command() -> str:
+    """Format a command listing the melodies the micro:bit has stored."""
+    return Commands.MELODIES
+
+def format_events_command(enabled: bool) -> str:
+    """Format a command turning the micro:bit's unsolicited button events on or off."""
+    return f"{Commands.EVENTS}{'on' if enabled else 'off'}"
+
+def format_ping_command() -> str:
+    """Format a command the micro:bit echoes at once with a timestamped STATUS|pong."""
+    return Commands.PING
+
+def format_flow_command() -> str:
+    """Format a command turning on flow control; the micro:bit answers STATUS|flow:capacity."""
+    return Commands.FLOW
+
+def format_identify_command() -> str:
+    """Format a command the micro:bit answers with STATUS|identify:board_id:version:capabilities."""
+    return Commands.IDENTIFY
+
+def format_cancel_command(seq: int) -> str:
+    """Format a command stopping what the command with a sequence number started; the micro:bit answers STATUS|cancelled:seq:what."""
+    return f"{Commands.CANCEL}{seq}"
+
+def format_stream_command(sensor: str, interval_ms: int) -> str:
+    """Format a command starting (or, with interval 0, stopping) a sensor stream."""
+    return f"{Commands.STREAM}{sensor}:{interval_ms}"
+
+def format_protocol_command(encoding: str) -> str:
+    """Format a command choosing the micro:bit's reply encoding ("text" or "bin")."""
+    return f"{Commands.PROTO}{encoding}"
+
+def _animation_frames(frames: list[str]) -> str:
+    """Join image patterns into the animation wire format: 25 digits per frame, comma separated."""
+    for frame in frames:
+        if not _IMAGE_PATTERN.match(frame):
+            raise ValueError(f"Invalid animation frame: {frame}")
+    return ",".join(frame.replace(":", "") for frame in frames)
+
+def format_animation_frames_command(index: int, frames: list[str]) -> str:
+    """Format a command staging animation frames on the micro:bit, starting at frame index."""
+    return f"{Commands.ANIMATION_FRAMES}{index}:{_animation_frames(frames)}"
+
+def format_animation_command(frames: list[str], frame_delay_ms: int, loops: int, staged: int = 0) -> str:
+    """Format a command playing the staged frames (staged of them) followed by frames (loops 0 repeats forever)."""
+    return f"{Commands.ANIMATION}{frame_delay_ms}:{loops}:{staged}:{_animation_frames(frames)}"
+
+def scroll_seconds(message: str) -> float:
+    """Approximate time the micro:bit takes to scroll a message: 5 columns plus a gap per character."""
+    return len(message) * 6 * SCROLL_DELAY_MS / 1000
+
+def music_seconds(notes: list[str]) -> float:
+    """Time the micro:bit takes to play notes at the default tempo, durations sticky between notes."""
+    duration = 4
+    ticks = 0
+    for note in notes:
+        if ":" in note:
+            try:
+                duration = int(note.split(":")[1])
+            except ValueError:
+                pass
+        ticks += duration
+    return ticks * 60 / (MUSIC_TEMPO_BPM * MUSIC_TICKS_PER_BEAT)
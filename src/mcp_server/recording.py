@@ -0,0 +1,480 @@
+"""
+Recording and replay of serial traffic with the micro:bit.
+
+A Recorder appends every chunk of bytes read from and written to each
+board's serial link to a file, with microsecond timestamps. A Replay reads
+such a file back and stands in for the serial ports: each board's reader
+receives the recorded bytes again, either with their original timing or as
+fast as possible, so production slowdowns and races can be reproduced
+offline and performance regressions measured against real traffic.
+
+The format is append-only. After an 8-byte header, each record is
+
+    <delta_us varint> <kind byte> <stream byte> <length varint> <payload>
+
+where delta_us is the time since the previous record and stream numbers the
+boards of one session. A START record (payload: epoch microseconds) begins
+every session, and an OPEN record (payload: the device ID) every connection,
+so several sessions can be appended to the same file.
+
+Replay is causal: the client's writes are split into commands (lines and
+frames, however flow control chunked them), each is matched to the next
+recorded command of the same kind, and a recorded read is only delivered
+once the commands before it have been matched, so a reply never overtakes
+the request that caused it. Replies get the sequence numbers of the
+client's requests rather than the recorded ones, and flow control credits
+are issued for the client's own writes, as they are read at once. Recorded commands the client doesn't send (e.g.
+timer-driven pings) are passed over when a later one matches, and a read
+still waiting after a stall timeout is delivered anyway.
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Iterator, Optional
+
+from .framing import FRAME_START
+from .protocol import Commands, Responses
+
+HEADER = b"MBREC01\n"
+
+# Record kinds
+START = 0
+OPEN = 1
+RECEIVED = 2
+SENT = 3
+CLOSED = 4
+
+# Seconds between flushes of the recording file
+FLUSH_INTERVAL = 1.0
+
+# Recorded writes looked ahead of the last matched one for a client write
+MATCH_WINDOW = 256
+
+_SEQUENCE_ENVELOPE = re.compile(rb"^#\d+#")
+
+# Flow control command, and the credit replies counting the bytes read after it
+_FLOW_COMMAND = Commands.FLOW.encode()
+_FLOW_REPLY = re.compile(rb"^(#\d+#)?" + re.escape(Responses.STATUS.encode()) + rb"flow:")
+_CREDIT_PREFIX = Responses.CREDIT.encode()
+
+
+def _varint(value: int) -> bytes:
+    """Encode an unsigned integer in 7-bit groups, least significant first."""
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append(value & 0x7F | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _read_varint(data: bytes, position: int) -> tuple[int, int]:
+    """Decode a varint at position; returns the value and the position after it."""
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+class RecordingStream:
+    """One board's side of a recording; handed to its MicrobitClient."""
+
+    def __init__(self, recorder: "Recorder", stream: int, name: str):
+        self.recorder = recorder
+        self.stream = stream
+        self.name = name
+
+    def opened(self) -> None:
+        """Record that the serial link was opened."""
+        self.recorder.record(OPEN, self.stream, self.name.encode())
+
+    def received(self, data: bytes) -> None:
+        """Record bytes read from the board."""
+        self.recorder.record(RECEIVED, self.stream, data)
+
+    def sent(self, data: bytes) -> None:
+        """Record bytes written to the board."""
+        self.recorder.record(SENT, self.stream, data)
+
+    def closed(self) -> None:
+        """Record that the serial link closed or dropped."""
+        self.recorder.record(CLOSED, self.stream)
+
+
+class Recorder:
+    """Append-only log of the serial traffic of every board."""
+
+    def __init__(self, path: str):
+        """
+        Open a recording file, appending a new session to it.
+
+        Args:
+            path: File to append to; created with a header if missing or empty
+
+        Raises:
+            ValueError: If the file exists but isn't a recording
+        """
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as file:
+                if file.read(len(HEADER)) != HEADER:
+                    raise ValueError(f"Not a micro:bit recording: {path}")
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(HEADER)
+        self._streams: list[str] = []
+        self._last = time.perf_counter_ns() // 1000
+        self._flushed = time.monotonic()
+        self.record(START, 0, (time.time_ns() // 1000).to_bytes(8, "little"))
+
+    def stream(self, name: str) -> RecordingStream:
+        """
+        Get the recording stream of a board.
+
+        Args:
+            name: Device ID the stream is replayed under
+
+        Returns:
+            Stream to pass to the board's MicrobitClient
+        """
+        if len(self._streams) > 0xFF:
+            raise ValueError("A recording holds at most 256 devices")
+        self._streams.append(name)
+        return RecordingStream(self, len(self._streams) - 1, name)
+
+    def record(self, kind: int, stream: int, payload: bytes = b"") -> None:
+        """
+        Append a record.
+
+        Args:
+            kind: Record kind (START, OPEN, RECEIVED, SENT or CLOSED)
+            stream: Stream number of the board
+            payload: Record data
+        """
+        if self._file.closed:
+            return
+        now = time.perf_counter_ns() // 1000
+        self._file.write(
+            _varint(now - self._last) + bytes([kind, stream]) + _varint(len(payload)) + payload
+        )
+        self._last = now
+        if time.monotonic() - self._flushed >= FLUSH_INTERVAL:
+            self._file.flush()
+            self._flushed = time.monotonic()
+
+    def close(self) -> None:
+        """Flush and close the recording file."""
+        self._file.close()
+
+
+def read_recording(path: str) -> Iterator[tuple[float, int, str, bytes]]:
+    """
+    Read the records of a recording.
+
+    Args:
+        path: Recording file
+
+    Yields:
+        Tuples of the seconds since the start of the record's session, the
+        record kind, the device ID and the payload. START records are
+        consumed, and the records of every session follow each other.
+
+    Raises:
+        ValueError: If the file isn't a recording
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if not data.startswith(HEADER):
+        raise ValueError(f"Not a micro:bit recording: {path}")
+
+    position = len(HEADER)
+    elapsed = 0
+    names: dict[int, str] = {}
+    # A recording cut off mid-record (e.g. by a crash) ends at the last complete one
+    while position < len(data):
+        try:
+            delta, position = _read_varint(data, position)
+            kind, stream = data[position], data[position + 1]
+            length, position = _read_varint(data, position + 2)
+        except IndexError:
+            break
+        payload = data[position:position + length]
+        if len(payload) < length:
+            break
+        position += length
+
+        if kind == START:
+            elapsed = 0
+            names = {}
+            continue
+        elapsed += delta
+        if kind == OPEN:
+            names[stream] = payload.decode()
+        yield elapsed / 1e6, kind, names.get(stream, str(stream)), payload
+
+
+def _split_units(buffer: bytearray) -> list[bytes]:
+    """Take every complete line and binary frame off the front of buffer."""
+    units = []
+    while buffer:
+        if buffer[0] == FRAME_START:
+            if len(buffer) < 2 or len(buffer) < 2 + buffer[1]:
+                break
+            end = 2 + buffer[1]
+        else:
+            end = buffer.find(b"\n") + 1
+            if not end:
+                break
+        units.append(bytes(buffer[:end]))
+        del buffer[:end]
+    return units
+
+
+def _without_sequence(data: bytes) -> bytes:
+    """Command bytes with the sequence number blanked, to compare replayed writes."""
+    if data[:1] == bytes([FRAME_START]) and len(data) >= 5:
+        return data[:3] + b"\0\0" + data[5:]
+    return _SEQUENCE_ENVELOPE.sub(b"##", data)
+
+
+def _sequence(data: bytes) -> Optional[int]:
+    """Sequence number of a command, line or frame, or None if it has none."""
+    if data[:1] == bytes([FRAME_START]):
+        return (data[3] | data[4] << 8 or None) if len(data) >= 5 else None
+    match = _SEQUENCE_ENVELOPE.match(data)
+    return int(match.group()[1:-1]) if match else None
+
+
+class _ReplayWriter:
+    """Writer half of a replayed link: hands the client's writes to the link."""
+
+    def __init__(self, link: "_ReplayLink"):
+        self.link = link
+
+    def write(self, data: bytes) -> None:
+        self.link.written(data)
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.link.close()
+
+    async def wait_closed(self) -> None:
+        pass
+
+
+class _ReplayLink:
+    """One recorded connection, played back into a StreamReader."""
+
+    def __init__(self, replay: "Replay", events: list[tuple[float, int, bytes]]):
+        self.replay = replay
+        self.reader = asyncio.StreamReader()
+        self.writer = _ReplayWriter(self)
+        # Recorded commands, and the recorded reads and closes with the
+        # number of commands written before each
+        self._expected: list[bytes] = []
+        self._events: list[tuple[float, int, bytes, int]] = []
+        sent = bytearray()
+        for offset, kind, payload in events:
+            if kind == SENT:
+                sent += payload
+                self._expected += _split_units(sent)
+            else:
+                self._events.append((offset, kind, payload, len(self._expected)))
+        # Recorded commands matched by a client command, or passed over by one
+        self._matched = 0
+        # Recorded sequence number -> the client's, for the replies
+        self._sequences: dict[int, int] = {}
+        # Starts of a command split across client writes, and of a line or
+        # frame split across recorded reads
+        self._written = bytearray()
+        self._partial = bytearray()
+        # Bytes the client has written, in total, up to its last complete
+        # command and up to its last FLOW:
+        self._bytes_written = 0
+        self._commands_end = 0
+        self._flow_end = 0
+        # Whether the client was told the window, and is sent credits
+        self._flow_control = False
+        self._write_event = asyncio.Event()
+        self._task = asyncio.create_task(self._play())
+
+    def written(self, data: bytes) -> None:
+        """Match each command the client writes to the next recorded one with the same command."""
+        self._written += data
+        self._bytes_written += len(data)
+        for unit in _split_units(self._written):
+            self._commands_end += len(unit)
+            self._match(unit)
+        if self._flow_control:
+            self.reader.feed_data(self._credit())
+
+    def _match(self, unit: bytes) -> None:
+        self.replay.writes += 1
+        command = _without_sequence(unit)
+        if _SEQUENCE_ENVELOPE.sub(b"", unit).strip() == _FLOW_COMMAND:
+            self._flow_end = self._commands_end
+        for index in range(self._matched, min(self._matched + MATCH_WINDOW, len(self._expected))):
+            if _without_sequence(self._expected[index]) == command:
+                # Recorded commands the client didn't send, e.g. timer-driven pings
+                self.replay.skipped_writes += index - self._matched
+                recorded, sequence = _sequence(self._expected[index]), _sequence(unit)
+                if recorded is not None and sequence is not None:
+                    self._sequences[recorded] = sequence
+                self._matched = index + 1
+                self._write_event.set()
+                return
+        self.replay.unmatched_writes += 1
+
+    def _credit(self) -> bytes:
+        """Credit for every byte the client has written since FLOW:, which replay reads at once."""
+        return _CREDIT_PREFIX + b"%d\r\n" % ((self._bytes_written - self._flow_end) & 0xFFFF)
+
+    def _translate(self, data: bytes) -> bytes:
+        """Give recorded replies the sequence numbers of the client's requests, and credit its own writes."""
+        self._partial += data
+        translated = bytearray()
+        for unit in _split_units(self._partial):
+            recorded = _sequence(unit)
+            if recorded in self._sequences:
+                if unit[0] == FRAME_START:
+                    unit = unit[:3] + self._sequences[recorded].to_bytes(2, "little") + unit[5:]
+                else:
+                    unit = _SEQUENCE_ENVELOPE.sub(b"#%d#" % self._sequences[recorded], unit)
+            if unit.startswith(_CREDIT_PREFIX):
+                # Recorded credits count the recorded writes, which were
+                # chunked (and numbered) differently; the replay sends its own
+                continue
+            translated += unit
+            if _FLOW_REPLY.match(unit):
+                self._flow_control = True
+                translated += self._credit()
+        return bytes(translated)
+
+    async def _wait_for_writes(self, count: int) -> None:
+        while self._matched < count:
+            self._write_event.clear()
+            await self._write_event.wait()
+
+    async def _play(self) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for offset, kind, payload, writes in self._events:
+            if self.replay.timing == "original":
+                await asyncio.sleep(max(start + offset / self.replay.speed - loop.time(), 0))
+            try:
+                await asyncio.wait_for(self._wait_for_writes(writes), timeout=self.replay.stall_timeout)
+            except asyncio.TimeoutError:
+                self.replay.stalls += 1
+            if kind == RECEIVED:
+                self.reader.feed_data(self._translate(payload))
+                self.replay.chunks += 1
+            elif kind == CLOSED:
+                self.reader.feed_eof()
+                return
+        # The recording ends with the link still up: the board goes quiet
+
+    def close(self) -> None:
+        self._task.cancel()
+
+
+class Replay:
+    """Recorded serial traffic standing in for the boards' serial ports."""
+
+    def __init__(self, path: str, timing: str = "original", speed: float = 1.0, stall_timeout: float = 5.0):
+        """
+        Load a recording.
+
+        Args:
+            path: Recording file
+            timing: "original" to deliver reads at their recorded times, or
+                "fast" to deliver them as soon as the client's writes allow
+            speed: Playback speed factor with original timing
+            stall_timeout: Seconds a read waits for the client to make the
+                writes that preceded it before it is delivered anyway
+
+        Raises:
+            ValueError: If the file isn't a recording or the timing is unknown
+        """
+        if timing not in ("original", "fast"):
+            raise ValueError(f"Unknown replay timing: {timing}")
+        self.path = path
+        self.timing = timing
+        self.speed = speed
+        self.stall_timeout = stall_timeout
+        self.chunks = 0
+        self.writes = 0
+        self.unmatched_writes = 0
+        self.skipped_writes = 0
+        self.stalls = 0
+
+        # Per device, its connections in order: (offset from the connection
+        # being opened, kind, payload) for every record after OPEN
+        self._links: dict[str, list[list[tuple[float, int, bytes]]]] = {}
+        opened: dict[str, float] = {}
+        for offset, kind, name, payload in read_recording(path):
+            if kind == OPEN:
+                opened[name] = offset
+                self._links.setdefault(name, []).append([])
+            elif name in opened:
+                self._links[name][-1].append((offset - opened[name], kind, payload))
+                if kind == CLOSED:
+                    del opened[name]
+        # A recording ends with the client closing its links, not with the
+        # boards dropping them
+        for links in self._links.values():
+            if links[-1] and links[-1][-1][1] == CLOSED:
+                links[-1].pop()
+
+    @property
+    def devices(self) -> list[str]:
+        """IDs of the devices in the recording, in the order they first connected."""
+        return list(self._links)
+
+    def connector(self, device_id: str):
+        """
+        Get a replacement for serial_asyncio.open_serial_connection for one device.
+
+        Each call opens the device's next recorded connection.
+
+        Args:
+            device_id: Device ID as recorded
+
+        Returns:
+            Coroutine function accepting (and ignoring) the serial options and
+            returning a (reader, writer) pair
+        """
+
+        async def open_connection(**kwargs) -> tuple:
+            links = self._links.get(device_id)
+            if not links:
+                raise Exception(f"No more recorded connections for {device_id}")
+            link = _ReplayLink(self, links.pop(0))
+            return link.reader, link.writer
+
+        return open_connection
+
+    def describe(self) -> dict:
+        """
+        Summarize the replay so far.
+
+        Returns:
+            Dictionary with the reads delivered, the client's writes, how
+            many of those matched no recorded write, how many recorded
+            writes the client never made, and how many reads were
+            delivered after a stall
+        """
+        return {
+            "chunks": self.chunks,
+            "writes": self.writes,
+            "unmatched_writes": self.unmatched_writes,
+            "skipped_writes": self.skipped_writes,
+            "stalls": self.stalls
+        }
@@ -0,0 +1,286 @@
+"""
+Priority scheduling of commands waiting for the serial link.
+
+While the board's credits (see flow control in microbit_client.py) hold
+commands back, something has to decide which goes out next. Every command
+is tagged with the device resource it uses (display, speaker, sensors,
+buttons, or the link itself for protocol commands) and a priority class.
+Each resource keeps its commands in order, and across resources the most
+urgent command at the head of a queue goes first (the oldest on a tie), so
+a queue of display updates doesn't hold up an interactive TEMP:, and a
+long MELODY: upload doesn't hold up an IMAGE:.
+
+Commands whose effect the next command of the same kind replaces on the
+board (a new image or message replaces what is on the display, new music
+stops the old) supersede an older one still queued for the same resource,
+which is then never written: at most one display update and one tune
+wait at a time, so what the board shows stays close to the newest
+request however fast updates arrive. Commands staging data for the
+replacing command queued right after them (ANIM_ADD: frames for their
+ANIM:) are superseded along with it, so the board never stages frames
+for an animation that won't play. A command submitted with coalescing
+off neither supersedes nor is superseded. A command whose request is
+abandoned before it goes out is withdrawn, so it takes no device time.
+
+The time every command spends queued is recorded per class, against a
+latency target, for the metrics.
+"""
+
+import collections
+import itertools
+import time
+from typing import Optional
+
+from .metrics import LatencyHistogram
+from .protocol import Commands, split_sequence
+
+
+class Resources:
+    DISPLAY = "display"
+    SPEAKER = "speaker"
+    SENSORS = "sensors"
+    BUTTONS = "buttons"
+    LINK = "link"
+
+
+# Priority classes, most urgent first
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+PRIORITY_NAMES = ("interactive", "normal", "background")
+
+# Seconds a command of each class should wait for the link at most
+LATENCY_TARGETS = {INTERACTIVE: 0.05, NORMAL: 0.25, BACKGROUND: 1.0}
+
+# Command prefix -> (resource, priority, replaces): replaces marks commands
+# that make an older queued command of the same resource pointless
+COMMAND_CLASSES = {
+    Commands.FLOW: (Resources.LINK, INTERACTIVE, False),
+    Commands.PROTO: (Resources.LINK, INTERACTIVE, False),
+    Commands.PING: (Resources.LINK, INTERACTIVE, False),
+    Commands.IDENTIFY: (Resources.LINK, INTERACTIVE, False),
+    Commands.CANCEL: (Resources.LINK, INTERACTIVE, False),
+    Commands.MELODIES: (Resources.LINK, NORMAL, False),
+    Commands.TEMP: (Resources.SENSORS, INTERACTIVE, False),
+    Commands.STREAM: (Resources.SENSORS, BACKGROUND, False),
+    Commands.WAIT_BUTTON: (Resources.BUTTONS, INTERACTIVE, False),
+    Commands.EVENTS: (Resources.BUTTONS, INTERACTIVE, False),
+    Commands.MESSAGE: (Resources.DISPLAY, NORMAL, True),
+    Commands.IMAGE: (Resources.DISPLAY, NORMAL, True),
+    Commands.DISPLAY: (Resources.DISPLAY, NORMAL, True),
+    Commands.ANIMATION: (Resources.DISPLAY, NORMAL, True),
+    # Staged frames only take effect with the ANIM: that follows them
+    Commands.ANIMATION_FRAMES: (Resources.DISPLAY, NORMAL, False),
+    Commands.MUSIC: (Resources.SPEAKER, NORMAL, True),
+    Commands.MELODY: (Resources.SPEAKER, NORMAL, True),
+    Commands.PLAY_ID: (Resources.SPEAKER, NORMAL, True),
+    # A program drives the display among other things, and is never skipped
+    Commands.PROGRAM: (Resources.DISPLAY, NORMAL, False),
+}
+
+# Commands that only stage data for the command queued right after them,
+# and go when it is superseded
+STAGING_COMMANDS = (Commands.ANIMATION_FRAMES,)
+
+# Commands nobody classified share the link's queue
+DEFAULT_CLASS = (Resources.LINK, NORMAL, False)
+
+# Status message a request resolves with when a newer command superseded it
+SUPERSEDED = "superseded"
+
+
+def classify(line: str) -> tuple[str, int, bool]:
+    """
+    Resource, priority and whether it replaces older queued commands, for a command line.
+
+    Args:
+        line: Command line, with or without a sequence envelope
+
+    Returns:
+        Tuple of the resource, the priority class and the replaces flag
+    """
+    _, command = split_sequence(line)
+    return COMMAND_CLASSES.get(command.partition(":")[0] + ":", DEFAULT_CLASS)
+
+
+def _stages(command: "ScheduledCommand") -> bool:
+    """Whether a command only stages data for the command after it."""
+    return split_sequence(command.line)[1].startswith(STAGING_COMMANDS)
+
+
+class ScheduledCommand:
+    """A command line waiting for the link, and what became of it."""
+
+    def __init__(self, line: str, data: bytes, future, resource: str, priority: int, replaces: bool, order: int):
+        """
+        Initialize a scheduled command.
+
+        Args:
+            line: Command line as given (for the flow control mark)
+            data: Bytes to write, text or a binary frame
+            future: Future of the request the command belongs to, or None
+            resource: Device resource the command uses
+            priority: Priority class
+            replaces: Whether it supersedes older queued commands of its resource
+            order: Submission order, breaking ties between equal priorities
+        """
+        self.line = line
+        self.data = data
+        self.future = future
+        self.resource = resource
+        self.priority = priority
+        self.replaces = replaces
+        self.order = order
+        self.queued = time.monotonic()
+        # Bytes of data written so far, and how it ended
+        self.offset = 0
+        self.written = False
+        self.superseded = False
+        self.dropped = False
+        self.withdrawn = False
+
+    @property
+    def done(self) -> bool:
+        """Whether the command no longer waits for the link."""
+        return self.written or self.superseded or self.dropped or self.withdrawn
+
+
+class CommandScheduler:
+    """Per-resource queues of commands, released by priority."""
+
+    def __init__(self, latency_targets: Optional[dict[int, float]] = None):
+        """
+        Initialize the scheduler.
+
+        Args:
+            latency_targets: Seconds each priority class should wait at most,
+                overriding LATENCY_TARGETS
+        """
+        self.latency_targets = {**LATENCY_TARGETS, **(latency_targets or {})}
+        self.queues: dict[str, collections.deque[ScheduledCommand]] = {}
+        self._order = itertools.count()
+        # Per class: time from submission to the last byte written, and
+        # commands over target; per resource: commands superseded
+        self.queue_latency = {priority: LatencyHistogram() for priority in self.latency_targets}
+        self.over_target = {priority: 0 for priority in self.latency_targets}
+        self.superseded: dict[str, int] = {}
+
+    def submit(
+        self,
+        line: str,
+        data: bytes,
+        future=None,
+        coalesce: bool = True
+    ) -> tuple[ScheduledCommand, list[ScheduledCommand]]:
+        """
+        Queue a command.
+
+        Args:
+            line: Command line
+            data: Bytes to write for it
+            future: Future of the request it belongs to, or None
+            coalesce: Let the command supersede, and be superseded by, other
+                commands of its kind (for those that replace each other)
+
+        Returns:
+            Tuple of the queued command and the older commands it superseded
+        """
+        resource, priority, replaces = classify(line)
+        replaces = replaces and coalesce
+        command = ScheduledCommand(line, data, future, resource, priority, replaces, next(self._order))
+        queue = self.queues.setdefault(resource, collections.deque())
+        superseded = []
+        if replaces:
+            for index, queued in enumerate(queue):
+                if not queued.replaces:
+                    continue
+                # The run of staging commands just before it belongs to it
+                start = index
+                while start > 0 and _stages(queue[start - 1]):
+                    start -= 1
+                superseded += [queue[i] for i in range(start, index + 1)]
+            for queued in superseded:
+                queue.remove(queued)
+                queued.superseded = True
+            self.superseded[resource] = self.superseded.get(resource, 0) + len(superseded)
+        queue.append(command)
+        return command, superseded
+
+    def next(self) -> Optional[ScheduledCommand]:
+        """Take the command to write next, or None if nothing is queued."""
+        heads = [queue[0] for queue in self.queues.values() if queue]
+        if not heads:
+            return None
+        command = min(heads, key=lambda head: (head.priority, head.order))
+        self.queues[command.resource].popleft()
+        return command
+
+    def written(self, command: ScheduledCommand) -> None:
+        """Record that a command's last byte was written."""
+        command.written = True
+        waited = time.monotonic() - command.queued
+        self.queue_latency[command.priority].record(waited)
+        if waited > self.latency_targets[command.priority]:
+            self.over_target[command.priority] += 1
+
+    def withdraw(self, command: ScheduledCommand) -> bool:
+        """
+        Take back a command whose request was abandoned.
+
+        Args:
+            command: The scheduled command
+
+        Returns:
+            True if it was still queued and won't be written
+        """
+        queue = self.queues.get(command.resource)
+        if not queue or command not in queue:
+            return False
+        queue.remove(command)
+        command.withdrawn = True
+        return True
+
+    def clear(self) -> list[ScheduledCommand]:
+        """Drop every queued command (the link is gone) and return them."""
+        dropped = [command for queue in self.queues.values() for command in queue]
+        for command in dropped:
+            command.dropped = True
+        self.queues.clear()
+        return dropped
+
+    def queued_bytes(self) -> int:
+        """Bytes of the commands still queued."""
+        return sum(len(command.data) for queue in self.queues.values() for command in queue)
+
+    def stats(self) -> dict:
+        """
+        Get the scheduler's state and latencies.
+
+        Returns:
+            Dictionary with, per priority class, the latency target, the
+            commands queued now, those written over target and a summary of
+            the time commands spent queued; and per resource the commands
+            queued now and the commands superseded
+        """
+        queued = {priority: 0 for priority in self.latency_targets}
+        for queue in self.queues.values():
+            for command in queue:
+                queued[command.priority] += 1
+        return {
+            "classes": {
+                PRIORITY_NAMES[priority]: {
+                    "target_ms": round(target * 1000, 3),
+                    "queued": queued[priority],
+                    "over_target": self.over_target[priority],
+                    "queue_latency": self.queue_latency[priority].summary()
+                }
+                for priority, target in self.latency_targets.items()
+            },
+            "resources": {
+                resource: {
+                    "queued": len(self.queues.get(resource, ())),
+                    "superseded": self.superseded.get(resource, 0)
+                }
+                for resource in sorted(set(self.queues) | set(self.superseded))
+            }
+        }
@@ -0,0 +1,124 @@
+"""
+Host-side storage for streamed sensor samples.
+
+This module keeps the most recent samples pushed by the micro:bit's
+streaming mode in fixed-size typed arrays, so tools can answer "latest"
+and windowed aggregate queries from memory instead of asking the device.
+"""
+
+import time
+from array import array
+from typing import Optional
+
+
+class SampleRingBuffer:
+    """Fixed-capacity ring buffer of timestamped sensor samples."""
+
+    def __init__(self, capacity: int = 3600):
+        """
+        Initialize the ring buffer.
+
+        Args:
+            capacity: Maximum number of samples kept; the oldest are overwritten
+        """
+        self.capacity = capacity
+        self._host_times = array("d", bytes(8 * capacity))
+        self._device_times = array("q", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, value: float, device_timestamp: int, host_time: Optional[float] = None) -> None:
+        """
+        Store a sample, overwriting the oldest one when full.
+
+        Args:
+            value: Sensor reading
+            device_timestamp: micro:bit running_time() in milliseconds
+            host_time: Host epoch time the sample was received (default: now)
+        """
+        index = self._next
+        self._host_times[index] = time.time() if host_time is None else host_time
+        self._device_times[index] = device_timestamp
+        self._values[index] = value
+        self._next = (index + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _newest_first(self):
+        """Yield buffer indices from the newest sample to the oldest."""
+        for offset in range(1, self._count + 1):
+            yield (self._next - offset) % self.capacity
+
+    def latest(self) -> Optional[dict]:
+        """
+        Get the most recent sample.
+
+        Returns:
+            Dictionary with value, timestamp, host_time and age_seconds,
+            or None if no sample has been received
+        """
+        if not self._count:
+            return None
+        index = (self._next - 1) % self.capacity
+        return {
+            "value": self._values[index],
+            "timestamp": self._device_times[index],
+            "host_time": self._host_times[index],
+            "age_seconds": round(time.time() - self._host_times[index], 3)
+        }
+
+    def window(self, seconds: float) -> list[tuple[float, float]]:
+        """
+        Get the samples received in the last window of time.
+
+        Args:
+            seconds: Window length in seconds
+
+        Returns:
+            List of (host_time, value) pairs, oldest first
+        """
+        cutoff = time.time() - seconds
+        samples = []
+        for index in self._newest_first():
+            if self._host_times[index] < cutoff:
+                break
+            samples.append((self._host_times[index], self._values[index]))
+        samples.reverse()
+        return samples
+
+    def aggregate(self, seconds: float) -> dict:
+        """
+        Summarize the samples received in the last window of time.
+
+        Args:
+            seconds: Window length in seconds
+
+        Returns:
+            Dictionary with count, min, max, mean and slope_per_minute (least
+            squares fit; None with fewer than two samples)
+        """
+        samples = self.window(seconds)
+        if not samples:
+            return {"window_seconds": seconds, "count": 0}
+
+        values = [value for _, value in samples]
+        mean = sum(values) / len(values)
+        slope = None
+        if len(samples) > 1:
+            mean_time = sum(t for t, _ in samples) / len(samples)
+            variance = sum((t - mean_time) ** 2 for t, _ in samples)
+            if variance:
+                covariance = sum((t - mean_time) * (v - mean) for t, v in samples)
+                slope = round(covariance / variance * 60, 4)
+
+        return {
+            "window_seconds": seconds,
+            "count": len(values),
+            "min": min(values),
+            "max": max(values),
+            "mean": round(mean, 3),
+            "slope_per_minute": slope
+        }
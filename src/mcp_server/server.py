@@ -7,81 +7,325 @@ between MCP clients and micro:bit devices.
 
 import argparse
 import asyncio
+import json
 import sys
+import time
+from typing import Optional
 import mcp.types as types
 from mcp.server import Server
+from mcp.server.lowlevel.helper_types import ReadResourceContents
 from mcp.server.stdio import stdio_server
 import serial.tools.list_ports
 
-from .microbit_client import MicrobitClient
+from .startup import IMPORT_STARTED
+from .device_pool import ALL_DEVICES, DevicePool, parse_port_spec
+from .discovery import AUTO_PORT, candidate_ports, discover, is_likely_microbit, probe
+from .metrics import LatencyHistogram, dump_periodically, render_prometheus, serve_prometheus
+from .microbit_client import DEFAULT_PORT, MicrobitClient
+from .recording import Recorder, Replay
 from .tools import get_all_tools
+from .tools.batch import handle_batch_tool, tool_error, tool_result
+from .tools.devices import handle_device_tool
 from .tools.display import handle_display_tool
 from .tools.sensors import handle_sensor_tool
 from .tools.input import handle_input_tool
 from .tools.music import handle_music_tool
+from .tools.program import handle_program_tool
+
+# Seconds spent importing the server and its dependencies (mcp, pyserial)
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+# MCP resource with the server's metrics as JSON
+METRICS_URI = "microbit://metrics"
 
 
 class MicrobitMCPServer:
     """MCP Server for micro:bit interaction."""
 
-    def __init__(self, serial_port: str = "/dev/cu.usbmodem211102"):
+    def __init__(
+        self,
+        serial_port: str | list[str] = DEFAULT_PORT,
+        temperature_ttl: float = 1.0,
+        binary_framing: bool = True,
+        tags: Optional[dict[str, tuple]] = None,
+        device_timeout: float = 10.0,
+        recorder: Optional[Recorder] = None,
+        replay: Optional[Replay] = None,
+        flow_control: bool = True,
+        board_cache: Optional[str] = None,
+        probe_all_ports: bool = False
+    ):
         """
         Initialize the micro:bit MCP server.
 
         Args:
-            serial_port: Serial port path for micro:bit connection
+            serial_port: Serial port path for micro:bit connection, or a list
+                of "[ID=]PORT" specs to manage several boards; a port of
+                "auto" is found by probing the serial ports
+            temperature_ttl: Seconds a temperature reading is served from memory
+            binary_framing: Negotiate compact binary frames with the firmware
+            tags: Tags to address groups of devices by, per device ID
+            device_timeout: Seconds to wait for each device when a tool call
+                fans out to several (added to the tool's own timeout, if any)
+            recorder: Log every device's serial traffic to this recording
+            replay: Play recorded traffic back instead of opening the serial
+                ports; devices are matched to the recording by ID
+            flow_control: Negotiate credit-based flow control with the firmware
+            board_cache: File remembering the port of the board found for
+                "auto" (default: discovery.default_cache_path())
+            probe_all_ports: Look for "auto" on every USB serial port, not
+                only those that look like a micro:bit
         """
         self.app = Server("microbit-server")
-        self.microbit_client = MicrobitClient(serial_port)
+        self.device_timeout = device_timeout
+        self.started = time.monotonic()
+        # Seconds from the package import to each startup milestone, None until reached
+        self.startup: dict[str, Optional[float]] = {
+            "imported": round(IMPORT_SECONDS, 3),
+            "serving": None,
+            "first_list_tools": None,
+            "first_tool_call": None,
+            "devices_connected": None
+        }
+        self._connect_task: Optional[asyncio.Task] = None
+        # Built once: list_tools is answered from this without touching a board
+        self.tools = get_all_tools()
+        # Per tool: calls, errors, calls cancelled by the client, calls in
+        # flight and latency
+        self.tool_calls: dict[str, int] = {}
+        self.tool_errors: dict[str, int] = {}
+        self.tool_cancelled: dict[str, int] = {}
+        self.tool_in_flight: dict[str, int] = {}
+        self.tool_latency: dict[str, LatencyHistogram] = {}
+        self.device_pool = DevicePool()
+        for spec in [serial_port] if isinstance(serial_port, str) else serial_port:
+            device_id, port = parse_port_spec(spec)
+            client = MicrobitClient(
+                port,
+                temperature_ttl=temperature_ttl,
+                binary_framing=binary_framing,
+                recording=recorder.stream(device_id) if recorder else None,
+                open_connection=replay.connector(device_id) if replay else None,
+                flow_control=flow_control,
+                locate=(
+                    (lambda: discover(board_cache, all_usb=probe_all_ports)) if port == AUTO_PORT and not replay else None
+                )
+            )
+            self.device_pool.add(device_id, client, (tags or {}).get(device_id, ()))
         self._setup_handlers()
 
+    @property
+    def microbit_client(self) -> MicrobitClient:
+        """Client of the default device."""
+        return self.device_pool.clients[self.device_pool.default_id]
+
+    async def _dispatch_tool(self, name: str, arguments: dict, microbit_client) -> list[types.TextContent]:
+        """Run a device tool against one micro:bit."""
+        # Display tools
+        if name in ["display_message", "display_image", "display_animation"]:
+            return await handle_display_tool(name, arguments, microbit_client)
+
+        # Sensor tools
+        elif name in ["get_temperature", "start_sensor_stream",
+                      "stop_sensor_stream", "get_sensor_stream"]:
+            return await handle_sensor_tool(name, arguments, microbit_client)
+
+        # Input tools
+        elif name in ["wait_for_button_press", "get_button_counts", "get_button_history"]:
+            return await handle_input_tool(name, arguments, microbit_client)
+
+        # Music tools
+        elif name in ["play_music"]:
+            return await handle_music_tool(name, arguments, microbit_client)
+
+        # Program tools
+        elif name in ["run_program", "get_program_events", "stop_program"]:
+            return await handle_program_tool(name, arguments, microbit_client)
+
+        else:
+            raise ValueError(f"Tool not found: {name}")
+
+    async def _fan_out(self, name: str, arguments: dict, targets: list, timeout: float) -> list[types.TextContent]:
+        """Run a device tool on several micro:bits concurrently, with a result per device."""
+
+        async def run(device_id: str, client: MicrobitClient) -> tuple[str, dict]:
+
+            async def connect_and_dispatch() -> list[types.TextContent]:
+                await client.connect()
+                return await self._dispatch_tool(name, arguments, client)
+
+            try:
+                contents = await asyncio.wait_for(connect_and_dispatch(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return device_id, {"ok": False, "error": f"Timed out after {timeout} seconds"}
+            except Exception as e:
+                return device_id, {"ok": False, "error": str(e)}
+
+            result = tool_result(contents)
+            error = tool_error(result)
+            if error is not None:
+                return device_id, {"ok": False, "error": error}
+            return device_id, {"ok": True, "result": result}
+
+        results = await asyncio.gather(*(run(device_id, client) for device_id, client in targets))
+        return [types.TextContent(type="text", text=json.dumps({"devices": dict(results)}))]
+
     def _setup_handlers(self) -> None:
         """Set up MCP server handlers."""
 
         @self.app.list_tools()
         async def list_tools() -> list[types.Tool]:
             """List all available tools."""
-            return get_all_tools()
+            self._mark_startup("first_list_tools")
+            return self.tools
 
         @self.app.call_tool()
         async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
             """Handle tool calls."""
-            # Display tools
-            if name in ["display_message", "display_image"]:
-                return await handle_display_tool(name, arguments, self.microbit_client)
+            return await self._timed_call(name, arguments)
+
+        @self.app.list_resources()
+        async def list_resources() -> list[types.Resource]:
+            """List the server's resources."""
+            return [
+                types.Resource(
+                    uri=METRICS_URI,
+                    name="metrics",
+                    description="Tool call and device command latencies, serial byte counters, errors and queue depths",
+                    mimeType="application/json"
+                )
+            ]
+
+        @self.app.read_resource()
+        async def read_resource(uri) -> list[ReadResourceContents]:
+            """Read one of the server's resources."""
+            if str(uri) != METRICS_URI:
+                raise ValueError(f"Resource not found: {uri}")
+            return [ReadResourceContents(content=json.dumps(self.metrics()), mime_type="application/json")]
+
+    async def _timed_call(self, name: str, arguments: dict) -> list[types.TextContent]:
+        """Make a tool call (from the client or a batch step), counting it in the tool metrics."""
+        if name not in self.tool_latency:
+            self.tool_calls[name] = self.tool_errors[name] = self.tool_cancelled[name] = 0
+            self.tool_in_flight[name] = 0
+            self.tool_latency[name] = LatencyHistogram()
+        self.tool_calls[name] += 1
+        self.tool_in_flight[name] += 1
+        start = time.perf_counter()
+        try:
+            return await self._call_tool(name, arguments)
+        except Exception:
+            self.tool_errors[name] += 1
+            raise
+        except asyncio.CancelledError:
+            # The devices stop what the call started (see MicrobitClient._abandoned)
+            self.tool_cancelled[name] += 1
+            raise
+        finally:
+            self.tool_latency[name].record(time.perf_counter() - start)
+            self.tool_in_flight[name] -= 1
+            self._mark_startup("first_tool_call")
+
+    async def _call_tool(self, name: str, arguments: dict) -> list[types.TextContent]:
+        """Route a tool call to the device pool or to the selected micro:bits."""
+        # Device pool tools
+        if name in ["list_devices"]:
+            return await handle_device_tool(name, arguments, self.device_pool)
+
+        # Batches of tool calls
+        if name in ["batch"]:
+            return await handle_batch_tool(name, arguments or {}, self._timed_call)
+
+        arguments = dict(arguments or {})
+        selector = arguments.pop("device", None)
+        timeout = arguments.pop("device_timeout", None)
+        targets = self.device_pool.select(selector)
 
-            # Sensor tools
-            elif name in ["get_temperature"]:
-                return await handle_sensor_tool(name, arguments, self.microbit_client)
+        # A single device addressed by ID (or by default) answers directly,
+        # connecting first if it wasn't available at startup
+        if selector is None or (selector != ALL_DEVICES and selector in self.device_pool.clients):
+            client = targets[0][1]
+            await client.connect()
+            return await self._dispatch_tool(name, arguments, client)
 
-            # Input tools
-            elif name in ["wait_for_button_press"]:
-                return await handle_input_tool(name, arguments, self.microbit_client)
+        if timeout is None:
+            timeout = self.device_timeout + float(arguments.get("timeout", 0))
+        return await self._fan_out(name, arguments, targets, timeout)
 
-            # Music tools
-            elif name in ["play_music"]:
-                return await handle_music_tool(name, arguments, self.microbit_client)
+    def metrics(self) -> dict:
+        """
+        Get the server's metrics.
+
+        Returns:
+            Dictionary with the uptime, the startup timings, per tool the
+            calls, errors, cancelled calls, calls in flight and latency
+            summary, and per device its client metrics (see
+            MicrobitClient.metrics)
+        """
+        return {
+            "uptime_seconds": round(time.monotonic() - self.started, 3),
+            "startup_seconds": dict(self.startup),
+            "tools": {
+                name: {
+                    "calls": self.tool_calls[name],
+                    "errors": self.tool_errors[name],
+                    "cancelled": self.tool_cancelled[name],
+                    "in_flight": self.tool_in_flight[name],
+                    "latency": histogram.summary()
+                }
+                for name, histogram in self.tool_latency.items()
+            },
+            "devices": {
+                device_id: client.metrics()
+                for device_id, client in self.device_pool.clients.items()
+            }
+        }
 
-            else:
-                raise ValueError(f"Tool not found: {name}")
+    def _mark_startup(self, milestone: str) -> None:
+        """Record the first time a startup milestone is reached."""
+        if self.startup[milestone] is None:
+            self.startup[milestone] = round(time.perf_counter() - IMPORT_STARTED, 3)
+            if milestone == "first_tool_call":
+                print(f"Startup timings (seconds): {json.dumps(self.startup)}", file=sys.stderr)
 
     async def setup(self) -> None:
-        """Set up the server and establish micro:bit connection."""
-        await self.microbit_client.setup_serial_connection()
+        """Set up the server and establish micro:bit connections."""
+        await self.device_pool.setup()
+        self._mark_startup("devices_connected")
+
+    def start_setup(self) -> None:
+        """
+        Connect the micro:bits in the background.
+
+        The MCP handshake and list_tools don't wait for this; tool calls
+        wait for their device, and retry one that failed to connect.
+        """
+
+        async def connect() -> None:
+            try:
+                await self.setup()
+            except Exception as e:
+                print(f"{e}, will retry on first use", file=sys.stderr)
+
+        self._connect_task = asyncio.create_task(connect())
 
     async def run(self) -> None:
         """Run the MCP server."""
         async with stdio_server() as streams:
+            self._mark_startup("serving")
             await self.app.run(
                 streams[0], streams[1], self.app.create_initialization_options()
             )
 
     async def close(self) -> None:
         """Clean up resources."""
-        await self.microbit_client.close()
+        if self._connect_task:
+            self._connect_task.cancel()
+            await asyncio.gather(self._connect_task, return_exceptions=True)
+        await self.device_pool.close()
 
 
-def list_serial_ports():
+def list_serial_ports(probe_all_ports: bool = False):
     """List all available serial ports with micro:bit detection."""
     ports = serial.tools.list_ports.comports()
     
@@ -90,18 +334,9 @@ def list_serial_ports():
         return
     
     # Try to identify likely micro:bit devices
-    microbit_ports = []
-    for port in ports:
-        description = port.description.lower()
-        device = port.device.lower()
-        
-        # Check for micro:bit specific identifiers
-        if any(keyword in description for keyword in 
-               ['microbit', 'micro:bit', 'daplink', 'mbed']):
-            microbit_ports.append(port)
-        # Also check for common USB serial patterns that micro:bit uses
-        elif 'usb' in device and 'modem' in device:
-            microbit_ports.append(port)
+    microbit_ports = [port for port in ports if is_likely_microbit(port)]
+    # Boards that answer IDENTIFY: are micro:bits running this firmware
+    boards = asyncio.run(probe(candidate_ports(probe_all_ports)))
     
     print("Available Serial Ports:")
     print("=" * 50)
@@ -113,12 +348,21 @@ def list_serial_ports():
             if port.hwid:
                 print(f"    Hardware ID: {port.hwid}")
     
+    if boards:
+        print("\nmicro:bit boards answering IDENTIFY: (fastest first):")
+        for board in boards:
+            print(f"  {board['port']} - board {board['board_id']}, firmware {board['version']},"
+                  f" {board['response_ms']} ms")
+            print(f"    Capabilities: {', '.join(board['capabilities'])}")
+    
     print(f"\nAll serial ports ({len(ports)} found):")
     for port in ports:
         marker = " ⭐" if port in microbit_ports else ""
         print(f"  {port.device} - {port.description}{marker}")
     
-    if microbit_ports:
+    if boards:
+        print(f"\nRecommended: Use {boards[0]['port']} for your micro:bit, or --auto to find it on every start")
+    elif microbit_ports:
         print(f"\nRecommended: Use {microbit_ports[0].device} for your micro:bit")
     else:
         print("\nNo micro:bit devices detected. Make sure your micro:bit is:")
@@ -136,14 +380,118 @@ def parse_arguments():
 Examples:
   %(prog)s                           # Use default port
   %(prog)s -p /dev/tty.usbmodem1234  # Use specific port
+  %(prog)s --auto                    # Find the board by probing the micro:bit serial ports
+  %(prog)s -p left=/dev/ttyACM0 -p right=/dev/ttyACM1 --tag left=lab --tag right=lab
+                                     # Drive several boards, addressable by ID or tag
+  %(prog)s --record session.mbrec    # Record the serial traffic
+  %(prog)s --replay session.mbrec --replay-timing fast
+                                     # Serve from a recording instead of the board
   %(prog)s --list-ports              # List available ports
         """
     )
     
     parser.add_argument(
         "-p", "--port",
-        default="/dev/cu.usbmodem2114202",
-        help="Serial port for micro:bit connection (default: %(default)s)"
+        action="append",
+        metavar="[ID=]PORT",
+        help=f"Serial port for micro:bit connection, optionally named; repeat for several boards (default: {DEFAULT_PORT})"
+    )
+    
+    parser.add_argument(
+        "--auto",
+        action="store_true",
+        help="Find the micro:bit by probing the serial ports, trying the last board found first (same as -p auto)"
+    )
+    
+    parser.add_argument(
+        "--board-cache",
+        metavar="FILE",
+        help="File remembering the board found with --auto (default: ~/.cache/microbit-mcp/boards.json)"
+    )
+    
+    parser.add_argument(
+        "--probe-all-ports",
+        action="store_true",
+        help="With --auto and --list-ports, send IDENTIFY: to every USB serial port, not only likely micro:bits"
+    )
+    
+    parser.add_argument(
+        "--tag",
+        action="append",
+        default=[],
+        metavar="ID=TAG[,TAG...]",
+        help="Tags a device can be addressed by in tool calls (repeatable)"
+    )
+    
+    parser.add_argument(
+        "--device-timeout",
+        type=float,
+        default=10.0,
+        help="Seconds to wait for each board when a tool call targets several (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--temperature-ttl",
+        type=float,
+        default=1.0,
+        help="Seconds a temperature reading is served from memory, 0 to always read the sensor (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--text-protocol",
+        action="store_true",
+        help="Always use the text protocol instead of negotiating binary frames"
+    )
+    
+    parser.add_argument(
+        "--no-flow-control",
+        action="store_true",
+        help="Write commands as fast as the link allows instead of waiting for the board's credits"
+    )
+    
+    parser.add_argument(
+        "--record",
+        metavar="FILE",
+        help="Append all serial traffic, with timestamps, to this recording file"
+    )
+    
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="Play a recording back instead of connecting to the micro:bit(s)"
+    )
+    
+    parser.add_argument(
+        "--replay-timing",
+        choices=["original", "fast"],
+        default="original",
+        help="Deliver replayed replies at their recorded times or as fast as possible (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve metrics in the Prometheus text format over HTTP on this port"
+    )
+    
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="Address the metrics endpoint listens on (default: %(default)s)"
+    )
+    
+    parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="Write metrics in the Prometheus text format to this file periodically"
+    )
+    
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between metrics file writes (default: %(default)s)"
     )
     
     parser.add_argument(
@@ -155,15 +503,67 @@ Examples:
     return parser.parse_args()
 
 
-async def main(serial_port: str = "/dev/cu.usbmodem2114202"):
+async def main(
+    serial_port: Optional[str | list[str]] = DEFAULT_PORT,
+    temperature_ttl: float = 1.0,
+    binary_framing: bool = True,
+    tags: Optional[dict[str, tuple]] = None,
+    device_timeout: float = 10.0,
+    metrics_port: Optional[int] = None,
+    metrics_host: str = "127.0.0.1",
+    metrics_file: Optional[str] = None,
+    metrics_interval: float = 10.0,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    replay_timing: str = "original",
+    flow_control: bool = True,
+    board_cache: Optional[str] = None,
+    probe_all_ports: bool = False
+):
     """Main entry point for the micro:bit MCP server."""
-    server = MicrobitMCPServer(serial_port)
+    recorder = Recorder(record) if record else None
+    player = Replay(replay, replay_timing) if replay else None
+    if player and serial_port is None:
+        # Every recorded device, under its recorded ID
+        serial_port = [f"{device_id}=replay:{device_id}" for device_id in player.devices]
+    server = MicrobitMCPServer(
+        serial_port or DEFAULT_PORT,
+        temperature_ttl,
+        binary_framing,
+        tags,
+        device_timeout,
+        recorder,
+        player,
+        flow_control,
+        board_cache,
+        probe_all_ports
+    )
+
+    def render() -> str:
+        return render_prometheus(server.metrics())
+
+    metrics_server = None
+    metrics_dump = None
 
     try:
-        await server.setup()
+        # Serve MCP right away; the boards connect meanwhile
+        server.start_setup()
+        if metrics_port is not None:
+            metrics_server = await serve_prometheus(render, metrics_host, metrics_port)
+            print(f"Serving metrics on http://{metrics_host}:{metrics_port}/metrics", file=sys.stderr)
+        if metrics_file:
+            metrics_dump = asyncio.create_task(dump_periodically(render, metrics_file, metrics_interval))
         await server.run()
     finally:
+        if metrics_dump:
+            metrics_dump.cancel()
+        if metrics_server:
+            metrics_server.close()
         await server.close()
+        if recorder:
+            recorder.close()
+        if player:
+            print(f"Replay finished: {json.dumps(player.describe())}", file=sys.stderr)
 
 
 def cli_main():
@@ -171,10 +571,35 @@ def cli_main():
     args = parse_arguments()
     
     if args.list_ports:
-        list_serial_ports()
+        list_serial_ports(args.probe_all_ports)
         sys.exit(0)
     
-    asyncio.run(main(args.port))
+    tags = {}
+    for spec in args.tag:
+        device_id, _, names = spec.partition("=")
+        tags[device_id] = tags.get(device_id, ()) + tuple(filter(None, names.split(",")))
+    
+    ports = args.port
+    if args.auto:
+        ports = (ports or []) + [AUTO_PORT]
+    
+    asyncio.run(main(
+        ports,
+        args.temperature_ttl,
+        not args.text_protocol,
+        tags,
+        args.device_timeout,
+        args.metrics_port,
+        args.metrics_host,
+        args.metrics_file,
+        args.metrics_interval,
+        args.record,
+        args.replay,
+        args.replay_timing,
+        not args.no_flow_control,
+        args.board_cache,
+        args.probe_all_ports
+    ))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,10 @@
+"""
+Start of the package import, the origin of the server's startup timings.
+
+Imported first by the package, before the modules that take the time being
+measured.
+"""
+
+import time
+
+IMPORT_STARTED = time.perf_counter()
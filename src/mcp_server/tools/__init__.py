@@ -9,6 +9,9 @@ from .display import get_display_tools
 from .sensors import get_sensor_tools
 from .input import get_input_tools
 from .music import get_music_tools
+from .program import get_program_tools
+from .devices import get_device_tools, with_device_selector
+from .batch import get_batch_tools
 
 def get_all_tools():
     """Get all available micro:bit MCP tools."""
@@ -17,4 +20,9 @@ def get_all_tools():
     tools.extend(get_sensor_tools())
     tools.extend(get_input_tools())
     tools.extend(get_music_tools())
+    tools.extend(get_program_tools())
+    # Every tool that talks to a board accepts a device selector
+    tools = [with_device_selector(tool) for tool in tools]
+    tools.extend(get_device_tools())
+    tools.extend(get_batch_tools())
     return tools
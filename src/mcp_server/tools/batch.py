@@ -0,0 +1,185 @@
+"""
+Batch tool for micro:bit MCP server.
+
+This module contains a tool that runs an ordered list of other tool calls
+in one MCP call, so a multi-step interaction (show an image, play a tune,
+wait for a button, read the temperature) costs one round trip with the
+client instead of one per step.
+
+Steps run in order. A step marked parallel starts together with the step
+before it instead of after it has finished, so consecutive parallel steps
+form a group whose device commands are written back to back and answered
+out of order (they carry sequence numbers), pipelined on the serial link.
+"""
+
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Optional
+
+import mcp.types as types
+
+# Most steps a single batch may contain
+MAX_BATCH_STEPS = 32
+
+# Start of the text some tools return instead of raising when they fail
+ERROR_PREFIX = "Error:"
+
+
+def get_batch_tools() -> list[types.Tool]:
+    """Get the batch tool."""
+    return [
+        types.Tool(
+            name="batch",
+            description="Run several micro:bit tool calls in one call, in order. A step with \"parallel\": true starts together with the step before it, and the device commands of such a group are pipelined on the serial link. Returns each step's result or error with its start time and duration in milliseconds.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "minItems": 1,
+                        "maxItems": MAX_BATCH_STEPS,
+                        "description": "Tool calls to make, in order",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "tool": {
+                                    "type": "string",
+                                    "description": "Name of the tool to call, e.g. \"display_image\" (any tool but batch)"
+                                },
+                                "arguments": {
+                                    "type": "object",
+                                    "description": "The tool's arguments"
+                                },
+                                "parallel": {
+                                    "type": "boolean",
+                                    "default": False,
+                                    "description": "Start this step together with the previous one instead of after it has finished"
+                                }
+                            },
+                            "required": ["tool"]
+                        }
+                    },
+                    "stop_on_error": {
+                        "type": "boolean",
+                        "default": True,
+                        "description": "Skip the steps after one that fails (steps already started with it still finish)"
+                    },
+                    "device": {
+                        "type": "string",
+                        "description": "Device selector used by the steps that don't choose a device themselves"
+                    }
+                },
+                "required": ["steps"]
+            }
+        )
+    ]
+
+
+def tool_result(contents: list[types.TextContent]):
+    """A tool call's text content, decoded from JSON when it is JSON."""
+    text = "".join(content.text for content in contents if content.type == "text")
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def tool_error(result) -> Optional[str]:
+    """The error a tool reported in its result (see tool_result), or None if it succeeded."""
+    if isinstance(result, str) and result.startswith(ERROR_PREFIX):
+        return result[len(ERROR_PREFIX):].strip()
+    return None
+
+
+def _groups(steps: list[dict]) -> list[list[int]]:
+    """Indexes of the steps, grouped so each group starts once the one before it has finished."""
+    groups = []
+    for index, step in enumerate(steps):
+        if groups and step.get("parallel", False):
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+    return groups
+
+
+async def handle_batch_tool(
+    name: str,
+    arguments: dict,
+    call_tool: Callable[[str, dict], Awaitable[list[types.TextContent]]]
+) -> list[types.TextContent]:
+    """
+    Handle batch tool calls.
+
+    Args:
+        name: Tool name
+        arguments: Tool arguments
+        call_tool: Coroutine function making one tool call by name
+
+    Returns:
+        List of TextContent responses
+
+    Raises:
+        ValueError: If the steps are invalid (nothing is run then)
+    """
+    if name == "batch":
+        steps = arguments.get("steps")
+        if not isinstance(steps, list) or not 0 < len(steps) <= MAX_BATCH_STEPS:
+            raise ValueError(f"A batch needs 1 to {MAX_BATCH_STEPS} steps")
+        for index, step in enumerate(steps):
+            if not isinstance(step, dict) or not isinstance(step.get("tool"), str):
+                raise ValueError(f"Step {index} doesn't name a tool")
+            if step["tool"] == "batch":
+                raise ValueError(f"Step {index}: batches can't be nested")
+            if not isinstance(step.get("arguments", {}), dict):
+                raise ValueError(f"Step {index}: arguments must be an object")
+        stop_on_error = bool(arguments.get("stop_on_error", True))
+        device = arguments.get("device")
+
+        start = time.perf_counter()
+        results: list[dict] = [{} for _ in steps]
+
+        async def run(index: int) -> bool:
+            step = steps[index]
+            step_arguments = dict(step.get("arguments") or {})
+            if device is not None:
+                step_arguments.setdefault("device", device)
+            started = time.perf_counter()
+            result = {"step": index, "tool": step["tool"], "started_ms": round((started - start) * 1000, 3)}
+            try:
+                value = tool_result(await call_tool(step["tool"], step_arguments))
+            except Exception as e:
+                result["error"] = str(e) or type(e).__name__
+                result["ok"] = False
+            else:
+                # A tool that reports an error in its result failed as well
+                error = tool_error(value)
+                if error is None:
+                    result["result"] = value
+                else:
+                    result["error"] = error
+                result["ok"] = error is None
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            results[index] = result
+            return result["ok"]
+
+        failed = False
+        for group in _groups(steps):
+            if failed and stop_on_error:
+                for index in group:
+                    results[index] = {"step": index, "tool": steps[index]["tool"], "ok": False, "skipped": True}
+                continue
+            # The steps of a group share the link: their commands go out back
+            # to back, each answered by its own sequence number
+            oks = await asyncio.gather(*(run(index) for index in group))
+            failed = failed or not all(oks)
+
+        summary = {
+            "ok": not failed,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+            "steps": results
+        }
+        return [types.TextContent(type="text", text=json.dumps(summary))]
+
+    else:
+        raise ValueError(f"Unknown batch tool: {name}")
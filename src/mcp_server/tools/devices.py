@@ -0,0 +1,62 @@
+"""
+Device tools for micro:bit MCP server.
+
+This module contains tools for inspecting the pool of connected micro:bit
+devices, and the device selector arguments shared by every other tool.
+"""
+
+import json
+import mcp.types as types
+
+# Arguments added to every device tool's schema
+DEVICE_SELECTOR_PROPERTIES = {
+    "device": {
+        "type": "string",
+        "description": "Which micro:bit to use: a device ID, a tag shared by several devices, or \"all\". Defaults to the first device. Selecting a tag or \"all\" runs the call on every matching device concurrently and returns a result per device."
+    },
+    "device_timeout": {
+        "type": "number",
+        "description": "When several devices are selected, seconds to wait for each one before reporting it as timed out"
+    }
+}
+
+
+def with_device_selector(tool: types.Tool) -> types.Tool:
+    """Add the device selector arguments to a tool's input schema."""
+    schema = dict(tool.inputSchema)
+    schema["properties"] = {**schema.get("properties", {}), **DEVICE_SELECTOR_PROPERTIES}
+    return tool.model_copy(update={"inputSchema": schema})
+
+
+def get_device_tools() -> list[types.Tool]:
+    """Get all device-related MCP tools."""
+    return [
+        types.Tool(
+            name="list_devices",
+            description="List the micro:bit devices managed by this server, with their IDs, ports, tags, connection state, flow control, clock sync and median request latencies",
+            inputSchema={
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        )
+    ]
+
+
+async def handle_device_tool(name: str, arguments: dict, device_pool) -> list[types.TextContent]:
+    """
+    Handle device tool calls.
+    
+    Args:
+        name: Tool name
+        arguments: Tool arguments
+        device_pool: DevicePool instance
+        
+    Returns:
+        List of TextContent responses
+    """
+    if name == "list_devices":
+        return [types.TextContent(type="text", text=json.dumps(device_pool.describe()))]
+    
+    else:
+        raise ValueError(f"Unknown device tool: {name}")
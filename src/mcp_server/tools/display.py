@@ -5,7 +5,15 @@ This module contains tools for controlling the micro:bit LED matrix display.
 """
 
 import mcp.types as types
-from ..protocol import format_message_command, format_image_command
+from ..protocol import MAX_ANIMATION_FRAMES
+
+# Only the newest display update waiting for the serial link is sent,
+# unless a call asks for its update to be delivered whatever comes after
+EVERY_FRAME_PROPERTY = {
+    "type": "boolean",
+    "default": False,
+    "description": "Deliver this update even if a newer display update arrives before it is sent (by default it is skipped as superseded)"
+}
 
 
 def get_display_tools() -> list[types.Tool]:
@@ -20,7 +28,13 @@ def get_display_tools() -> list[types.Tool]:
                     "message": {
                         "type": "string",
                         "description": "Message to display"
-                    }
+                    },
+                    "wait": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "Return when the message has finished scrolling instead of when it starts"
+                    },
+                    "every_frame": EVERY_FRAME_PROPERTY
                 },
                 "required": ["message"]
             }
@@ -36,10 +50,48 @@ def get_display_tools() -> list[types.Tool]:
                         "description": """A sequence of 5 numbers (0-9), with a colon delimeter for each of the 5 rows in the matrix. 
                         e.g., 00300:03630:36963:03630:00300 is a star
                         """
-                    }
+                    },
+                    "every_frame": EVERY_FRAME_PROPERTY
                 },
                 "required": ["image"]
             }
+        ),
+        types.Tool(
+            name="display_animation",
+            description="Play an animation on the micro:bit LED matrix. The frames are uploaded once and played by the device at a steady frame rate.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "frames": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "minItems": 1,
+                        "maxItems": MAX_ANIMATION_FRAMES,
+                        "description": "Frames in the same format as display_image, e.g. 00300:03630:36963:03630:00300"
+                    },
+                    "frame_delay_ms": {
+                        "type": "integer",
+                        "default": 100,
+                        "minimum": 20,
+                        "maximum": 10000,
+                        "description": "Time each frame is shown in milliseconds (100 is 10 frames per second)"
+                    },
+                    "loops": {
+                        "type": "integer",
+                        "default": 1,
+                        "minimum": 0,
+                        "maximum": 255,
+                        "description": "Number of times to play the frames; 0 repeats until the display is changed"
+                    },
+                    "wait": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "Return when the animation has finished instead of when it starts"
+                    },
+                    "every_frame": EVERY_FRAME_PROPERTY
+                },
+                "required": ["frames"]
+            }
         )
     ]
 
@@ -56,17 +108,46 @@ async def handle_display_tool(name: str, arguments: dict, microbit_client) -> li
     Returns:
         List of TextContent responses
     """
+    coalesce = not arguments.get("every_frame", False)
+    
     if name == "display_message":
         message = arguments.get("message", "")
-        command = format_message_command(message)
-        await microbit_client.send_command(command)
-        return [types.TextContent(type="text", text=f"Displayed: {message}")]
+        status = await microbit_client.scroll_message(message, bool(arguments.get("wait", False)), coalesce)
+        if status["message"] == "superseded":
+            text = f"Skipped, a newer display update replaced it before it was sent: {message}"
+        elif status["message"].startswith("scroll_stopped:"):
+            text = f"Interrupted by another display command: {message}"
+        elif status["message"].startswith("displayed:"):
+            text = f"Displayed: {message}"
+        else:
+            text = f"Scrolling: {message}"
+        return [types.TextContent(type="text", text=text)]
     
     elif name == "display_image":
         image = arguments.get("image", "")
-        command = format_image_command(image)
-        await microbit_client.send_command(command)
-        return [types.TextContent(type="text", text="Displayed image")]
+        status = await microbit_client.show_image(image, coalesce)
+        if status["message"] == "superseded":
+            text = "Skipped image, a newer display update replaced it before it was sent"
+        else:
+            text = "Displayed image"
+        return [types.TextContent(type="text", text=text)]
+    
+    elif name == "display_animation":
+        frames = arguments.get("frames", [])
+        frame_delay_ms = min(max(int(arguments.get("frame_delay_ms", 100)), 20), 10000)
+        loops = min(max(int(arguments.get("loops", 1)), 0), 255)
+        status = await microbit_client.play_animation(
+            frames, frame_delay_ms, loops, bool(arguments.get("wait", False)), coalesce
+        )
+        if status["message"] == "superseded":
+            text = f"Skipped animation of {len(frames)} frames, a newer display update replaced it before it was sent"
+        elif status["message"].startswith("animation_stopped"):
+            text = f"Animation of {len(frames)} frames was interrupted by another display command"
+        elif status["message"].startswith("animation_done"):
+            text = f"Played animation of {len(frames)} frames"
+        else:
+            text = f"Playing animation of {len(frames)} frames"
+        return [types.TextContent(type="text", text=text)]
     
     else:
         raise ValueError(f"Unknown display tool: {name}")
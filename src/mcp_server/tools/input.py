@@ -26,6 +26,50 @@ def get_input_tools() -> list[types.Tool]:
                         "type": "number",
                         "default": 10.0,
                         "description": "Maximum time to wait in seconds"
+                    },
+                    "since_cursor": {
+                        "type": "integer",
+                        "minimum": 0,
+                        "description": "Accept presses after this event cursor. By default a press that happened since the previous wait returned is returned immediately."
+                    }
+                },
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="get_button_counts",
+            description="Count the button presses on the micro:bit since an event cursor, without waiting",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "since_cursor": {
+                        "type": "integer",
+                        "default": 0,
+                        "minimum": 0,
+                        "description": "Event cursor from an earlier result; 0 counts every buffered press"
+                    }
+                },
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="get_button_history",
+            description="List timestamped button presses and releases on the micro:bit since an event cursor, oldest first",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "since_cursor": {
+                        "type": "integer",
+                        "default": 0,
+                        "minimum": 0,
+                        "description": "Event cursor from an earlier result; 0 lists every buffered event"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "default": 50,
+                        "minimum": 1,
+                        "maximum": 500,
+                        "description": "Maximum number of events to return"
                     }
                 },
                 "required": []
@@ -49,7 +93,16 @@ async def handle_input_tool(name: str, arguments: dict, microbit_client) -> list
     if name == "wait_for_button_press":
         button = arguments.get("button", "any")
         timeout = arguments.get("timeout", 10.0)
-        result = await microbit_client.wait_for_button_press(button, timeout)
+        result = await microbit_client.wait_for_button_press(button, timeout, arguments.get("since_cursor"))
+        return [types.TextContent(type="text", text=json.dumps(result))]
+    
+    elif name == "get_button_counts":
+        result = microbit_client.button_counts(int(arguments.get("since_cursor", 0)))
+        return [types.TextContent(type="text", text=json.dumps(result))]
+    
+    elif name == "get_button_history":
+        limit = min(max(int(arguments.get("limit", 50)), 1), 500)
+        result = microbit_client.button_history(int(arguments.get("since_cursor", 0)), limit)
         return [types.TextContent(type="text", text=json.dumps(result))]
     
     else:
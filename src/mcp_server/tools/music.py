@@ -5,7 +5,6 @@ This module contains tools for playing music on the micro:bit.
 """
 
 import mcp.types as types
-from ..protocol import format_music_command
 
 
 def get_music_tools() -> list[types.Tool]:
@@ -28,6 +27,11 @@ def get_music_tools() -> list[types.Tool]:
                         Octaves: 0-8 (4 is middle octave)
                         Durations: 1=whole note, 2=half note, 4=quarter note, 8=eighth note, etc.
                         Use "R" for rests, e.g., "R:4" for quarter rest."""
+                    },
+                    "wait": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "Return when the music has finished instead of when it starts"
                     }
                 },
                 "required": ["notes"]
@@ -58,12 +62,18 @@ async def handle_music_tool(name: str, arguments: dict, microbit_client) -> list
             if not isinstance(note, str):
                 return [types.TextContent(type="text", text=f"Error: Invalid note format - all notes must be strings")]
         
-        command = format_music_command(notes)
-        await microbit_client.send_command(command)
-        
-        # Wait for completion status from micro:bit
-        # The micro:bit will send a status response when music finishes playing
-        return [types.TextContent(type="text", text=f"Playing {len(notes)} notes on micro:bit")]
+        # The micro:bit acknowledges once it has parsed the notes and started
+        # playing, and reports again when the music ends
+        status = await microbit_client.play_music(notes, bool(arguments.get("wait", False)))
+        if status["message"] == "superseded":
+            text = f"Skipped {len(notes)} notes: newer music replaced them before they reached the micro:bit"
+        elif status["message"].startswith("music_stopped:"):
+            text = f"Played part of {len(notes)} notes on micro:bit before newer music replaced them"
+        elif status["message"].startswith("music_played:"):
+            text = f"Played {len(notes)} notes on micro:bit"
+        else:
+            text = f"Playing {len(notes)} notes on micro:bit"
+        return [types.TextContent(type="text", text=text)]
     
     else:
         raise ValueError(f"Unknown music tool: {name}")
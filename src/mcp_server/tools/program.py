@@ -0,0 +1,134 @@
+"""
+Program tools for micro:bit MCP server.
+
+This module contains tools for running micro-programs on the micro:bit:
+short scripts of display, sound, button and sensor steps with loops, which
+the board runs on its own and reports on as it goes (see program.py).
+"""
+
+import json
+
+import mcp.types as types
+
+from ..program import BUTTONS, MAX_PROGRAM_INSTRUCTIONS, STEP_OPS
+
+
+def get_program_tools() -> list[types.Tool]:
+    """Get all program-related MCP tools."""
+    return [
+        types.Tool(
+            name="run_program",
+            description=f"""Run a small program on the micro:bit itself, replacing the one it was running. Loops, waits and reactions to buttons run on the board without round trips to the host, and button reaction times are measured on the board in milliseconds. The program compiles to at most {MAX_PROGRAM_INSTRUCTIONS} instructions.
+            Example, flash a heart until button A is pressed, then show the temperature:
+            [{{"op": "repeat", "until_button": "a", "steps": [{{"op": "show_image", "image": "09090:99999:99999:09990:00900"}}, {{"op": "sleep", "ms": 300}}, {{"op": "clear"}}, {{"op": "sleep", "ms": 300}}]}}, {{"op": "show_temperature"}}]""",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "steps": {
+                        "type": "array",
+                        "minItems": 1,
+                        "description": """Steps to run in order, each an object with an "op":
+                        show_image (image, e.g. 00300:03630:36963:03630:00300), scroll (text, up to 40 ASCII characters without ';'),
+                        clear, sleep (ms), play (notes, e.g. ["C4:4", "E4:4"]), wait_for_button (button, timeout_ms: 0 waits forever),
+                        show_temperature (scrolls and reports the reading), mark (label, reported as an event),
+                        repeat (steps, times: 0 repeats forever, until_button: ends the loop at once when pressed;
+                        the repeated steps need a sleep or wait_for_button)""",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "op": {"type": "string", "enum": list(STEP_OPS)},
+                                "image": {"type": "string"},
+                                "text": {"type": "string"},
+                                "ms": {"type": "integer", "minimum": 1},
+                                "notes": {"type": "array", "items": {"type": "string"}},
+                                "button": {"type": "string", "enum": list(BUTTONS)},
+                                "timeout_ms": {"type": "integer", "minimum": 0},
+                                "label": {"type": "string"},
+                                "times": {"type": "integer", "minimum": 0},
+                                "until_button": {"type": "string", "enum": list(BUTTONS)},
+                                "steps": {"type": "array", "items": {"type": "object"}}
+                            },
+                            "required": ["op"]
+                        }
+                    },
+                    "wait": {
+                        "type": "boolean",
+                        "default": False,
+                        "description": "Return when the program has ended instead of when it starts"
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "default": 60.0,
+                        "minimum": 0,
+                        "description": "Seconds to wait for the end; a program still running then is stopped"
+                    }
+                },
+                "required": ["steps"]
+            }
+        ),
+        types.Tool(
+            name="get_program_events",
+            description="Get what programs run with run_program reported: button presses with their reaction time in milliseconds, temperature readings, marks, and how each program ended.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "since_cursor": {
+                        "type": "integer",
+                        "default": 0,
+                        "minimum": 0,
+                        "description": "Event cursor from an earlier result; 0 lists every buffered event"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "default": 50,
+                        "minimum": 1,
+                        "maximum": 500,
+                        "description": "Maximum number of events to return"
+                    }
+                },
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="stop_program",
+            description="Stop the program the micro:bit is running, if any.",
+            inputSchema={
+                "type": "object",
+                "properties": {},
+                "required": []
+            }
+        )
+    ]
+
+
+async def handle_program_tool(name: str, arguments: dict, microbit_client) -> list[types.TextContent]:
+    """
+    Handle program tool calls.
+
+    Args:
+        name: Tool name
+        arguments: Tool arguments
+        microbit_client: MicrobitClient instance
+
+    Returns:
+        List of TextContent responses
+    """
+    if name == "run_program":
+        result = await microbit_client.run_program(
+            arguments.get("steps", []),
+            bool(arguments.get("wait", False)),
+            float(arguments.get("timeout", 60.0))
+        )
+        return [types.TextContent(type="text", text=json.dumps(result))]
+
+    elif name == "get_program_events":
+        limit = min(max(int(arguments.get("limit", 50)), 1), 500)
+        result = microbit_client.program_events(int(arguments.get("since_cursor", 0)), limit)
+        return [types.TextContent(type="text", text=json.dumps(result))]
+
+    elif name == "stop_program":
+        await microbit_client.stop_program()
+        return [types.TextContent(type="text", text="Stopped the program on micro:bit")]
+
+    else:
+        raise ValueError(f"Unknown program tool: {name}")
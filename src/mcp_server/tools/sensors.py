@@ -7,16 +7,84 @@ This module contains tools for reading sensor data from the micro:bit.
 import json
 import mcp.types as types
 
+# Sensor names exposed by the tools, mapped to the names used by STREAM:
+STREAM_SENSORS = {"temperature": "temp"}
+
 
 def get_sensor_tools() -> list[types.Tool]:
     """Get all sensor-related MCP tools."""
     return [
         types.Tool(
             name="get_temperature",
-            description="Get the current temperature reading from the micro:bit sensor",
+            description="Get the current temperature reading from the micro:bit sensor. Recent readings are served from memory; the result says how old the reading is.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "max_age_seconds": {
+                        "type": "number",
+                        "minimum": 0,
+                        "description": "Oldest acceptable reading in seconds; 0 forces a fresh reading. Defaults to the server's configured freshness TTL."
+                    }
+                },
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="start_sensor_stream",
+            description="Start continuously sampling a micro:bit sensor in the background, so get_sensor_stream can answer instantly",
             inputSchema={
                 "type": "object",
-                "properties": {},
+                "properties": {
+                    "sensor": {
+                        "type": "string",
+                        "enum": list(STREAM_SENSORS),
+                        "default": "temperature",
+                        "description": "Sensor to stream"
+                    },
+                    "interval_ms": {
+                        "type": "integer",
+                        "minimum": 100,
+                        "default": 1000,
+                        "description": "Time between samples in milliseconds"
+                    }
+                },
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="stop_sensor_stream",
+            description="Stop streaming a micro:bit sensor; samples received so far are kept",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "sensor": {
+                        "type": "string",
+                        "enum": list(STREAM_SENSORS),
+                        "default": "temperature",
+                        "description": "Sensor to stop streaming"
+                    }
+                },
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="get_sensor_stream",
+            description="Get the latest streamed sensor sample and min/max/mean/slope over a recent time window, without querying the device",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "sensor": {
+                        "type": "string",
+                        "enum": list(STREAM_SENSORS),
+                        "default": "temperature",
+                        "description": "Sensor to read"
+                    },
+                    "window_seconds": {
+                        "type": "number",
+                        "default": 60.0,
+                        "description": "Length of the aggregation window in seconds"
+                    }
+                },
                 "required": []
             }
         )
@@ -36,8 +104,30 @@ async def handle_sensor_tool(name: str, arguments: dict, microbit_client) -> lis
         List of TextContent responses
     """
     if name == "get_temperature":
-        temperature_data = await microbit_client.get_temperature()
+        temperature_data = await microbit_client.get_temperature(arguments.get("max_age_seconds"))
         return [types.TextContent(type="text", text=json.dumps(temperature_data))]
     
+    elif name == "start_sensor_stream":
+        sensor = STREAM_SENSORS[arguments.get("sensor", "temperature")]
+        interval_ms = max(100, int(arguments.get("interval_ms", 1000)))
+        status = await microbit_client.start_stream(sensor, interval_ms)
+        return [types.TextContent(type="text", text=json.dumps(status))]
+    
+    elif name == "stop_sensor_stream":
+        sensor = STREAM_SENSORS[arguments.get("sensor", "temperature")]
+        status = await microbit_client.stop_stream(sensor)
+        return [types.TextContent(type="text", text=json.dumps(status))]
+    
+    elif name == "get_sensor_stream":
+        sensor_name = arguments.get("sensor", "temperature")
+        window_seconds = float(arguments.get("window_seconds", 60.0))
+        buffer = microbit_client.get_stream(STREAM_SENSORS[sensor_name])
+        result = {
+            "sensor": sensor_name,
+            "latest": buffer.latest(),
+            "aggregate": buffer.aggregate(window_seconds)
+        }
+        return [types.TextContent(type="text", text=json.dumps(result))]
+    
     else:
         raise ValueError(f"Unknown sensor tool: {name}")
@@ -0,0 +1,454 @@
+# type: ignore
+# extras.py for micro:bit V2: the firmware's optional features, which
+# main.py loads when this file is on the board next to it: animations,
+# programs, sensor streaming, the melody store and binary framing. A V1
+# doesn't have the RAM for them and runs main.py alone
+from microbit import *
+import music
+
+def setup(status, display_start, display_stop, music_stop, notes_play, board_hex):
+    """Take the main.py functions the extras build on"""
+    global send_status_event, start_display, stop_display, stop_music, play_notes, hex_id
+    send_status_event = status
+    start_display = display_start
+    stop_display = display_stop
+    stop_music = music_stop
+    play_notes = notes_play
+    hex_id = board_hex
+
+def sequence_number(seq):
+    """Sequence number of a #seq# envelope, 0 when there is none"""
+    return int(seq[1:-1]) if seq else 0
+
+def send_frame(kind, seq, payload):
+    """Send binary reply frame: 0xFE length type seq_lo seq_hi payload"""
+    n = sequence_number(seq)
+    uart.write(bytes([FRAME_START, len(payload) + 3, kind, n & 255, n >> 8]) + payload)
+
+def frame_temperature(seq, value, timestamp):
+    """Send a TEMP reply as a frame; returns False when replies are text"""
+    if binary_out:
+        send_frame(0x81, seq, bytes([value & 255]) + timestamp.to_bytes(4, "little"))
+    return binary_out
+
+def frame_button_event(button, action, seq, timestamp):
+    """Send a BUTTON event as a frame; returns False when replies are text"""
+    if binary_out:
+        send_frame(0x82, seq, bytes([BUTTON_NAMES.index(button), 1 if action == "pressed" else 2])
+                   + timestamp.to_bytes(4, "little"))
+    return binary_out
+
+def frame_button_timeout(wait):
+    """Send a BUTTON_TIMEOUT event as a frame; returns False when replies are text"""
+    if binary_out:
+        send_frame(0x83, wait[0], bytes([BUTTON_NAMES.index(wait[1])])
+                   + int(wait[3] * 1000).to_bytes(4, "little"))
+    return binary_out
+
+def parse_frames(frames_str):
+    """Build an Image for each comma separated 25-digit animation frame"""
+    frames = []
+    for digits in frames_str.split(","):
+        if len(digits) != 25:
+            raise ValueError("bad frame")
+        frames.append(Image(":".join([digits[i:i + 5] for i in range(0, 25, 5)])))
+    return frames
+
+def animation_sequence(frames, loops):
+    """Yield the frames loops times without copying the list"""
+    for _ in range(loops):
+        for frame in frames:
+            yield frame
+
+def store_melody(melody, notes):
+    """Keep a melody for PLAY_ID, evicting the least recently used ones to fit"""
+    global melody_notes
+    if melody in melodies:
+        melody_order.remove(melody)
+        melody_notes -= len(melodies.pop(melody))
+    while melody_order and melody_notes + len(notes) > MELODY_CACHE_NOTES:
+        melody_notes -= len(melodies.pop(melody_order.pop(0)))
+    if len(notes) <= MELODY_CACHE_NOTES:
+        melodies[melody] = notes
+        melody_order.append(melody)
+        melody_notes += len(notes)
+
+def start_program(seq, instructions):
+    """Start running a program from the main loop, replacing the running one"""
+    global prog, prog_seq, prog_pc, prog_loops, prog_wait, prog_wake, prog_start
+    stop_program("prog_stopped")
+    prog = instructions
+    prog_seq = seq
+    prog_pc = 0
+    prog_loops = []
+    prog_wait = None
+    prog_wake = 0
+    prog_start = running_time()
+
+def stop_program(message):
+    """End the running program, reporting message and the ms it ran (None to end it silently)"""
+    global prog, prog_seq
+    if prog is not None:
+        if message:
+            send_status_event(message + ":" + str(running_time() - prog_start), prog_seq)
+        prog = None
+        prog_seq = None
+
+def cancel(target):
+    """Stop the program a CANCEL: names; returns True if it was running"""
+    if prog_seq == target:
+        stop_program(None)
+        return True
+    return False
+
+def press(button):
+    """Let a press end the program's outermost repeat-until loop for it,
+    or answer the program's button wait"""
+    global prog_pc, prog_loops, prog_wait, prog_wake
+    if prog is None:
+        return
+    now = running_time()
+    for i in range(len(prog_loops)):
+        loop = prog_loops[i]
+        if loop[3] == button or loop[3] == "any":
+            send_status_event("prog_button:" + button + ":" + str(now - loop[4]), prog_seq)
+            prog_pc = loop[1]
+            prog_loops = prog_loops[:i]
+            prog_wait = None
+            prog_wake = 0
+            return
+    if prog_wait is not None and (prog_wait[0] == button or prog_wait[0] == "any"):
+        send_status_event("prog_button:" + button + ":" + str(now - prog_wait[1]), prog_seq)
+        prog_wait = None
+
+def step_program():
+    """Run program instructions until one sleeps or waits, the program
+    ends, or PROGRAM_STEPS have run in this pass of the main loop"""
+    global prog_pc, prog_wait, prog_wake
+    now = running_time()
+    if prog_wait is not None:
+        if not prog_wait[2] or now < prog_wait[2]:
+            return
+        send_status_event("prog_button_timeout:" + prog_wait[0], prog_seq)
+        prog_wait = None
+    if now < prog_wake:
+        return
+    for _ in range(PROGRAM_STEPS):
+        if prog_pc >= len(prog):
+            stop_program("prog_done")
+            return
+        op = prog[prog_pc]
+        prog_pc += 1
+        try:
+            if run_instruction(op[0], op[1:]):
+                return
+        except Exception:
+            send_status_event("prog_error:bad_instruction:" + str(prog_pc - 1), prog_seq)
+            stop_program(None)
+            return
+
+def run_instruction(code, arg):
+    """Carry out one program instruction; returns True if it sleeps or waits"""
+    global prog_pc, prog_wait, prog_wake
+    if code == "I":
+        stop_display()
+        display.show(parse_frames(arg)[0])
+    elif code == "D":
+        stop_display()
+        display.scroll(arg, delay=SCROLL_DELAY, wait=False)
+    elif code == "X":
+        stop_display()
+        display.clear()
+    elif code == "S":
+        prog_wake = running_time() + int(arg)
+        return True
+    elif code == "P":
+        stop_music()
+        music.play(arg.split(","), wait=False)
+    elif code == "K":
+        # Parse: button:timeout_ms (0 waits until pressed)
+        parts = arg.split(":")
+        now = running_time()
+        timeout = int(parts[1])
+        prog_wait = [parts[0], now, now + timeout if timeout else 0]
+        return True
+    elif code == "T":
+        temp_celsius = temperature()
+        stop_display()
+        display.scroll(str(temp_celsius), delay=SCROLL_DELAY, wait=False)
+        send_status_event("prog_temp:" + str(temp_celsius), prog_seq)
+    elif code == "M":
+        send_status_event("prog_mark:" + arg, prog_seq)
+    elif code == "L":
+        # Parse: times:until_button:end (times 0 repeats until the button
+        # is pressed or the program is stopped). Each loop: [first
+        # instruction of the body, instruction after its E, iterations
+        # left (-1 forever), button ending it ("-" for none), start time]
+        parts = arg.split(":")
+        if len(prog_loops) >= MAX_PROGRAM_DEPTH:
+            raise ValueError("too deep")
+        prog_loops.append([prog_pc, int(parts[2]), int(parts[0]) or -1, parts[1], running_time()])
+    elif code == "E":
+        loop = prog_loops[-1]
+        if loop[2] > 0:
+            loop[2] -= 1
+        if loop[2]:
+            prog_pc = loop[0]
+        else:
+            prog_loops.pop()
+    else:
+        raise ValueError("unknown instruction")
+    return False
+
+def run_command(seq, cmd):
+    """Process a command only the extras know; returns True if it was one"""
+    global stream_interval, stream_last, binary_out, anim_frames
+    if cmd.startswith("MELODY:"):
+        # Parse: MELODY:id:note1,note2,... (store under id, then play)
+        parts = cmd.split(":", 2)
+        if len(parts) == 3 and parts[2]:
+            notes = parts[2].split(",")
+            if play_notes(notes, seq):
+                store_melody(parts[1], notes)
+        else:
+            send_status_event("music_error:no_notes_provided", seq)
+    elif cmd.startswith("PLAY_ID:"):
+        # Parse: PLAY_ID:id (a melody stored by MELODY:)
+        melody = cmd[8:]
+        if melody in melodies:
+            melody_order.remove(melody)
+            melody_order.append(melody)
+            play_notes(melodies[melody], seq)
+        else:
+            send_status_event("music_error:unknown_melody", seq)
+    elif cmd.startswith("MELODIES:"):
+        # Reply: melodies:capacity_notes:id/count,... (least recently used first)
+        entries = [melody + "/" + str(len(melodies[melody])) for melody in melody_order]
+        send_status_event("melodies:" + str(MELODY_CACHE_NOTES) + ":" + ",".join(entries), seq)
+    elif cmd.startswith("PROG:"):
+        # Parse: PROG:instruction;instruction;... (see run_instruction),
+        # replacing the running program; PROG: alone only stops it
+        if not cmd[5:]:
+            stop_program("prog_stopped")
+            send_status_event("prog_idle", seq)
+            return True
+        instructions = cmd[5:].split(";")
+        if len(instructions) > MAX_PROGRAM_INSTRUCTIONS:
+            send_status_event("prog_error:too_long", seq)
+            return True
+        start_program(seq, instructions)
+        send_status_event("prog_started:" + str(len(instructions)), seq)
+    elif cmd.startswith("PROTO:"):
+        # Parse: PROTO:encoding ("text" or "bin") for replies from now on
+        encoding = cmd[6:]
+        if encoding == "text" or encoding == "bin":
+            send_status_event("proto:" + encoding, seq)
+            binary_out = encoding == "bin"
+        else:
+            send_status_event("proto_error:unknown_encoding", seq)
+    elif cmd.startswith("STREAM:"):
+        # Parse: STREAM:sensor:interval_ms (interval 0 stops the stream)
+        parts = cmd.split(":")
+        if len(parts) >= 3 and parts[1] == "temp":
+            stream_interval = int(parts[2])
+            stream_last = running_time() - stream_interval
+            if stream_interval > 0:
+                send_status_event("streaming:temp:" + parts[2], seq)
+            else:
+                send_status_event("stream_stopped:temp", seq)
+        else:
+            send_status_event("stream_error:unknown_sensor", seq)
+    elif cmd.startswith("ANIM_ADD:"):
+        # Parse: ANIM_ADD:index:frames (stage frames from index on; 0
+        # starts a new upload, dropping frames another one left behind)
+        parts = cmd.split(":", 2)
+        try:
+            index = int(parts[1])
+            frames = parse_frames(parts[2])
+        except Exception:
+            anim_frames = []
+            send_status_event("anim_error:bad_frame", seq)
+            return True
+        if index > len(anim_frames):
+            # The start of this upload never arrived
+            anim_frames = []
+            send_status_event("anim_error:missing_frames", seq)
+            return True
+        del anim_frames[index:]
+        anim_frames.extend(frames)
+        if len(anim_frames) > MAX_ANIMATION_FRAMES:
+            anim_frames = []
+            send_status_event("anim_error:too_many_frames", seq)
+            return True
+        send_status_event("anim_staged:" + str(len(anim_frames)), seq)
+    elif cmd.startswith("ANIM:"):
+        # Parse: ANIM:frame_delay_ms:loops:staged:frames (loops 0 repeats
+        # forever), playing the staged frames followed by frames
+        parts = cmd.split(":", 4)
+        try:
+            frames = parse_frames(parts[4])
+            delay = int(parts[1])
+            loops = int(parts[2])
+            staged = int(parts[3])
+        except Exception:
+            anim_frames = []
+            send_status_event("anim_error:bad_frame", seq)
+            return True
+        # Frames staged for another animation (cut short, cancelled or
+        # replaced) never play with this one
+        if staged and staged != len(anim_frames):
+            send_status_event("anim_error:staged:" + str(len(anim_frames)), seq)
+            anim_frames = []
+            return True
+        frames = anim_frames[:staged] + frames
+        anim_frames = []
+        if len(frames) > MAX_ANIMATION_FRAMES:
+            send_status_event("anim_error:too_many_frames", seq)
+            return True
+        count = str(len(frames))
+        start_display(seq, len(frames) * loops * delay if loops else None, "animation_done:" + count, "animation_stopped:" + count)
+        # The display driver shows the frames in the background on its own timer
+        if loops:
+            display.show(animation_sequence(frames, loops), delay=delay, wait=False, clear=False)
+        else:
+            display.show(frames, delay=delay, wait=False, loop=True)
+        send_status_event("animating:" + str(len(frames)), seq)
+    else:
+        return False
+    return True
+
+def unpack_digits(payload):
+    """Brightness digits packed two per byte, high nibble first"""
+    digits = ""
+    for b in payload:
+        digits += str(b >> 4) + str(b & 15)
+    return digits
+
+def unpack_frames(payload):
+    """Comma separated 25-digit frames from 13 packed bytes each"""
+    return ",".join([unpack_digits(payload[i:i + 13])[:25] for i in range(0, len(payload), 13)])
+
+def unpack_notes(payload):
+    """Notes from an (octave << 4 | pitch) byte and a duration byte each,
+    octave 15 and duration 0 meaning unspecified"""
+    notes = []
+    for i in range(0, len(payload) - 1, 2):
+        note = NOTE_NAMES[payload[i] & 15]
+        if payload[i] >> 4 != 15:
+            note += str(payload[i] >> 4)
+        if payload[i + 1]:
+            note += ":" + str(payload[i + 1])
+        notes.append(note)
+    return notes
+
+def decode_frame(frame):
+    """Decode a binary command frame (type, seq_lo, seq_hi, payload) into
+    the text command it stands for, None (reported) if it is unknown"""
+    kind = frame[0]
+    n = frame[1] | (frame[2] << 8)
+    payload = frame[3:]
+    cmd = None
+    if kind == 0x01 and len(payload) == 13:
+        # IMAGE: 25 brightness digits packed two per byte
+        digits = unpack_digits(payload)
+        cmd = "IMAGE:" + ":".join([digits[i:i + 5] for i in range(0, 25, 5)])
+    if kind == 0x02:
+        cmd = "TEMP:"
+    if kind == 0x03 and len(payload) == 5:
+        # WAIT_BUTTON: button code, timeout in ms (u32 little-endian)
+        timeout_ms = int.from_bytes(bytes(payload[1:5]), "little")
+        cmd = "WAIT_BUTTON:" + BUTTON_NAMES[payload[0]] + ":" + str(timeout_ms / 1000)
+    if kind == 0x04:
+        # MUSIC: two bytes per note
+        cmd = "MUSIC:" + ",".join(unpack_notes(payload))
+    if kind == 0x05 and len(payload) == 3 and payload[0] == 1:
+        # STREAM: sensor code, interval in ms (u16 little-endian)
+        cmd = "STREAM:temp:" + str(payload[1] | (payload[2] << 8))
+    if kind == 0x08 and len(payload) > 4:
+        # MELODY: 4-byte ID, then notes packed as for MUSIC
+        cmd = "MELODY:" + hex_id(payload[0:4]) + ":" + ",".join(unpack_notes(payload[4:]))
+    if kind == 0x09 and len(payload) == 4:
+        # PLAY_ID: 4-byte ID
+        cmd = "PLAY_ID:" + hex_id(payload)
+    if kind == 0x06 and len(payload) > 4:
+        # ANIM: frame delay in ms (u16), loop count, staged frames, 13
+        # packed bytes per frame
+        cmd = ("ANIM:" + str(payload[0] | (payload[1] << 8)) + ":" + str(payload[2])
+               + ":" + str(payload[3]) + ":" + unpack_frames(payload[4:]))
+    if kind == 0x07 and len(payload) > 1:
+        # ANIM_ADD: index of the first frame, 13 packed bytes per frame
+        cmd = "ANIM_ADD:" + str(payload[0]) + ":" + unpack_frames(payload[1:])
+    if cmd is None:
+        send_status_event("error:unknown_frame")
+        return None
+    if n:
+        cmd = "#" + str(n) + "#" + cmd
+    return cmd
+
+def send_sample():
+    """Send streamed sensor sample"""
+    value = temperature()
+    if binary_out:
+        send_frame(0x84, "", bytes([1]) + (value & 0xFFFF).to_bytes(2, "little")
+                   + stream_last.to_bytes(4, "little"))
+        return
+    # Format: SAMPLE|sensor|value|timestamp
+    print("SAMPLE|temp|" + str(value) + "|" + str(stream_last))
+
+def step():
+    """Run the program and push streamed sensor samples, once per pass of
+    the main loop; returns True while a program runs"""
+    global stream_last
+    running = prog is not None
+    # Right after the buttons, so a press is acted on within a pass of the
+    # loop, which stays short while a program runs
+    if running:
+        step_program()
+    if stream_interval and running_time() - stream_last >= stream_interval:
+        stream_last = running_time()
+        send_sample()
+    return running
+
+# Added to the capabilities main.py reports to IDENTIFY:
+CAPABILITIES = ("bin", "melodies", "stream", "anim", "prog")
+
+# Scroll speed of program text, as in main.py
+SCROLL_DELAY = 150
+
+# Binary framing: frames start with FRAME_START; replies use frames after PROTO:bin
+FRAME_START = 0xFE
+binary_out = False
+BUTTON_NAMES = ("any", "a", "b")
+NOTE_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B", "R")
+
+# Animation frames staged by ANIM_ADD
+MAX_ANIMATION_FRAMES = 64
+anim_frames = []
+
+# Sensor streaming: interval in ms (0 when off) and time of the last sample
+stream_interval = 0
+stream_last = 0
+
+# Melodies kept for PLAY_ID: notes by ID, IDs least recently used first,
+# and the total note count, bounded to keep RAM use predictable and to what
+# one MELODY: frame can carry
+MELODY_CACHE_NOTES = 124
+melodies = {}
+melody_order = []
+melody_notes = 0
+
+# Program run by PROG: (None when idle), its sequence envelope, the next
+# instruction, the loops it is in, its button wait ([button, start time,
+# deadline or 0]), when its sleep ends and when it started. At most
+# PROGRAM_STEPS instructions run per pass of the main loop, so commands
+# and buttons keep being serviced whatever the program does
+MAX_PROGRAM_INSTRUCTIONS = 64
+MAX_PROGRAM_DEPTH = 4
+PROGRAM_STEPS = 16
+prog = None
+prog_seq = None
+prog_pc = 0
+prog_loops = []
+prog_wait = None
+prog_wake = 0
+prog_start = 0
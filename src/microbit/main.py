@@ -1,77 +1,361 @@
 # type: ignore
-# main.py for micro:bit
+# main.py: the firmware's core, which fits a micro:bit V1. On a V2, copy
+# extras.py next to it for the optional features
 from microbit import *
+import gc
+import machine
 import music
 
-def send_status_event(message):
+def send_status_event(message, seq=""):
     """Send status event"""
     timestamp = running_time()
-    # Format: STATUS|message|timestamp
-    event_str = "STATUS|" + message + "|" + str(timestamp)
+    # Format: [#seq#]STATUS|message|timestamp
+    event_str = seq + "STATUS|" + message + "|" + str(timestamp)
     print(event_str)
 
+def split_sequence(cmd):
+    """Split the optional #seq# envelope off a command"""
+    if cmd.startswith("#"):
+        end = cmd.find("#", 1)
+        if end > 0:
+            return cmd[:end + 1], cmd[end + 1:]
+    return "", cmd
+
+def start_display(seq, duration, done, stopped):
+    """Track a display activity running in the background (scroll or animation);
+    duration is None when it runs until replaced"""
+    global display_seq, display_end, display_done, display_stopped
+    stop_display()
+    display_seq = seq
+    display_end = 0 if duration is None else running_time() + duration
+    display_done = done
+    display_stopped = stopped
+
+def stop_display():
+    """Report the background display activity as cut short by another display command"""
+    global display_seq, display_end
+    if display_seq is not None:
+        send_status_event(display_stopped, display_seq)
+        display_seq = None
+        display_end = 0
+
+def scroll_duration(message):
+    """Approximate ms display.scroll takes: 5 columns plus a gap per character"""
+    return len(message) * 6 * SCROLL_DELAY
+
+def music_duration(notes):
+    """ms music.play takes, with durations sticky from note to note"""
+    ticks, bpm = music.get_tempo()
+    duration = 4
+    total = 0
+    for note in notes:
+        if ":" in note:
+            duration = int(note.split(":")[1])
+        total += duration
+    return total * 60000 // (bpm * ticks)
+
+def play_notes(notes, seq):
+    """Start playing notes in the background, replacing older music.
+    Returns True if the notes were accepted"""
+    global music_seq, music_end, music_count
+    try:
+        duration = music_duration(notes)
+        stop_music()
+        music.play(notes, wait=False)
+    except Exception as e:
+        send_status_event("music_error:" + str(e), seq)
+        return False
+    music_seq = seq
+    music_end = running_time() + duration
+    music_count = len(notes)
+    send_status_event("playing:" + str(len(notes)) + "_notes", seq)
+    return True
+
+def stop_music():
+    """Report the playing music as cut short by newer music"""
+    global music_seq, music_end
+    if music_seq is not None:
+        send_status_event("music_stopped:" + str(music_count) + "_notes", music_seq)
+        music_seq = None
+        music_end = 0
+
 def process_command(cmd):
+    """Process a command; one that fails (e.g. an IMAGE: that Image()
+    rejects) is answered with an error carrying its sequence envelope
+    instead of stopping the firmware"""
+    try:
+        run_command(cmd)
+    except MemoryError:
+        gc.collect()
+        send_status_event("error:memory", split_sequence(cmd)[0])
+    except Exception as e:
+        send_status_event("error:command_failed:" + type(e).__name__, split_sequence(cmd)[0])
+
+def run_command(cmd):
     """Process commands from MCP server"""
-    global waiting_for_button, wait_button_type, wait_start_time, wait_timeout
+    global button_events, flow_control, rx_consumed, rx_reported
+    global display_seq, display_end, music_seq, music_end
+    
+    # Replies echo the command's sequence envelope so the host can
+    # match them to the request that caused them
+    seq, cmd = split_sequence(cmd)
+    # Commands of the optional features; any other unknown command goes
+    # unanswered, as on older firmware
+    if extras and extras.run_command(seq, cmd):
+        return
     
+    if cmd.startswith("PING:"):
+        # Echo at once: the host times the round trip to map running_time()
+        # to its own clock
+        send_status_event("pong", seq)
+    if cmd.startswith("IDENTIFY:"):
+        # Reply: identify:board_id:version:capability,capability,... so the
+        # host can tell boards apart when probing serial ports
+        send_status_event("identify:" + BOARD_ID + ":" + FIRMWARE_VERSION + ":" + ",".join(CAPABILITIES), seq)
+    if cmd.startswith("CANCEL:"):
+        # Parse: CANCEL:seq (a command the host gave up on). Its button
+        # wait, scroll, animation, music or program stops without a reply
+        # of its own; the reply names what stopped, "none" if it had ended
+        target = "#" + cmd[7:] + "#"
+        stopped = "none"
+        for wait in button_waits[:]:
+            if wait[0] == target:
+                button_waits.remove(wait)
+                stopped = "wait"
+        if display_seq == target:
+            display.clear()
+            display_seq = None
+            display_end = 0
+            stopped = "display"
+        if music_seq == target:
+            music.stop()
+            music_seq = None
+            music_end = 0
+            stopped = "music"
+        if extras and extras.cancel(target):
+            stopped = "program"
+        send_status_event("cancelled:" + cmd[7:] + ":" + stopped, seq)
+    if cmd.startswith("FLOW:"):
+        # Credit the host for the bytes read after this line from now on;
+        # it sends no more than RX_WINDOW bytes ahead of the credits
+        flow_control = True
+        rx_consumed = rx_remaining
+        rx_reported = 0
+        send_status_event("flow:" + str(RX_WINDOW), seq)
     if cmd.startswith("MESSAGE:"):
         message = cmd[8:]
-        display.scroll(message)
-        send_status_event("displayed:" + message)
+        # Scroll in the background so commands and buttons keep being
+        # serviced; completion is reported from the main loop
+        display.scroll(message, delay=SCROLL_DELAY, wait=False)
+        start_display(seq, scroll_duration(message), "displayed:" + message, "scroll_stopped:" + message)
+        send_status_event("scrolling:" + message, seq)
     if cmd.startswith("IMAGE:"):
         image = cmd[6:]
+        stop_display()
         display.show(Image(image))
-        send_status_event("displayed:" + image)
+        send_status_event("displayed:" + image, seq)
     if cmd.startswith("TEMP:"):
         temp_celsius = temperature()
         timestamp = running_time()
-        # Format: TEMP|temperature|timestamp
-        temp_response = "TEMP|" + str(temp_celsius) + "|" + str(timestamp)
-        print(temp_response)
+        if not (extras and extras.frame_temperature(seq, temp_celsius, timestamp)):
+            # Format: [#seq#]TEMP|temperature|timestamp
+            temp_response = seq + "TEMP|" + str(temp_celsius) + "|" + str(timestamp)
+            print(temp_response)
     if cmd.startswith("WAIT_BUTTON:"):
         # Parse: WAIT_BUTTON:button:timeout
         parts = cmd.split(":")
         if len(parts) >= 3:
-            wait_button_type = parts[1]  # "a", "b", or "any"
-            wait_timeout = float(parts[2])
-            waiting_for_button = True
-            wait_start_time = running_time()
-            send_status_event("waiting_for_button:" + wait_button_type)
+            # Each wait: [seq, button ("a", "b", or "any"), start time, timeout]
+            button_waits.append([seq, parts[1], running_time(), float(parts[2])])
+            send_status_event("waiting_for_button:" + parts[1], seq)
     if cmd.startswith("MUSIC:"):
         # Parse: MUSIC:note1,note2,note3...
         notes_str = cmd[6:]  # Remove "MUSIC:" prefix
         if notes_str:
-            notes = notes_str.split(",")
-            try:
-                music.play(notes)  # This blocks until music finishes
-                send_status_event("music_played:" + str(len(notes)) + "_notes")
-            except Exception as e:
-                send_status_event("music_error:" + str(e))
+            play_notes(notes_str.split(","), seq)
         else:
-            send_status_event("music_error:no_notes_provided")
+            send_status_event("music_error:no_notes_provided", seq)
+    if cmd.startswith("EVENTS:"):
+        # Parse: EVENTS:on or EVENTS:off (unsolicited button events)
+        if cmd[7:] == "on" or cmd[7:] == "off":
+            button_events = cmd[7:] == "on"
+            send_status_event("events:" + cmd[7:], seq)
+        else:
+            send_status_event("events_error:unknown_setting", seq)
 
-def send_button_event(button, action):
+def send_button_event(button, action, seq=""):
     """Send button event"""
     timestamp = running_time()
-    # Format: BUTTON|button|action|timestamp
-    event_str = "BUTTON|" + button + "|" + action + "|" + str(timestamp)
+    if extras and extras.frame_button_event(button, action, seq, timestamp):
+        return
+    # Format: [#seq#]BUTTON|button|action|timestamp
+    event_str = seq + "BUTTON|" + button + "|" + action + "|" + str(timestamp)
     print(event_str)
 
-def send_button_timeout():
+def send_button_timeout(wait):
     """Send button timeout event"""
-    # Format: BUTTON_TIMEOUT|waited_for|timeout_duration
-    event_str = "BUTTON_TIMEOUT|" + wait_button_type + "|" + str(wait_timeout)
+    if extras and extras.frame_button_timeout(wait):
+        return
+    # Format: [#seq#]BUTTON_TIMEOUT|waited_for|timeout_duration
+    event_str = wait[0] + "BUTTON_TIMEOUT|" + wait[1] + "|" + str(wait[3])
     print(event_str)
 
-# Global variables for button waiting
-waiting_for_button = False
-wait_button_type = ""
-wait_start_time = 0
-wait_timeout = 0
+def poll_button(name, button, was_pressed):
+    """Report edges of one button since the last poll; returns whether it is pressed"""
+    pressed = button.is_pressed()
+    # was_pressed() latches presses, so a tap shorter than the loop sleep
+    # between two polls is still seen
+    tapped = button.was_pressed()
+    if pressed and not was_pressed:
+        if button_events:
+            send_button_event(name, "pressed")
+        resolve_button_waits(name)
+    elif was_pressed and not pressed:
+        if button_events:
+            send_button_event(name, "released")
+    elif tapped and not pressed:
+        if button_events:
+            send_button_event(name, "pressed")
+            send_button_event(name, "released")
+        resolve_button_waits(name)
+    return pressed
+
+def resolve_button_waits(button):
+    """Answer every pending wait satisfied by a press of button, the
+    running program's included"""
+    for wait in button_waits[:]:
+        if wait[1] == button or wait[1] == "any":
+            button_waits.remove(wait)
+            send_button_event(button, "pressed", wait[0])
+    if extras:
+        extras.press(button)
+
+def hex_id(payload):
+    """Bytes as lowercase hex digits (melody and board IDs)"""
+    return "".join(["%02x" % b for b in payload])
 
-# Button state tracking
-button_a_was_pressed = False
-button_b_was_pressed = False
+def send_credit():
+    """Tell the host how many bytes have been taken out of the UART since FLOW:"""
+    global rx_reported
+    # Format: CREDIT|consumed (modulo 65536)
+    print("CREDIT|" + str(rx_consumed))
+    rx_reported = rx_consumed
+
+def read_commands():
+    """Drain all pending UART input and process every complete line.
+    Returns True if any input arrived."""
+    global rx_length, rx_overflow, rx_consumed, rx_remaining
+    available = uart.any()
+    if not available:
+        return False
+    
+    if rx_length == RX_BUFFER_SIZE:
+        # Line longer than the buffer: drop it up to the next newline, and
+        # answer with the sequence envelope at its start
+        seq = split_sequence(bytes(rx_view[0:8]).decode('utf-8', 'ignore'))[0]
+        rx_length = 0
+        rx_overflow = True
+        send_status_event("error:command_too_long", seq)
+    
+    count = uart.readinto(rx_view[rx_length:], min(available, RX_BUFFER_SIZE - rx_length))
+    if not count:
+        return False
+    rx_consumed = (rx_consumed + count) & 0xFFFF
+    
+    end = rx_length + count
+    start = 0
+    i = 0
+    while i < end:
+        if i == start and extras and rx_buffer[i] == extras.FRAME_START:
+            # Binary frame: wait until its length byte and body have arrived
+            if i + 1 >= end or i + 2 + rx_buffer[i + 1] > end:
+                break
+            frame_end = i + 2 + rx_buffer[i + 1]
+            rx_remaining = end - frame_end
+            cmd = extras.decode_frame(rx_view[i + 2:frame_end])
+            if cmd:
+                process_command(cmd)
+            start = i = frame_end
+            continue
+        if rx_buffer[i] == 10:  # b'\n'
+            if rx_overflow:
+                rx_overflow = False
+            elif i > start:
+                rx_remaining = end - i - 1
+                process_command(bytes(rx_view[start:i]).decode('utf-8', 'ignore').strip())
+            start = i + 1
+        i += 1
+    
+    # Move the incomplete tail of the last line to the front of the buffer
+    rx_length = end - start
+    if start and rx_length:
+        rx_buffer[0:rx_length] = rx_buffer[start:end]
+    
+    # Return credit once the UART is drained, or sooner in a long burst
+    if flow_control and rx_consumed != rx_reported:
+        if not uart.any() or (rx_consumed - rx_reported) & 0xFFFF >= RX_WINDOW // 2:
+            send_credit()
+    return True
+
+# Reported by IDENTIFY: the board's unique ID (from the nRF chip), the
+# firmware version and the optional protocol features it supports
+BOARD_ID = hex_id(machine.unique_id())
+FIRMWARE_VERSION = "0.1.0"
+CAPABILITIES = ("events", "ping", "flow", "cancel")
+
+# Pending button waits, several may be in flight at once
+button_waits = []
+
+# Report every button press and release without being asked (EVENTS:)
+button_events = True
+
+# Background display activity (scroll or animation): sequence envelope
+# (None when idle), end time (0 when it runs until replaced) and the status
+# messages for finishing and for being cut short
+SCROLL_DELAY = 150
+display_seq = None
+display_end = 0
+display_done = ""
+display_stopped = ""
+
+# Background music: sequence envelope (None when idle), end time, note count
+music_seq = None
+music_end = 0
+music_count = 0
+
+# Command input buffer, preallocated so long commands don't fragment the heap
+RX_BUFFER_SIZE = 512
+rx_buffer = bytearray(RX_BUFFER_SIZE)
+rx_view = memoryview(rx_buffer)
+rx_length = 0
+rx_overflow = False
+
+# Flow control (FLOW:): bytes the host may send ahead of the credits, which
+# the UART driver's receive buffer holds while the loop sleeps or runs a
+# command, and the bytes taken out of it since FLOW: (modulo 65536), as
+# counted and as last reported. rx_remaining is the part of the current
+# read that follows the line being processed
+RX_WINDOW = 64
+flow_control = False
+rx_consumed = 0
+rx_reported = 0
+rx_remaining = 0
+
+# Loop sleep in ms: near zero while commands are arriving, backing off
+# to IDLE_SLEEP_MAX (which still keeps button edge detection responsive)
+IDLE_SLEEP_MIN = 1
+IDLE_SLEEP_MAX = 20
+idle_sleep = IDLE_SLEEP_MIN
+
+# Optional features (extras.py, V2 only), None when the board runs the
+# core alone; it uses the core's display, music and status helpers
+try:
+    import extras
+    extras.setup(send_status_event, start_display, stop_display, stop_music, play_notes, hex_id)
+    CAPABILITIES += extras.CAPABILITIES
+except (ImportError, MemoryError):
+    extras = None
+    gc.collect()
 
 # Startup
 display.show(Image.HAPPY)
@@ -79,51 +363,52 @@ sleep(1000)
 display.clear()
 send_status_event("ready")
 
-# Main loop
-input_buffer = ""
+# Button state tracking, ignoring presses latched while booting
+button_a_was_pressed = button_a.is_pressed()
+button_b_was_pressed = button_b.is_pressed()
+button_a.was_pressed()
+button_b.was_pressed()
 
+# Main loop
 while True:
-    # Handle commands
-    if uart.any():
-        char = uart.read(1)
-        if char:
-            if char == b'\n':
-                if input_buffer:
-                    process_command(input_buffer.strip())
-                    input_buffer = ""
-            else:
-                input_buffer += char.decode('utf-8', 'ignore')
+    # Handle commands; one the heap can't hold is dropped and reported
+    # rather than stopping the firmware
+    try:
+        busy = read_commands() or rx_length > 0
+    except MemoryError:
+        rx_length = 0
+        gc.collect()
+        send_status_event("error:memory")
+        busy = True
     
-    # Button monitoring when waiting for button press
-    if waiting_for_button:
-        # Check for timeout
+    # Button wait timeouts
+    if button_waits:
         current_time = running_time()
-        if (current_time - wait_start_time) >= (wait_timeout * 1000):  # Convert to milliseconds
-            waiting_for_button = False
-            send_button_timeout()
-        else:
-            # Check button states
-            button_a_pressed = button_a.is_pressed()
-            button_b_pressed = button_b.is_pressed()
-            
-            # Detect button A press (edge detection)
-            if button_a_pressed and not button_a_was_pressed:
-                if wait_button_type == "a" or wait_button_type == "any":
-                    waiting_for_button = False
-                    send_button_event("a", "pressed")
-            
-            # Detect button B press (edge detection)
-            if button_b_pressed and not button_b_was_pressed:
-                if wait_button_type == "b" or wait_button_type == "any":
-                    waiting_for_button = False
-                    send_button_event("b", "pressed")
-            
-            # Update button state tracking
-            button_a_was_pressed = button_a_pressed
-            button_b_was_pressed = button_b_pressed
-    else:
-        # Reset button state tracking when not waiting
-        button_a_was_pressed = button_a.is_pressed()
-        button_b_was_pressed = button_b.is_pressed()
+        for wait in button_waits[:]:
+            if (current_time - wait[2]) >= (wait[3] * 1000):  # Convert to milliseconds
+                button_waits.remove(wait)
+                send_button_timeout(wait)
     
-    sleep(50)
+    # Button monitoring: every press and release is reported, and presses
+    # answer pending waits
+    button_a_was_pressed = poll_button("a", button_a, button_a_was_pressed)
+    button_b_was_pressed = poll_button("b", button_b, button_b_was_pressed)
+    
+    # Report finished scrolls, animations and music
+    if display_seq is not None and display_end and running_time() >= display_end:
+        send_status_event(display_done, display_seq)
+        display_seq = None
+        display_end = 0
+    if music_seq is not None and running_time() >= music_end:
+        send_status_event("music_played:" + str(music_count) + "_notes", music_seq)
+        music_seq = None
+    
+    # Run the program and push streamed sensor samples
+    if extras and extras.step():
+        busy = True
+    
+    if busy:
+        idle_sleep = IDLE_SLEEP_MIN
+    else:
+        idle_sleep = min(idle_sleep * 2, IDLE_SLEEP_MAX)
+    sleep(idle_sleep)
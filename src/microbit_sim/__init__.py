@@ -0,0 +1,12 @@
+"""
+Micro:bit Device Simulator Package.
+
+This package simulates a micro:bit running the MCP firmware, exposed on a
+pseudo-terminal so the MCP server can be run and load-tested without
+hardware.
+"""
+
+from .firmware import SimulatedFirmware
+from .simulator import MicrobitSimulator
+
+__all__ = ["SimulatedFirmware", "MicrobitSimulator"]
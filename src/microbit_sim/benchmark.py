@@ -0,0 +1,299 @@
+"""
+End-to-end benchmark for micro:bit MCP tool calls.
+
+This module starts a simulated micro:bit, launches the microbit-mcp server
+against it over stdio, fires a configurable mix of tool calls at several
+concurrency levels and reports cold-start timings, latency percentiles,
+throughput and serial bytes per call as JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import shlex
+import sys
+import time
+from typing import Optional
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+
+from .simulator import MicrobitSimulator
+
+# Arguments used for each tool in the call mix
+TOOL_ARGUMENTS = {
+    "display_message": {"message": "Hi"},
+    "display_image": {"image": "00300:03630:36963:03630:00300"},
+    "display_animation": {
+        "frames": ["00000:00000:00900:00000:00000", "00000:09990:09090:09990:00000", "99999:90009:90009:90009:99999"]
+    },
+    "get_temperature": {},
+    "play_music": {"notes": ["C4:1", "E4:1", "G4:1"]},
+    "wait_for_button_press": {"button": "a", "timeout": 2.0},
+}
+
+DEFAULT_MIX = "display_message=1,display_image=1,get_temperature=1,play_music=1,wait_for_button_press=1"
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """Parse TOOL=WEIGHT[,TOOL=WEIGHT...] into a weight per tool."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in TOOL_ARGUMENTS:
+            raise argparse.ArgumentTypeError(f"unknown tool in mix: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted samples."""
+    if not samples:
+        return 0.0
+    # The smallest sample with at least fraction of the samples at or below it
+    index = min(len(samples) - 1, max(0, math.ceil(fraction * len(samples)) - 1))
+    return samples[index]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency summary in milliseconds."""
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 0.50), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "p99_ms": round(percentile(samples, 0.99), 3),
+        "mean_ms": round(sum(samples) / len(samples), 3) if samples else 0.0,
+        "max_ms": round(samples[-1], 3) if samples else 0.0,
+    }
+
+
+async def run_scenario(
+    session: ClientSession,
+    simulator: MicrobitSimulator,
+    calls: list[str],
+    concurrency: int
+) -> dict:
+    """
+    Run a list of tool calls with a fixed number of concurrent callers.
+
+    Args:
+        session: Initialized MCP client session
+        simulator: Simulated board the server is connected to
+        calls: Tool names to call, in order
+        concurrency: Number of calls kept in flight at once
+
+    Returns:
+        Scenario results
+    """
+    pending = iter(calls)
+    latencies: dict[str, list[float]] = {}
+    errors = 0
+
+    async def caller() -> None:
+        nonlocal errors
+        for name in pending:
+            start = time.perf_counter()
+            try:
+                result = await session.call_tool(name, TOOL_ARGUMENTS[name])
+                failed = result.isError
+            except Exception:
+                failed = True
+            latencies.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+            errors += failed
+
+    bytes_in, bytes_out = simulator.bytes_in, simulator.bytes_out
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    duration = time.perf_counter() - start
+    # Let trailing device output (e.g. completion events) reach the counters
+    await asyncio.sleep(0.1)
+    bytes_in = simulator.bytes_in - bytes_in
+    bytes_out = simulator.bytes_out - bytes_out
+
+    all_latencies = [sample for samples in latencies.values() for sample in samples]
+    return {
+        "concurrency": concurrency,
+        "calls": len(calls),
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "calls_per_second": round(len(calls) / duration, 3),
+        "latency": summarize(all_latencies),
+        "serial_bytes_per_call": {
+            "to_device": round(bytes_in / len(calls), 2),
+            "from_device": round(bytes_out / len(calls), 2),
+            "total": round((bytes_in + bytes_out) / len(calls), 2),
+        },
+        "tools": {name: summarize(samples) for name, samples in sorted(latencies.items())},
+    }
+
+
+async def run_benchmark(
+    mix: dict[str, float],
+    calls: int,
+    concurrency_levels: list[int],
+    server_command: Optional[list[str]] = None,
+    seed: int = 0,
+    **simulator_options
+) -> dict:
+    """
+    Benchmark the MCP server end to end against a simulated board.
+
+    Args:
+        mix: Relative weight of each tool in the call mix
+        calls: Number of tool calls per concurrency level
+        concurrency_levels: Concurrency levels to run, 1 meaning sequential
+        server_command: Command starting the server, before the port option;
+            defaults to the cli_main entry point in this interpreter
+        seed: Seed for the order of calls in the mix
+        **simulator_options: Passed to MicrobitSimulator
+
+    Returns:
+        Benchmark report
+    """
+    rng = random.Random(seed)
+    names = list(mix)
+    call_list = rng.choices(names, weights=[mix[name] for name in names], k=calls)
+
+    command = server_command or [sys.executable, "-m", "mcp_server.server"]
+    async with MicrobitSimulator(**simulator_options) as simulator:
+        params = StdioServerParameters(
+            command=command[0],
+            args=[*command[1:], "--port", simulator.port]
+        )
+        # Cold start as an agent framework sees it, from spawning the server
+        startup = {}
+        start = time.perf_counter()
+        async with stdio_client(params) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                startup["initialize_s"] = round(time.perf_counter() - start, 3)
+                await session.list_tools()
+                startup["list_tools_s"] = round(time.perf_counter() - start, 3)
+                await session.call_tool("get_temperature", {})
+                startup["first_tool_call_s"] = round(time.perf_counter() - start, 3)
+                scenarios = [
+                    await run_scenario(session, simulator, call_list, concurrency)
+                    for concurrency in concurrency_levels
+                ]
+
+    return {
+        "config": {
+            "mix": mix,
+            "calls": calls,
+            "concurrency_levels": concurrency_levels,
+            "server_command": command,
+            "seed": seed,
+            "simulator": {key: value for key, value in simulator_options.items() if value is not None},
+        },
+        "startup": startup,
+        "scenarios": scenarios,
+    }
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark micro:bit MCP tool calls against a simulated board",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                        # Default mix, sequential and 8 concurrent
+  %(prog)s --mix get_temperature=3,display_image=1 --calls 500
+  %(prog)s --concurrency 1,4,16 -o results.json  # Write the JSON report to a file
+  %(prog)s --server-command "uv run microbit-mcp"
+        """
+    )
+
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=parse_mix(DEFAULT_MIX),
+        help="Tool call weights as TOOL=WEIGHT,... (default: every tool equally)"
+    )
+
+    parser.add_argument(
+        "-n", "--calls",
+        type=int,
+        default=100,
+        help="Tool calls per concurrency level (default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "-c", "--concurrency",
+        type=lambda value: [int(level) for level in value.split(",")],
+        default=[1, 8],
+        help="Comma-separated concurrency levels, 1 is sequential (default: 1,8)"
+    )
+
+    parser.add_argument(
+        "--server-command",
+        type=shlex.split,
+        help="Command starting the MCP server; --port is appended (default: this Python's mcp_server)"
+    )
+
+    parser.add_argument(
+        "--baud",
+        type=int,
+        default=115200,
+        help="Simulated serial line rate, 0 for unthrottled (default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--scroll-delay-ms",
+        type=int,
+        default=150,
+        help="Simulated display.scroll delay per column (default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--tempo-bpm",
+        type=int,
+        default=120,
+        help="Simulated music tempo (default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed for the call order (default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "-o", "--output",
+        help="Write the JSON report to this file instead of stdout"
+    )
+
+    return parser.parse_args()
+
+
+def cli_main():
+    """Synchronous entry point for CLI."""
+    args = parse_arguments()
+
+    report = asyncio.run(run_benchmark(
+        args.mix,
+        args.calls,
+        args.concurrency,
+        server_command=args.server_command,
+        seed=args.seed,
+        baudrate=args.baud or None,
+        scroll_delay_ms=args.scroll_delay_ms,
+        tempo_bpm=args.tempo_bpm,
+        repeat_press=(0.05, "a"),
+    ))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    cli_main()
@@ -0,0 +1,676 @@
+"""
+Simulated micro:bit firmware.
+
+This module mirrors the command semantics of src/microbit/main.py and
+extras.py (display, temperature, button waits, music, programs and status
+events) without any hardware or transport. Lines go in through process_command and replies come out
+through the emit callback.
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Callable, Optional
+
+# Matches the firmware's buffer and store sizes
+RX_BUFFER_SIZE = 512
+RX_WINDOW = 64
+MAX_ANIMATION_FRAMES = 64
+MELODY_CACHE_NOTES = 124
+MAX_PROGRAM_INSTRUCTIONS = 64
+MAX_PROGRAM_DEPTH = 4
+PROGRAM_STEPS = 16
+
+# Reported by IDENTIFY:, by main.py and by extras.py when it is loaded
+FIRMWARE_VERSION = "0.1.0"
+CAPABILITIES = ("events", "ping", "flow", "cancel")
+EXTRA_CAPABILITIES = ("bin", "melodies", "stream", "anim", "prog")
+
+# Commands only extras.py knows; main.py alone leaves them unanswered
+EXTRA_COMMANDS = ("MELODY:", "PLAY_ID:", "MELODIES:", "PROG:", "PROTO:", "STREAM:", "ANIM_ADD:", "ANIM:")
+
+# What Image() accepts from an IMAGE: command
+_IMAGE_PATTERN = re.compile(r"^[0-9]{5}(:[0-9]{5}){4}$")
+
+
+def split_sequence(cmd: str) -> tuple[str, str]:
+    """Split the optional #seq# envelope off a command, keeping it verbatim."""
+    if cmd.startswith("#"):
+        end = cmd.find("#", 1)
+        if end > 0:
+            return cmd[:end + 1], cmd[end + 1:]
+    return "", cmd
+
+
+class SimulatedFirmware:
+    """Command processor behaving like the micro:bit firmware."""
+
+    def __init__(
+        self,
+        emit: Callable[[str], None],
+        temperature: int = 21,
+        delays: Optional[dict[str, float]] = None,
+        auto_press: Optional[tuple[float, str]] = None,
+        scroll_delay_ms: int = 150,
+        tempo_bpm: int = 120,
+        clock_drift_ppm: float = 0.0,
+        board_id: Optional[str] = None,
+        extras: bool = True
+    ):
+        """
+        Initialize the simulated firmware.
+
+        Args:
+            emit: Called with every line the device prints (without newline)
+            temperature: Reading returned by the temperature sensor
+            delays: Extra device-side processing time in seconds per command
+                prefix, e.g. {"TEMP:": 0.02}
+            auto_press: Optional (delay, button) pressed automatically that
+                many seconds after every WAIT_BUTTON: command
+            scroll_delay_ms: Time per column when scrolling text, as
+                display.scroll's delay argument
+            tempo_bpm: Music tempo used to compute how long notes take to play
+            clock_drift_ppm: How much faster (or, negative, slower) the
+                device's running_time() runs than the host clock
+            board_id: Unique ID reported by IDENTIFY:, random by default
+            extras: Run extras.py next to main.py, as on a V2; without it
+                the board has only the core features, as a V1
+        """
+        self.emit = emit
+        self.temperature = temperature
+        self.delays = delays or {}
+        self.auto_press = auto_press
+        self.scroll_delay_ms = scroll_delay_ms
+        self.tempo_bpm = tempo_bpm
+        self.clock_drift_ppm = clock_drift_ppm
+        self.board_id = board_id or os.urandom(8).hex()
+        self.extras = extras
+        self.start_time = time.monotonic()
+
+        # Observable device state
+        self.display = ""
+        self.scrolled: list[str] = []
+        self.played: list[list[str]] = []
+        self.commands: list[str] = []
+        # Commands stopped by CANCEL: (envelope, what stopped)
+        self.cancelled: list[tuple[str, str]] = []
+
+        # Pending button waits: [seq, button, timeout, timer handle]
+        self.button_waits: list[list] = []
+
+        # Sensor streaming task (STREAM:), if running
+        self.stream_task: Optional[asyncio.Task] = None
+
+        # Frames staged by ANIM_ADD:
+        self.anim_frames: list[str] = []
+        self.animations: list[list[str]] = []
+
+        # Background scroll or animation, and the status event (message,
+        # seq) sent if it is cut short
+        self.display_task: Optional[asyncio.Task] = None
+        self.display_stopped: tuple[str, str] = ("", "")
+
+        # Melodies kept for PLAY_ID:, least recently used first
+        self.melodies: dict[str, list[str]] = {}
+
+        # Background music and the status event sent if it is cut short
+        self.music_task: Optional[asyncio.Task] = None
+        self.music_stopped: tuple[str, str] = ("", "")
+
+        # Program run by PROG: and its interpreter state, as in the firmware:
+        # sequence envelope, next instruction, loops ([body, end, iterations
+        # left or -1, until button, start]), button wait ([button, start,
+        # deadline or 0]), sleep end and start time, all in running_time() ms
+        self.programs: list[list[str]] = []
+        self.program: Optional[list[str]] = None
+        self.program_seq = ""
+        self.program_pc = 0
+        self.program_loops: list[list] = []
+        self.program_wait: Optional[list] = None
+        self.program_wake = 0
+        self.program_start = 0
+        self.program_task: Optional[asyncio.Task] = None
+        self.program_wakeup = asyncio.Event()
+
+        # Replies are sent as binary frames after PROTO:bin
+        self.binary_out = False
+
+        # Every press and release is reported unless turned off with EVENTS:off
+        self.button_events = True
+
+        # Flow control (FLOW:): bytes read from the UART since FLOW:, as
+        # counted and as last reported, and the part of the current read
+        # following the line being processed (set by the transport)
+        self.flow_control = False
+        self.rx_consumed = 0
+        self.rx_reported = 0
+        self.rx_remaining = 0
+
+    def running_time(self) -> int:
+        """Milliseconds since the device started, as microbit.running_time()."""
+        return int((time.monotonic() - self.start_time) * 1000 * (1 + self.clock_drift_ppm / 1e6))
+
+    def send_status_event(self, message: str, seq: str = "") -> None:
+        """Send status event."""
+        self.emit(f"{seq}STATUS|{message}|{self.running_time()}")
+
+    def received(self, count: int) -> None:
+        """Count bytes the main loop read from the UART."""
+        self.rx_consumed = (self.rx_consumed + count) & 0xFFFF
+
+    def send_credit(self, drained: bool) -> None:
+        """
+        Report the bytes read since FLOW:, like the firmware after each read.
+
+        Args:
+            drained: Whether the UART has no more bytes waiting; otherwise a
+                credit is only sent once half a window has been read
+        """
+        if not self.flow_control or self.rx_consumed == self.rx_reported:
+            return
+        if drained or (self.rx_consumed - self.rx_reported) & 0xFFFF >= RX_WINDOW // 2:
+            self.emit(f"CREDIT|{self.rx_consumed}")
+            self.rx_reported = self.rx_consumed
+
+    def scroll_duration(self, message: str) -> float:
+        """Seconds display.scroll takes: 5 columns plus a gap per character."""
+        return len(message) * 6 * self.scroll_delay_ms / 1000
+
+    def music_duration(self, notes: list[str]) -> float:
+        """Seconds music.play takes, using sticky durations like the micro:bit."""
+        tick = 60 / self.tempo_bpm / 4
+        duration = 4
+        total = 0.0
+        for note in notes:
+            if ":" in note:
+                duration = int(note.split(":")[1])
+            total += duration * tick
+        return total
+
+    async def process_command(self, line: str) -> None:
+        """
+        Process one command line from the MCP server.
+
+        A command that fails is answered with an error carrying its
+        sequence envelope, like the firmware, which carries on.
+
+        Args:
+            line: Command line without its trailing newline
+        """
+        self.commands.append(line)
+        seq, cmd = split_sequence(line.strip())
+        try:
+            await self.run_command(seq, cmd)
+        except MemoryError:
+            self.send_status_event("error:memory", seq)
+        except Exception as e:
+            self.send_status_event("error:command_failed:" + type(e).__name__, seq)
+
+    async def run_command(self, seq: str, cmd: str) -> None:
+        """Process a command with its sequence envelope split off."""
+
+        for prefix, delay in self.delays.items():
+            if cmd.startswith(prefix):
+                await asyncio.sleep(delay)
+
+        if not self.extras and cmd.startswith(EXTRA_COMMANDS):
+            return
+
+        if cmd.startswith("PING:"):
+            self.send_status_event("pong", seq)
+        if cmd.startswith("IDENTIFY:"):
+            capabilities = CAPABILITIES + EXTRA_CAPABILITIES if self.extras else CAPABILITIES
+            self.send_status_event(
+                "identify:" + self.board_id + ":" + FIRMWARE_VERSION + ":" + ",".join(capabilities), seq
+            )
+        if cmd.startswith("CANCEL:"):
+            self.send_status_event("cancelled:" + cmd[7:] + ":" + self.cancel("#" + cmd[7:] + "#"), seq)
+        if cmd.startswith("FLOW:"):
+            self.flow_control = True
+            self.rx_consumed = self.rx_remaining
+            self.rx_reported = 0
+            self.send_status_event("flow:" + str(RX_WINDOW), seq)
+        if cmd.startswith("MESSAGE:"):
+            message = cmd[8:]
+            self.start_display(self._scroll(message, seq), ("scroll_stopped:" + message, seq))
+            self.send_status_event("scrolling:" + message, seq)
+        if cmd.startswith("IMAGE:"):
+            image = cmd[6:]
+            if not _IMAGE_PATTERN.match(image):
+                raise ValueError("invalid image")
+            self.stop_display()
+            self.display = image
+            self.send_status_event("displayed:" + image, seq)
+        if cmd.startswith("TEMP:"):
+            self.emit(f"{seq}TEMP|{self.temperature}|{self.running_time()}")
+        if cmd.startswith("WAIT_BUTTON:"):
+            parts = cmd.split(":")
+            if len(parts) >= 3:
+                self.wait_for_button(seq, parts[1], float(parts[2]))
+                self.send_status_event("waiting_for_button:" + parts[1], seq)
+        if cmd.startswith("MUSIC:"):
+            notes_str = cmd[6:]
+            if notes_str:
+                self.play_notes(notes_str.split(","), seq)
+            else:
+                self.send_status_event("music_error:no_notes_provided", seq)
+        if cmd.startswith("MELODY:"):
+            parts = cmd.split(":", 2)
+            if len(parts) == 3 and parts[2]:
+                notes = parts[2].split(",")
+                if self.play_notes(notes, seq):
+                    self.store_melody(parts[1], notes)
+            else:
+                self.send_status_event("music_error:no_notes_provided", seq)
+        if cmd.startswith("PLAY_ID:"):
+            melody = cmd[8:]
+            if melody in self.melodies:
+                self.melodies[melody] = self.melodies.pop(melody)
+                self.play_notes(self.melodies[melody], seq)
+            else:
+                self.send_status_event("music_error:unknown_melody", seq)
+        if cmd.startswith("PROG:"):
+            if not cmd[5:]:
+                self.stop_program("prog_stopped")
+                self.send_status_event("prog_idle", seq)
+                return
+            instructions = cmd[5:].split(";")
+            if len(instructions) > MAX_PROGRAM_INSTRUCTIONS:
+                self.send_status_event("prog_error:too_long", seq)
+                return
+            self.start_program(seq, instructions)
+            self.send_status_event("prog_started:" + str(len(instructions)), seq)
+        if cmd.startswith("MELODIES:"):
+            entries = [f"{melody}/{len(notes)}" for melody, notes in self.melodies.items()]
+            self.send_status_event(f"melodies:{MELODY_CACHE_NOTES}:" + ",".join(entries), seq)
+        if cmd.startswith("EVENTS:"):
+            setting = cmd[7:]
+            if setting in ("on", "off"):
+                self.button_events = setting == "on"
+                self.send_status_event("events:" + setting, seq)
+            else:
+                self.send_status_event("events_error:unknown_setting", seq)
+        if cmd.startswith("PROTO:"):
+            encoding = cmd[6:]
+            if encoding in ("text", "bin"):
+                self.send_status_event("proto:" + encoding, seq)
+                self.binary_out = encoding == "bin"
+            else:
+                self.send_status_event("proto_error:unknown_encoding", seq)
+        if cmd.startswith("STREAM:"):
+            parts = cmd.split(":")
+            if len(parts) >= 3 and parts[1] == "temp":
+                self.stop_stream()
+                interval_ms = int(parts[2])
+                if interval_ms > 0:
+                    self.stream_task = asyncio.create_task(self._stream(interval_ms))
+                    self.send_status_event("streaming:temp:" + parts[2], seq)
+                else:
+                    self.send_status_event("stream_stopped:temp", seq)
+            else:
+                self.send_status_event("stream_error:unknown_sensor", seq)
+        if cmd.startswith("ANIM_ADD:"):
+            parts = cmd.split(":", 2)
+            frames = self.parse_frames(parts[2]) if len(parts) == 3 and parts[1].isdigit() else None
+            if frames is None:
+                self.anim_frames = []
+                self.send_status_event("anim_error:bad_frame", seq)
+                return
+            if int(parts[1]) > len(self.anim_frames):
+                self.anim_frames = []
+                self.send_status_event("anim_error:missing_frames", seq)
+                return
+            self.anim_frames = self.anim_frames[:int(parts[1])] + frames
+            if len(self.anim_frames) > MAX_ANIMATION_FRAMES:
+                self.anim_frames = []
+                self.send_status_event("anim_error:too_many_frames", seq)
+                return
+            self.send_status_event("anim_staged:" + str(len(self.anim_frames)), seq)
+        if cmd.startswith("ANIM:"):
+            parts = cmd.split(":", 4)
+            frames = self.parse_frames(parts[4]) if len(parts) == 5 else None
+            if frames is None or not all(part.isdigit() for part in parts[1:4]):
+                self.anim_frames = []
+                self.send_status_event("anim_error:bad_frame", seq)
+                return
+            staged = int(parts[3])
+            if staged and staged != len(self.anim_frames):
+                self.send_status_event("anim_error:staged:" + str(len(self.anim_frames)), seq)
+                self.anim_frames = []
+                return
+            frames = self.anim_frames[:staged] + frames
+            self.anim_frames = []
+            if len(frames) > MAX_ANIMATION_FRAMES:
+                self.send_status_event("anim_error:too_many_frames", seq)
+                return
+            count = str(len(frames))
+            self.start_display(
+                self._animate(frames, int(parts[1]), int(parts[2]), seq),
+                ("animation_stopped:" + count, seq)
+            )
+            self.send_status_event("animating:" + str(len(frames)), seq)
+
+    @staticmethod
+    def parse_frames(frames_str: str) -> Optional[list[str]]:
+        """Convert comma separated 25-digit frames to image patterns, or None if malformed."""
+        frames = []
+        for digits in frames_str.split(","):
+            if len(digits) != 25 or not digits.isdigit():
+                return None
+            frames.append(":".join(digits[i:i + 5] for i in range(0, 25, 5)))
+        return frames
+
+    async def _animate(self, frames: list[str], delay_ms: int, loops: int, seq: str) -> None:
+        """Show the frames like display.show(..., wait=False), then report completion."""
+        self.animations.append(frames)
+        played = 0
+        while not loops or played < loops:
+            for frame in frames:
+                self.display = frame
+                await asyncio.sleep(delay_ms / 1000)
+            played += 1
+        self.display_task = None
+        self.send_status_event("animation_done:" + str(len(frames)), seq)
+
+    async def _scroll(self, message: str, seq: str) -> None:
+        """Scroll like display.scroll(..., wait=False), then report completion."""
+        await asyncio.sleep(self.scroll_duration(message))
+        self.display_task = None
+        self.scrolled.append(message)
+        self.send_status_event("displayed:" + message, seq)
+
+    def play_notes(self, notes: list[str], seq: str) -> bool:
+        """Start playing notes in the background; False if they were rejected."""
+        try:
+            duration = self.music_duration(notes)
+        except ValueError as e:
+            self.send_status_event("music_error:" + str(e), seq)
+            return False
+        self.stop_music()
+        self.music_task = asyncio.create_task(self._play(notes, duration, seq))
+        self.music_stopped = ("music_stopped:" + str(len(notes)) + "_notes", seq)
+        self.send_status_event("playing:" + str(len(notes)) + "_notes", seq)
+        return True
+
+    def store_melody(self, melody: str, notes: list[str]) -> None:
+        """Keep a melody for PLAY_ID:, evicting the least recently used like the firmware."""
+        self.melodies.pop(melody, None)
+        while self.melodies and sum(map(len, self.melodies.values())) + len(notes) > MELODY_CACHE_NOTES:
+            del self.melodies[next(iter(self.melodies))]
+        if len(notes) <= MELODY_CACHE_NOTES:
+            self.melodies[melody] = notes
+
+    async def _play(self, notes: list[str], duration: float, seq: str) -> None:
+        """Play like music.play(..., wait=False), then report completion."""
+        await asyncio.sleep(duration)
+        self.music_task = None
+        self.played.append(notes)
+        self.send_status_event("music_played:" + str(len(notes)) + "_notes", seq)
+
+    def start_display(self, activity, stopped: tuple[str, str]) -> None:
+        """Run a scroll or animation in the background, replacing the current one."""
+        self.stop_display()
+        self.display_task = asyncio.create_task(activity)
+        self.display_stopped = stopped
+
+    def stop_display(self) -> None:
+        """Cut the background scroll or animation short, reporting it like the firmware."""
+        if self.display_task:
+            self.display_task.cancel()
+            self.display_task = None
+            self.send_status_event(*self.display_stopped)
+
+    def cancel(self, target: str) -> str:
+        """
+        Stop what the command with a sequence envelope started, without reporting it.
+
+        Args:
+            target: The command's #seq# envelope
+
+        Returns:
+            What was stopped: "wait", "display", "music", "program", or "none"
+            if it had ended
+        """
+        stopped = "none"
+        for wait in self.button_waits[:]:
+            if wait[0] == target:
+                self.button_waits.remove(wait)
+                wait[3].cancel()
+                stopped = "wait"
+        if self.display_task and self.display_stopped[1] == target:
+            self.display_task.cancel()
+            self.display_task = None
+            self.display = ""
+            stopped = "display"
+        if self.music_task and self.music_stopped[1] == target:
+            self.music_task.cancel()
+            self.music_task = None
+            stopped = "music"
+        if self.program is not None and self.program_seq == target:
+            self.stop_program(None)
+            stopped = "program"
+        self.cancelled.append((target, stopped))
+        return stopped
+
+    def start_program(self, seq: str, instructions: list[str]) -> None:
+        """Start running a program in the background, replacing the running one."""
+        self.stop_program("prog_stopped")
+        self.programs.append(instructions)
+        self.program = instructions
+        self.program_seq = seq
+        self.program_pc = 0
+        self.program_loops = []
+        self.program_wait = None
+        self.program_wake = 0
+        self.program_start = self.running_time()
+        self.program_task = asyncio.create_task(self._run_program())
+
+    def stop_program(self, message: Optional[str]) -> None:
+        """End the running program, reporting message and the ms it ran (None to end it silently)."""
+        if self.program is None:
+            return
+        if message:
+            self.send_status_event(message + ":" + str(self.running_time() - self.program_start), self.program_seq)
+        self.program = None
+        if self.program_task and self.program_task is not asyncio.current_task():
+            self.program_task.cancel()
+        self.program_task = None
+
+    async def _run_program(self) -> None:
+        """Step the program like the firmware's main loop, waking for its sleeps, waits and presses."""
+        while self.program is not None:
+            delay = self.step_program()
+            if self.program is None:
+                return
+            self.program_wakeup.clear()
+            try:
+                await asyncio.wait_for(self.program_wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def program_press(self, button: str) -> None:
+        """Let a press end the outermost repeat-until loop for it, or answer the button wait."""
+        if self.program is None:
+            return
+        now = self.running_time()
+        for i, loop in enumerate(self.program_loops):
+            if loop[3] in (button, "any"):
+                self.send_status_event(f"prog_button:{button}:{now - loop[4]}", self.program_seq)
+                self.program_pc = loop[1]
+                del self.program_loops[i:]
+                self.program_wait = None
+                self.program_wake = 0
+                self.program_wakeup.set()
+                return
+        if self.program_wait is not None and self.program_wait[0] in (button, "any"):
+            self.send_status_event(f"prog_button:{button}:{now - self.program_wait[1]}", self.program_seq)
+            self.program_wait = None
+            self.program_wakeup.set()
+
+    def step_program(self) -> Optional[float]:
+        """
+        Run instructions until one sleeps or waits, the program ends, or
+        PROGRAM_STEPS have run, like one pass of the firmware's main loop.
+
+        Returns:
+            Seconds until the program needs to run again, None if only a
+            press can make it go on
+        """
+        now = self.running_time()
+        if self.program_wait is not None:
+            if not self.program_wait[2]:
+                return None
+            if now < self.program_wait[2]:
+                return (self.program_wait[2] - now) / 1000
+            self.send_status_event("prog_button_timeout:" + self.program_wait[0], self.program_seq)
+            self.program_wait = None
+        if now < self.program_wake:
+            return (self.program_wake - now) / 1000
+        for _ in range(PROGRAM_STEPS):
+            if self.program_pc >= len(self.program):
+                self.stop_program("prog_done")
+                return 0
+            op = self.program[self.program_pc]
+            self.program_pc += 1
+            try:
+                if self.run_instruction(op[:1], op[1:]):
+                    return self.step_program()
+            except (ValueError, IndexError):
+                self.send_status_event(f"prog_error:bad_instruction:{self.program_pc - 1}", self.program_seq)
+                self.stop_program(None)
+                return 0
+        return 0
+
+    def run_instruction(self, code: str, arg: str) -> bool:
+        """Carry out one program instruction; True if it sleeps or waits."""
+        if code == "I":
+            frames = self.parse_frames(arg)
+            if frames is None:
+                raise ValueError("bad frame")
+            self.stop_display()
+            self.display = frames[0]
+        elif code == "D":
+            self.stop_display()
+            self.scrolled.append(arg)
+        elif code == "X":
+            self.stop_display()
+            self.display = ""
+        elif code == "S":
+            self.program_wake = self.running_time() + int(arg)
+            return True
+        elif code == "P":
+            notes = arg.split(",")
+            self.music_duration(notes)
+            self.stop_music()
+            self.played.append(notes)
+        elif code == "K":
+            button, timeout = arg.split(":")
+            now = self.running_time()
+            self.program_wait = [button, now, now + int(timeout) if int(timeout) else 0]
+            return True
+        elif code == "T":
+            self.stop_display()
+            self.scrolled.append(str(self.temperature))
+            self.send_status_event("prog_temp:" + str(self.temperature), self.program_seq)
+        elif code == "M":
+            self.send_status_event("prog_mark:" + arg, self.program_seq)
+        elif code == "L":
+            times, until, end = arg.split(":")
+            if len(self.program_loops) >= MAX_PROGRAM_DEPTH:
+                raise ValueError("too deep")
+            self.program_loops.append([self.program_pc, int(end), int(times) or -1, until, self.running_time()])
+        elif code == "E":
+            loop = self.program_loops[-1]
+            if loop[2] > 0:
+                loop[2] -= 1
+            if loop[2]:
+                self.program_pc = loop[0]
+            else:
+                self.program_loops.pop()
+        else:
+            raise ValueError("unknown instruction")
+        return False
+
+    def stop_music(self) -> None:
+        """Cut the playing music short, reporting it like the firmware."""
+        if self.music_task:
+            self.music_task.cancel()
+            self.music_task = None
+            self.send_status_event(*self.music_stopped)
+
+    def wait_for_button(self, seq: str, button: str, timeout: float) -> None:
+        """Register a pending button wait that times out like the firmware's."""
+        loop = asyncio.get_running_loop()
+        wait = [seq, button, timeout, None]
+        wait[3] = loop.call_later(timeout, self._button_timeout, wait)
+        self.button_waits.append(wait)
+
+        if self.auto_press:
+            delay, pressed = self.auto_press
+            loop.call_later(delay, self.press, pressed)
+
+    def _button_timeout(self, wait: list) -> None:
+        if wait in self.button_waits:
+            self.button_waits.remove(wait)
+            self.emit(f"{wait[0]}BUTTON_TIMEOUT|{wait[1]}|{wait[2]}")
+
+    def press(self, button: str, hold: float = 0.1) -> None:
+        """
+        Simulate a press of one of the buttons.
+
+        Args:
+            button: "a" or "b"
+            hold: Seconds until the button is released
+        """
+        if self.button_events:
+            self.emit(f"BUTTON|{button}|pressed|{self.running_time()}")
+            asyncio.get_running_loop().call_later(hold, self._release, button)
+        for wait in self.button_waits[:]:
+            if wait[1] == button or wait[1] == "any":
+                self.button_waits.remove(wait)
+                wait[3].cancel()
+                self.emit(f"{wait[0]}BUTTON|{button}|pressed|{self.running_time()}")
+        self.program_press(button)
+
+    def _release(self, button: str) -> None:
+        if self.button_events:
+            self.emit(f"BUTTON|{button}|released|{self.running_time()}")
+
+    async def _stream(self, interval_ms: int) -> None:
+        """Push a temperature sample every interval, like the firmware's main loop."""
+        while True:
+            self.emit(f"SAMPLE|temp|{self.temperature}|{self.running_time()}")
+            await asyncio.sleep(interval_ms / 1000)
+
+    def stop_stream(self) -> None:
+        """Stop the sensor stream, if running."""
+        if self.stream_task:
+            self.stream_task.cancel()
+            self.stream_task = None
+
+    def reset(self) -> None:
+        """Return to the power-on state, as after a reset or reconnecting the cable."""
+        self.close()
+        self.display = ""
+        self.binary_out = False
+        self.button_events = True
+        self.flow_control = False
+        self.rx_consumed = 0
+        self.rx_reported = 0
+        self.melodies.clear()
+        self.start_time = time.monotonic()
+
+    def close(self) -> None:
+        """Cancel outstanding button wait timers, streams, display activity, music and programs."""
+        for wait in self.button_waits:
+            wait[3].cancel()
+        self.button_waits.clear()
+        self.stop_stream()
+        for task in (self.display_task, self.music_task):
+            if task:
+                task.cancel()
+        self.display_task = None
+        self.music_task = None
+        self.anim_frames = []
+        self.stop_program(None)
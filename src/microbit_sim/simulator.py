@@ -0,0 +1,437 @@
+"""
+Pseudo-terminal transport for the simulated micro:bit.
+
+This module exposes SimulatedFirmware on a pty, so MicrobitClient (and the
+microbit-mcp server) can open it by path exactly like a real board, with
+optional serial line-rate throttling in both directions. unplug and plug
+mimic pulling and reconnecting the USB cable, which resets the board.
+
+Incoming bytes land in a UART receive buffer of the board's size, which a
+main loop drains with the firmware's polling back-off; bytes arriving
+while it is full are lost, as on the board, and counted in rx_dropped.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tty
+from typing import Optional
+
+from mcp_server.framing import FrameParser, decode_command, encode_response
+
+from .firmware import RX_BUFFER_SIZE, RX_WINDOW, SimulatedFirmware, split_sequence
+
+# The firmware's main loop sleep in ms: IDLE_SLEEP_MIN while commands are
+# arriving, doubling up to IDLE_SLEEP_MAX when idle
+IDLE_SLEEP_MIN = 1
+IDLE_SLEEP_MAX = 20
+# Before it drained the UART in bulk, the firmware read one byte per pass of
+# a main loop that slept this long (ms) every time round
+LEGACY_LOOP_SLEEP = 50
+
+
+class MicrobitSimulator:
+    """Simulated micro:bit served on a pseudo-terminal."""
+
+    def __init__(
+        self,
+        baudrate: Optional[int] = 115200,
+        presses: tuple = (),
+        repeat_press: Optional[tuple[float, str]] = None,
+        startup_delay: float = 0.0,
+        link: Optional[str] = None,
+        uart_buffer: Optional[int] = RX_WINDOW,
+        legacy_loop: bool = False,
+        **firmware_options
+    ):
+        """
+        Initialize the simulator.
+
+        Args:
+            baudrate: Serial line rate to throttle both directions to (10 bits
+                per byte), or None for no throttling
+            presses: Scripted button presses as (seconds after start, button)
+            repeat_press: Optional (interval, button) pressed over and over,
+                every interval seconds
+            startup_delay: Seconds before the device reports STATUS|ready
+            link: Optional path to symlink the pty to; it is the path that
+                stays valid across unplug and plug
+            uart_buffer: Size in bytes of the UART receive buffer, or None
+                for a buffer that never overflows
+            legacy_loop: Read one byte per 50 ms loop pass, like the firmware
+                before it drained the UART in bulk, to compare latencies
+            **firmware_options: Passed to SimulatedFirmware (temperature,
+                delays, auto_press, scroll_delay_ms, tempo_bpm, clock_drift_ppm,
+                board_id, extras)
+        """
+        self.baudrate = baudrate
+        self.presses = presses
+        self.repeat_press = repeat_press
+        self.startup_delay = startup_delay
+        self.link = link
+        self.uart_buffer = uart_buffer
+        self.legacy_loop = legacy_loop
+        self.firmware = SimulatedFirmware(self._emit, **firmware_options)
+        self.port: Optional[str] = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.rx_dropped = 0
+        self._rx = bytearray()
+        self._rx_ready = asyncio.Event()
+        self._master: Optional[int] = None
+        self._slave: Optional[int] = None
+        self._output: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._timers: list[asyncio.TimerHandle] = []
+        self._transports: list[asyncio.BaseTransport] = []
+
+    def _transfer_time(self, size: int) -> float:
+        """Seconds it takes to move size bytes over the simulated serial line."""
+        if not self.baudrate:
+            return 0.0
+        return size * 10 / self.baudrate
+
+    def _emit(self, line: str) -> None:
+        frame = encode_response(line) if self.firmware.binary_out else None
+        self._output.put_nowait(frame or (line + "\r\n").encode())
+
+    async def start(self) -> str:
+        """
+        Create the pseudo-terminal and start serving the simulated device.
+
+        Returns:
+            Path of the pty (or its link) to pass to MicrobitClient
+        """
+        await self._open_port()
+        loop = asyncio.get_running_loop()
+        for at, button in self.presses:
+            self._timers.append(loop.call_later(at, self.firmware.press, button))
+        if self.repeat_press:
+            self._timers.append(loop.call_later(self.repeat_press[0], self._press_again))
+        return self.link or self.port
+
+    def _press_again(self) -> None:
+        interval, button = self.repeat_press
+        self.firmware.press(button, hold=interval / 2)
+        self._timers[-1] = asyncio.get_running_loop().call_later(interval, self._press_again)
+
+    async def _open_port(self) -> None:
+        """Create a pty and start the transport tasks; the board boots and reports ready."""
+        loop = asyncio.get_running_loop()
+        self._master, self._slave = os.openpty()
+        # No echo or newline translation; the slave end stays open so the
+        # host can close and reopen the port without the pty going away
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        if self.link:
+            if os.path.lexists(self.link):
+                os.remove(self.link)
+            os.symlink(self.port, self.link)
+
+        reader = asyncio.StreamReader()
+        read_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader),
+            os.fdopen(self._master, "rb", 0)
+        )
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin,
+            os.fdopen(os.dup(self._master), "wb", 0)
+        )
+        writer = asyncio.StreamWriter(transport, protocol, None, loop)
+
+        self._transports = [read_transport, transport]
+        self.firmware.start_time = time.monotonic()
+        self._tasks = [
+            asyncio.create_task(self._read_loop(reader)),
+            asyncio.create_task(self._write_loop(writer)),
+            asyncio.create_task(self._command_loop()),
+        ]
+
+    async def _close_port(self) -> None:
+        """Stop the transport tasks and close the pty, so the host sees the port vanish."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+        self._master = None
+        if self._slave is not None:
+            os.close(self._slave)
+            self._slave = None
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+        self._output = asyncio.Queue()
+        self._rx.clear()
+
+    async def unplug(self) -> None:
+        """Disconnect the simulated board, as if its USB cable was pulled."""
+        await self._close_port()
+        self.firmware.reset()
+
+    async def plug(self) -> str:
+        """
+        Reconnect the simulated board; it boots again and reports STATUS|ready.
+
+        Returns:
+            Path of the new pty (or its link, which stays the same)
+        """
+        await self._open_port()
+        return self.link or self.port
+
+    async def _read_loop(self, reader: asyncio.StreamReader) -> None:
+        """Receive bytes from the host into the UART buffer, at the simulated line rate."""
+        # About a millisecond's worth of bytes at a time, so the main loop
+        # sees them trickle in
+        step = max(self.baudrate // 10000, 1) if self.baudrate else None
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                return
+            self.bytes_in += len(data)
+            for start in range(0, len(data), step or len(data)):
+                piece = data[start:start + (step or len(data))]
+                await asyncio.sleep(self._transfer_time(len(piece)))
+                room = len(piece) if self.uart_buffer is None else max(self.uart_buffer - len(self._rx), 0)
+                self.rx_dropped += max(len(piece) - room, 0)
+                self._rx += piece[:room]
+                self._rx_ready.set()
+
+    async def _command_loop(self) -> None:
+        """Read the UART buffer and process commands one at a time, like the firmware's main loop."""
+        await asyncio.sleep(self.startup_delay)
+        self.firmware.send_status_event("ready")
+        parser = FrameParser(decode_command)
+        if self.legacy_loop:
+            await self._legacy_command_loop(parser)
+        idle_sleep = IDLE_SLEEP_MIN
+        while True:
+            if not self._rx:
+                # The board sleeps between polls; the simulator also waits
+                # for input so an idle board costs nothing
+                idle_sleep = min(idle_sleep * 2, IDLE_SLEEP_MAX)
+                self._rx_ready.clear()
+                await self._rx_ready.wait()
+                await asyncio.sleep(idle_sleep / 1000)
+                continue
+
+            if parser.buffered >= RX_BUFFER_SIZE:
+                seq, _ = split_sequence(parser.peek(8).decode("utf-8", "ignore"))
+                parser.clear()
+                self.firmware.send_status_event("error:command_too_long", seq)
+            data = bytes(self._rx[:RX_BUFFER_SIZE - parser.buffered])
+            del self._rx[:len(data)]
+            self.firmware.received(len(data))
+            # Byte by byte, so FLOW: knows how much of the read follows it
+            for i in range(len(data)):
+                for line in parser.feed(data[i:i + 1]):
+                    if line:
+                        self.firmware.rx_remaining = len(data) - i - 1
+                        await self.firmware.process_command(line)
+            self.firmware.send_credit(drained=not self._rx)
+            idle_sleep = IDLE_SLEEP_MIN
+            await asyncio.sleep(idle_sleep / 1000)
+
+    async def _legacy_command_loop(self, parser: FrameParser) -> None:
+        """Take one byte per pass, on the old firmware's fixed 50 ms cadence."""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        period = LEGACY_LOOP_SLEEP / 1000
+        while True:
+            if not self._rx:
+                self._rx_ready.clear()
+                await self._rx_ready.wait()
+            else:
+                data = bytes(self._rx[:1])
+                del self._rx[:1]
+                self.firmware.received(1)
+                for line in parser.feed(data):
+                    if line:
+                        self.firmware.rx_remaining = len(self._rx)
+                        await self.firmware.process_command(line)
+            # A byte arriving mid-sleep waits for the next pass
+            await asyncio.sleep(period - (loop.time() - started) % period)
+
+    async def _write_loop(self, writer: asyncio.StreamWriter) -> None:
+        """Send device output to the host at the simulated line rate."""
+        while True:
+            data = await self._output.get()
+            writer.write(data)
+            await writer.drain()
+            self.bytes_out += len(data)
+            await asyncio.sleep(self._transfer_time(len(data)))
+
+    async def stop(self) -> None:
+        """Stop the simulated device and close the pseudo-terminal."""
+        for timer in self._timers:
+            timer.cancel()
+        self.firmware.close()
+        await self._close_port()
+
+    async def __aenter__(self) -> "MicrobitSimulator":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+
+def _parse_press(value: str) -> tuple[float, str]:
+    """Parse SECONDS:BUTTON."""
+    seconds, _, button = value.partition(":")
+    if button not in ("a", "b"):
+        raise argparse.ArgumentTypeError(f"expected SECONDS:a or SECONDS:b, got {value!r}")
+    return float(seconds), button
+
+
+def _parse_delay(value: str) -> tuple[str, float]:
+    """Parse COMMAND=SECONDS."""
+    command, _, seconds = value.partition("=")
+    if not command.endswith(":"):
+        command += ":"
+    return command, float(seconds)
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Simulated micro:bit for the MCP server",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s                                  # Serve a simulated board on a new pty
+  %(prog)s --link /tmp/microbit             # Also symlink the pty to a stable path
+  %(prog)s --delay TEMP=0.05 --press 3:a    # Slow sensor, press A after 3 seconds
+  %(prog)s --auto-press 0.5:b               # Press B half a second after every wait
+  %(prog)s --repeat-press 2:a               # Press A every 2 seconds
+  %(prog)s --legacy-loop                    # Read commands like the old firmware, for latency comparisons
+        """
+    )
+
+    parser.add_argument(
+        "--baud",
+        type=int,
+        default=115200,
+        help="Serial line rate to simulate, 0 for unthrottled (default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--temperature",
+        type=int,
+        default=21,
+        help="Temperature sensor reading in Celsius (default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--delay",
+        type=_parse_delay,
+        action="append",
+        default=[],
+        metavar="COMMAND=SECONDS",
+        help="Extra device-side processing time for a command (repeatable)"
+    )
+
+    parser.add_argument(
+        "--press",
+        type=_parse_press,
+        action="append",
+        default=[],
+        metavar="SECONDS:BUTTON",
+        help="Press a button this many seconds after start (repeatable)"
+    )
+
+    parser.add_argument(
+        "--repeat-press",
+        type=_parse_press,
+        metavar="SECONDS:BUTTON",
+        help="Press a button over and over, every this many seconds"
+    )
+
+    parser.add_argument(
+        "--auto-press",
+        type=_parse_press,
+        metavar="SECONDS:BUTTON",
+        help="Press a button this many seconds after every WAIT_BUTTON: command"
+    )
+
+    parser.add_argument(
+        "--clock-drift",
+        type=float,
+        default=0.0,
+        metavar="PPM",
+        help="How much faster the simulated clock runs, in parts per million (default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--uart-buffer",
+        type=int,
+        default=RX_WINDOW,
+        metavar="BYTES",
+        help="UART receive buffer size; bytes arriving while it is full are lost, 0 for unlimited (default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--legacy-loop",
+        action="store_true",
+        help="Read one byte per 50 ms loop pass, like the firmware before bulk UART reads"
+    )
+
+    parser.add_argument(
+        "--core",
+        action="store_true",
+        help="Run main.py without extras.py, as a micro:bit V1"
+    )
+
+    parser.add_argument(
+        "--board-id",
+        metavar="HEX",
+        help="Board ID reported by IDENTIFY: (default: random)"
+    )
+
+    parser.add_argument(
+        "--link",
+        help="Create a symlink to the pty at this path"
+    )
+
+    return parser.parse_args()
+
+
+async def main(args) -> None:
+    """Serve a simulated micro:bit until interrupted."""
+    simulator = MicrobitSimulator(
+        baudrate=args.baud or None,
+        presses=tuple(args.press),
+        repeat_press=args.repeat_press,
+        temperature=args.temperature,
+        delays=dict(args.delay),
+        auto_press=args.auto_press,
+        clock_drift_ppm=args.clock_drift,
+        board_id=args.board_id,
+        extras=not args.core,
+        link=args.link,
+        uart_buffer=args.uart_buffer or None,
+        legacy_loop=args.legacy_loop
+    )
+    port = await simulator.start()
+
+    print(f"Simulated micro:bit on {port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+
+def cli_main():
+    """Synchronous entry point for CLI."""
+    args = parse_arguments()
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    cli_main()
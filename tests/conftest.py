@@ -0,0 +1,39 @@
+"""
+Shared fixtures: a simulated micro:bit on a pseudo-terminal and a client
+connected to it, for tests that exercise the whole serial path.
+"""
+
+import asyncio
+from typing import Awaitable, Callable
+
+import pytest
+
+from mcp_server.microbit_client import MicrobitClient
+from microbit_sim import MicrobitSimulator
+
+
+@pytest.fixture
+def on_simulator() -> Callable:
+    """
+    Run a scenario against a simulated board.
+
+    Returns:
+        Function taking an async scenario(simulator, client) plus
+        MicrobitSimulator options, running it to completion and returning
+        its result. Client options go in client_options.
+    """
+
+    def run(scenario: Callable[..., Awaitable], client_options: dict = None, **simulator_options):
+        async def main():
+            simulator_options.setdefault("baudrate", None)
+            async with MicrobitSimulator(**simulator_options) as simulator:
+                client = MicrobitClient(simulator.port, clock_sync_interval=0, **(client_options or {}))
+                await client.connect()
+                try:
+                    return await scenario(simulator, client)
+                finally:
+                    await client.close()
+
+        return asyncio.run(asyncio.wait_for(main(), timeout=30))
+
+    return run
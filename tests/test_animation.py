@@ -0,0 +1,56 @@
+from mcp_server.protocol import Responses, format_animation_command, format_animation_frames_command
+
+ONES = "11111:11111:11111:11111:11111"
+NINES = "99999:99999:99999:99999:99999"
+
+
+def frames(count: int, start: int = 0) -> list[str]:
+    return [":".join([f"{(start + i) % 10}" * 5] * 5) for i in range(count)]
+
+
+async def status(client, command: str) -> str:
+    _, data = await client.request(command, (Responses.STATUS,), timeout=5)
+    return data["message"]
+
+
+def test_long_animation_plays_exactly_its_frames(on_simulator):
+    animation = frames(40)
+
+    async def scenario(simulator, client):
+        reply = await client.play_animation(animation, frame_delay_ms=1)
+        return reply, simulator.firmware.animations[-1]
+
+    reply, played = on_simulator(scenario)
+    assert reply["message"] == "animating:40"
+    assert played == animation
+
+
+def test_frames_left_behind_never_play_with_the_next_animation(on_simulator):
+    async def scenario(simulator, client):
+        # An upload whose ANIM: never came (cancelled, or its request abandoned)
+        assert await status(client, format_animation_frames_command(0, [NINES] * 16)) == "anim_staged:16"
+        await client.play_animation([ONES], frame_delay_ms=1)
+        single = simulator.firmware.animations[-1]
+        await status(client, format_animation_frames_command(0, [NINES] * 16))
+        await status(client, format_animation_frames_command(16, [NINES] * 16))
+        await client.play_animation(frames(20), frame_delay_ms=1)
+        return single, simulator.firmware.animations[-1]
+
+    single, chunked = on_simulator(scenario)
+    assert single == [ONES]
+    assert chunked == frames(20)
+
+
+def test_animation_with_the_wrong_staged_count_is_refused(on_simulator):
+    async def scenario(simulator, client):
+        await status(client, format_animation_frames_command(0, [NINES] * 16))
+        mismatch = await status(client, format_animation_command([ONES], 1, 1, staged=32))
+        # The stale frames are gone: an upload continuing them is refused too
+        missing = await status(client, format_animation_frames_command(16, [NINES] * 16))
+        return mismatch, missing, simulator.firmware.anim_frames
+
+    mismatch, missing, staged = on_simulator(scenario)
+    assert mismatch == "anim_error:staged:16"
+    assert missing == "anim_error:missing_frames"
+    assert staged == []
+
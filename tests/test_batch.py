@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+from mcp import types
+
+from mcp_server.server import MicrobitMCPServer
+from mcp_server.tools.batch import MAX_BATCH_STEPS, handle_batch_tool
+from microbit_sim import MicrobitSimulator
+
+
+def run_batch(arguments: dict, results: dict = None, delay: float = 0.05):
+    """Run a batch against fake tools; returns its summary and the calls made, as (event, tool, arguments)."""
+    calls = []
+
+    async def call_tool(name: str, arguments: dict) -> list[types.TextContent]:
+        calls.append(("start", name, arguments))
+        await asyncio.sleep(delay)
+        calls.append(("end", name, arguments))
+        outcome = (results or {}).get(name, {"done": name})
+        if isinstance(outcome, Exception):
+            raise outcome
+        text = outcome if isinstance(outcome, str) else json.dumps(outcome)
+        return [types.TextContent(type="text", text=text)]
+
+    async def main():
+        contents = await handle_batch_tool("batch", arguments, call_tool)
+        return json.loads(contents[0].text)
+
+    return asyncio.run(main()), calls
+
+
+def test_steps_run_in_order_and_parallel_steps_start_together():
+    summary, calls = run_batch({"steps": [
+        {"tool": "display_image", "arguments": {"image": "heart"}},
+        {"tool": "get_temperature"},
+        {"tool": "get_button_counts", "parallel": True},
+        {"tool": "play_music", "arguments": {"notes": ["C4:4"]}}
+    ]})
+    assert summary["ok"]
+    assert [step["result"] for step in summary["steps"]] == [
+        {"done": "display_image"}, {"done": "get_temperature"}, {"done": "get_button_counts"}, {"done": "play_music"}
+    ]
+    assert [(event, name) for event, name, _ in calls] == [
+        ("start", "display_image"), ("end", "display_image"),
+        ("start", "get_temperature"), ("start", "get_button_counts"),
+        ("end", "get_temperature"), ("end", "get_button_counts"),
+        ("start", "play_music"), ("end", "play_music")
+    ]
+
+
+def test_a_failing_step_skips_the_rest_unless_asked_to_carry_on():
+    steps = [{"tool": "get_temperature"}, {"tool": "display_image"}, {"tool": "get_button_counts"}]
+    failure = {"get_temperature": Exception("Timeout waiting for response from micro:bit")}
+
+    summary, calls = run_batch({"steps": steps}, failure)
+    assert not summary["ok"]
+    assert summary["steps"][0]["error"] == "Timeout waiting for response from micro:bit"
+    assert [step.get("skipped") for step in summary["steps"][1:]] == [True, True]
+    assert len(calls) == 2
+
+    summary, calls = run_batch({"steps": steps, "stop_on_error": False}, failure)
+    assert not summary["ok"]
+    assert [step["ok"] for step in summary["steps"]] == [False, True, True]
+
+
+def test_a_step_whose_result_reports_an_error_fails():
+    summary, calls = run_batch(
+        {"steps": [{"tool": "play_music", "arguments": {"notes": []}}, {"tool": "display_image"}]},
+        {"play_music": "Error: No notes provided"}
+    )
+    assert not summary["ok"]
+    assert not summary["steps"][0]["ok"]
+    assert summary["steps"][0]["error"] == "No notes provided"
+    assert "result" not in summary["steps"][0]
+    assert summary["steps"][1]["skipped"]
+    assert len(calls) == 2
+
+
+def test_batch_device_is_the_default_for_its_steps():
+    _, calls = run_batch({"device": "lab", "steps": [
+        {"tool": "get_temperature"},
+        {"tool": "get_temperature", "arguments": {"device": "desk"}}
+    ]})
+    assert [arguments["device"] for event, _, arguments in calls if event == "start"] == ["lab", "desk"]
+
+
+@pytest.mark.parametrize("steps", [
+    [],
+    [{"tool": "get_temperature"}] * (MAX_BATCH_STEPS + 1),
+    [{"arguments": {}}],
+    [{"tool": "batch", "arguments": {"steps": []}}],
+    [{"tool": "get_temperature", "arguments": []}]
+])
+def test_invalid_batches_run_nothing(steps):
+    with pytest.raises(ValueError):
+        run_batch({"steps": steps})
+
+
+def test_parallel_steps_are_pipelined_on_the_board():
+    async def main():
+        async with MicrobitSimulator(baudrate=None, delays={"TEMP": 0.2}) as simulator:
+            server = MicrobitMCPServer(simulator.port, temperature_ttl=0)
+            await server.setup()
+            try:
+                contents = await server._call_tool("batch", {"steps": [
+                    {"tool": "get_temperature"},
+                    {"tool": "get_button_counts", "parallel": True},
+                    {"tool": "display_image", "arguments": {"image": "99999:00000:00000:00000:00000"}, "parallel": True}
+                ]})
+                return json.loads(contents[0].text)
+            finally:
+                await server.close()
+
+    summary = asyncio.run(asyncio.wait_for(main(), timeout=30))
+    assert summary["ok"]
+    # The image didn't wait behind the slow temperature read
+    assert summary["steps"][2]["elapsed_ms"] < summary["steps"][0]["elapsed_ms"]
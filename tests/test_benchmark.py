@@ -0,0 +1,30 @@
+import pytest
+
+from microbit_sim.benchmark import percentile, summarize
+
+
+@pytest.mark.parametrize("count, fraction, rank", [
+    (10, 0.50, 5),
+    (10, 0.95, 10),
+    (20, 0.95, 19),
+    (100, 0.99, 99),
+    (100, 0.50, 50),
+    (101, 0.50, 51),
+    (4, 0.25, 1),
+    (5, 0.0, 1),
+    (5, 1.0, 5),
+])
+def test_percentile_is_nearest_rank(count, fraction, rank):
+    samples = [float(i) for i in range(1, count + 1)]
+    assert percentile(samples, fraction) == rank
+
+
+def test_percentile_of_nothing_is_zero():
+    assert percentile([], 0.5) == 0.0
+
+
+def test_summary_sorts_the_samples():
+    summary = summarize([3.0, 1.0, 2.0])
+    assert summary["count"] == 3
+    assert summary["p50_ms"] == 2.0
+    assert summary["p99_ms"] == 3.0
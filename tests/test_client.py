@@ -0,0 +1,201 @@
+import asyncio
+import time
+
+import pytest
+
+from mcp_server.microbit_client import MicrobitClient
+from mcp_server.protocol import (
+    SCROLL_DELAY_MS,
+    Responses,
+    format_button_wait_command,
+    format_temperature_command,
+    split_sequence
+)
+
+
+def test_one_reader_hands_each_reply_to_the_request_waiting_for_it(on_simulator):
+    async def scenario(simulator, client):
+        temperature, scrolling = await asyncio.gather(client.get_temperature(), client.scroll_message("Hi"))
+        # Nobody waits for these: the press is kept, the traceback counted
+        simulator.firmware.press("a")
+        simulator._emit("Traceback (most recent call last):")
+        await asyncio.sleep(0.1)
+        return temperature, scrolling, client.get_response_queue(Responses.BUTTON).get_nowait(), client.metrics()
+
+    temperature, scrolling, press, metrics = on_simulator(
+        scenario, client_options={"sequence_ids": False}, temperature=25
+    )
+    assert temperature["temperature_celsius"] == 25
+    assert scrolling["message"] == "scrolling:Hi"
+    assert press["button"] == "a" and press["action"] == "pressed"
+    assert metrics["unparsed_lines"] == 1
+
+
+def test_unclaimed_replies_are_bounded_per_type():
+    client = MicrobitClient("unused", queue_size=2)
+    for timestamp in range(3):
+        client._dispatch_line(f"TEMP|20|{timestamp}")
+    client._dispatch_line("STATUS|displayed:x|5")
+    queue = client.get_response_queue(Responses.TEMP)
+    assert [queue.get_nowait()["timestamp"] for _ in range(queue.qsize())] == [1, 2]
+    assert client.get_response_queue(Responses.STATUS).qsize() == 1
+    assert client.dropped_lines == 1
+
+
+def test_pipelined_requests_are_answered_by_sequence_number(on_simulator):
+    async def scenario(simulator, client):
+        wait = await client.send_request(
+            format_button_wait_command("a", 5), (Responses.BUTTON, Responses.BUTTON_TIMEOUT)
+        )
+        temperatures = await asyncio.gather(
+            *(client.send_request(format_temperature_command(), (Responses.TEMP,)) for _ in range(5))
+        )
+        await asyncio.wait_for(asyncio.gather(*temperatures), 5)
+        answered_early = wait.done()
+        simulator.firmware.press("a")
+        _, press = await asyncio.wait_for(wait, 5)
+        return answered_early, press, simulator.firmware.commands
+
+    answered_early, press, commands = on_simulator(scenario, client_options={"binary_framing": False})
+    # The later TEMP: replies overtook the button wait
+    assert not answered_early
+    assert press["button"] == "a"
+    sequenced = [split_sequence(command) for command in commands if "TEMP:" in command or "WAIT_BUTTON:" in command]
+    assert all(seq is not None for seq, _ in sequenced)
+    assert len({seq for seq, _ in sequenced}) == len(sequenced)
+
+
+def test_concurrent_temperature_reads_share_one_request(on_simulator):
+    async def scenario(simulator, client):
+        readers = [asyncio.create_task(client.get_temperature()) for _ in range(10)]
+        await asyncio.sleep(0.02)
+        # A caller giving up doesn't cancel the read for the others
+        readers[0].cancel()
+        readings = await asyncio.gather(*readers[1:])
+        return readings, [command for command in simulator.firmware.commands if "TEMP:" in command]
+
+    readings, sent = on_simulator(scenario, client_options={"temperature_ttl": 0}, delays={"TEMP:": 0.1})
+    assert len(sent) == 1
+    assert all(reading["temperature_celsius"] == 21 and not reading["cached"] for reading in readings)
+
+
+def test_temperature_is_served_from_memory_until_it_expires(on_simulator):
+    async def scenario(simulator, client):
+        first = await client.get_temperature()
+        simulator.firmware.temperature = 30
+        cached = await client.get_temperature()
+        await asyncio.sleep(0.25)
+        fresh = await client.get_temperature()
+        return first, cached, fresh
+
+    first, cached, fresh = on_simulator(scenario, client_options={"temperature_ttl": 0.2})
+    assert not first["cached"]
+    assert cached["cached"] and cached["temperature_celsius"] == 21
+    assert not fresh["cached"] and fresh["temperature_celsius"] == 30
+
+
+def test_scroll_wait_is_timed_by_the_characters_scrolled():
+    client = MicrobitClient("unused")
+    durations = []
+
+    async def start_background(command, started, ended, wait, duration, coalesce):
+        durations.append(duration)
+        return {}
+
+    client._start_background = start_background
+    asyncio.run(client.scroll_message("Hé!", wait=True))
+    # "He!": the MESSAGE: prefix never scrolls
+    assert durations == [3 * 6 * SCROLL_DELAY_MS / 1000]
+
+
+def test_first_button_wait_ignores_presses_before_it(on_simulator):
+    async def scenario(simulator, client):
+        simulator.firmware.press("a")
+        await asyncio.sleep(0.1)
+        first = await client.wait_for_button_press("a", timeout=0.2)
+        # A press between waits is kept for the next one
+        simulator.firmware.press("b")
+        await asyncio.sleep(0.1)
+        second = await client.wait_for_button_press("any", timeout=0.2)
+        return first, second
+
+    first, second = on_simulator(scenario)
+    assert first["timeout"] is True
+    assert second["button_pressed"] == "b"
+
+
+def test_press_of_another_button_stays_for_the_wait_on_it(on_simulator):
+    async def scenario(simulator, client):
+        waiting = asyncio.create_task(client.wait_for_button_press("a", timeout=2))
+        await asyncio.sleep(0.1)
+        simulator.firmware.press("b")
+        await asyncio.sleep(0.1)
+        simulator.firmware.press("a")
+        pressed = [(await waiting)["button_pressed"]]
+        # The press of B came before the press of A the first wait returned
+        for button in ("b", "any", "a"):
+            pressed.append((await client.wait_for_button_press(button, timeout=0.2))["button_pressed"])
+        return pressed
+
+    assert on_simulator(scenario) == ["a", "b", None, None]
+
+
+def test_invalid_image_is_rejected_before_it_is_sent(on_simulator):
+    async def scenario(simulator, client):
+        with pytest.raises(ValueError):
+            await client.show_image("heart")
+        return simulator.firmware.commands
+
+    assert not any("IMAGE:" in command for command in on_simulator(scenario))
+
+
+def test_command_the_board_fails_to_run_fails_its_request_at_once(on_simulator):
+    async def scenario(simulator, client):
+        started = time.monotonic()
+        with pytest.raises(Exception, match="command_failed:ValueError"):
+            await client.request(
+                "IMAGE:heart",
+                (Responses.STATUS,),
+                lambda kind, data: data["message"].startswith("displayed:"),
+                timeout=5
+            )
+        failed_after = time.monotonic() - started
+        # The board carries on
+        return failed_after, await client.get_temperature()
+
+    failed_after, reading = on_simulator(scenario)
+    assert failed_after < 1
+    assert "temperature_celsius" in reading
+
+
+def test_command_too_long_for_the_board_fails_before_it_is_sent(on_simulator):
+    async def scenario(simulator, client):
+        with pytest.raises(ValueError, match="receive buffer"):
+            await client.request("MESSAGE:" + "x" * 600, (Responses.STATUS,), timeout=5)
+        return simulator.firmware.commands
+
+    assert not any("MESSAGE:" in command for command in on_simulator(scenario))
+
+
+def test_board_out_of_memory_is_reported(capsys):
+    client = MicrobitClient("unused")
+    client._dispatch_line("Traceback (most recent call last):")
+    client._dispatch_line("MemoryError: memory allocation failed, allocating 1024 bytes")
+    client._dispatch_line("STATUS|error:memory|1200")
+    assert client.metrics()["memory_errors"] == 2
+    assert "without extras.py" in capsys.readouterr().err
+
+
+def test_board_without_the_extras_is_driven_over_the_core_commands(on_simulator):
+    async def scenario(simulator, client):
+        image = await client.show_image("99999:00000:00000:00000:00000")
+        music = await client.play_music(["C4:4", "E4:4"])
+        return client.binary, image, music, simulator.firmware.commands
+
+    binary, image, music, commands = on_simulator(scenario, extras=False)
+    # PROTO: and MELODIES: went unanswered, as on older firmware
+    assert not binary
+    assert image["message"].startswith("displayed:")
+    assert music["message"] == "playing:2_notes"
+    assert any("MUSIC:" in command for command in commands)
+    assert not any("MELODY:" in command for command in commands)
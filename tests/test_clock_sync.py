@@ -0,0 +1,61 @@
+from mcp_server.clock_sync import ClockSync
+
+
+def device_ms(host: float, start: float = 100.0, drift_ppm: float = 0.0) -> int:
+    """running_time() of a board reset at host time start, with a drifting crystal."""
+    return int((host - start) * (1 + drift_ppm / 1e6) * 1000)
+
+
+def exchange(clock: ClockSync, sent: float, rtt: float, **board) -> None:
+    """A ping the board stamps halfway through its round trip."""
+    clock.add_sample(sent, sent + rtt, device_ms(sent + rtt / 2, **board))
+
+
+def test_unsynchronized_clock_converts_nothing():
+    clock = ClockSync()
+    assert not clock.synced
+    assert clock.to_host_time(1000) is None
+    assert clock.describe() == {"synced": False, "samples": 0}
+
+
+def test_shortest_round_trips_set_the_offset():
+    clock = ClockSync()
+    exchange(clock, 200.0, 0.004)
+    # Queued behind other traffic: stamped late, so not trusted
+    clock.add_sample(201.0, 201.2, device_ms(201.19))
+    assert abs(clock.to_monotonic(device_ms(205.0)) - 205.0) < 0.002
+    assert clock.describe()["min_rtt_ms"] == 4.0
+
+
+def test_drift_is_fitted_over_a_long_enough_span():
+    clock = ClockSync()
+    for i in range(4):
+        exchange(clock, 200.0 + i, 0.004, drift_ppm=200)
+    # Too short a span to tell drift from noise
+    assert clock.describe()["drift_ppm"] == 0.0
+
+    for i in range(1, 31):
+        exchange(clock, 200.0 + i * 10, 0.004, drift_ppm=200)
+    assert abs(clock.describe()["drift_ppm"] - 200) < 10
+    assert abs(clock.to_monotonic(device_ms(600.0, drift_ppm=200)) - 600.0) < 0.002
+
+
+def test_board_reset_starts_the_estimate_over():
+    clock = ClockSync()
+    for i in range(3):
+        exchange(clock, 200.0 + i, 0.004)
+    exchange(clock, 210.0, 0.004, start=209.0)
+    assert clock.describe()["samples"] == 1
+    assert abs(clock.to_monotonic(device_ms(211.0, start=209.0)) - 211.0) < 0.002
+
+
+def test_client_syncs_on_connect_and_splits_request_latency(on_simulator):
+    async def scenario(simulator, client):
+        await client.get_temperature()
+        return client.clock.describe(), client.latency_stats()
+
+    clock, latency = on_simulator(scenario)
+    assert clock["synced"] and clock["samples"] >= 1
+    assert latency["TEMP"]["count"] == 1
+    assert latency["TEMP"]["to_device_ms"] is not None
+    assert latency["TEMP"]["from_device_ms"] is not None
@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import pytest
+
+from mcp_server.device_pool import DevicePool, parse_port_spec
+from mcp_server.server import MicrobitMCPServer
+from microbit_sim import MicrobitSimulator
+
+
+def test_port_specs_name_their_devices():
+    assert parse_port_spec("left=/dev/ttyACM0") == ("left", "/dev/ttyACM0")
+    assert parse_port_spec("/dev/cu.usbmodem102") == ("cu.usbmodem102", "/dev/cu.usbmodem102")
+
+
+def test_selectors_resolve_ids_tags_and_all():
+    pool = DevicePool()
+    for device_id, tags in [("a", ("lab",)), ("b", ("lab", "desk")), ("c", ())]:
+        pool.add(device_id, object(), tags)
+
+    assert [device_id for device_id, _ in pool.select()] == ["a"]
+    assert [device_id for device_id, _ in pool.select("c")] == ["c"]
+    assert [device_id for device_id, _ in pool.select("lab")] == ["a", "b"]
+    assert [device_id for device_id, _ in pool.select("all")] == ["a", "b", "c"]
+    with pytest.raises(ValueError):
+        pool.select("garage")
+    with pytest.raises(ValueError):
+        pool.add("all", object())
+
+
+def test_tool_call_fans_out_with_a_result_per_device():
+    async def main():
+        async with MicrobitSimulator(baudrate=None, temperature=18) as first, \
+                MicrobitSimulator(baudrate=None, temperature=24) as second, \
+                MicrobitSimulator(baudrate=None, temperature=30) as unplugged:
+            server = MicrobitMCPServer(
+                [f"a={first.port}", f"b={second.port}", f"c={unplugged.port}"],
+                tags={"a": ("lab",), "b": ("lab",)},
+                device_timeout=1
+            )
+            await server.setup()
+            try:
+                lab = await server._call_tool("get_temperature", {"device": "lab"})
+                await unplugged.unplug()
+                everywhere = await server._call_tool("get_temperature", {"device": "all"})
+                return json.loads(lab[0].text), json.loads(everywhere[0].text)
+            finally:
+                await server.close()
+
+    lab, everywhere = asyncio.run(asyncio.wait_for(main(), timeout=30))
+    assert list(lab["devices"]) == ["a", "b"]
+    assert lab["devices"]["a"]["result"]["temperature_celsius"] == 18
+    assert lab["devices"]["b"]["result"]["temperature_celsius"] == 24
+    # A device that stops answering fails on its own; the others still answer
+    assert everywhere["devices"]["a"]["ok"] and everywhere["devices"]["b"]["ok"]
+    assert not everywhere["devices"]["c"]["ok"]
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+from serial.tools.list_ports_common import ListPortInfo
+
+from mcp_server import discovery
+from microbit_sim import MicrobitSimulator
+
+
+def port_info(device: str, vid=None, description: str = "n/a") -> ListPortInfo:
+    port = ListPortInfo(device)
+    port.vid = vid
+    port.description = description
+    return port
+
+
+@pytest.fixture
+def serial_ports(monkeypatch):
+    ports = [
+        port_info("/dev/ttyUSB0", vid=0x10C4, description="CP2102 USB to UART Bridge"),
+        port_info("/dev/ttyACM0", vid=discovery.MICROBIT_USB_VID, description="BBC micro:bit CMSIS-DAP"),
+        port_info("/dev/ttyS0"),
+        port_info("/dev/ttyACM1", vid=0x1234, description="mbed Serial Port"),
+    ]
+    monkeypatch.setattr(discovery.serial.tools.list_ports, "comports", lambda: ports)
+
+
+def test_only_likely_microbits_are_probed_by_default(serial_ports):
+    assert discovery.candidate_ports() == ["/dev/ttyACM0", "/dev/ttyACM1"]
+
+
+def test_every_usb_port_is_probed_on_request(serial_ports):
+    assert discovery.candidate_ports(all_usb=True) == ["/dev/ttyACM0", "/dev/ttyACM1", "/dev/ttyUSB0"]
+
+
+def test_identify_reports_the_board_and_closes_the_port():
+    async def main():
+        async with MicrobitSimulator(baudrate=None, board_id="ab12") as simulator:
+            first = await discovery.identify(simulator.port)
+            # The port was released: it can be opened again at once
+            second = await discovery.identify(simulator.port)
+            missing = await discovery.identify("/dev/does-not-exist", timeout=0.2)
+            return first, second, missing
+
+    first, second, missing = asyncio.run(main())
+    assert first["board_id"] == second["board_id"] == "ab12"
+    assert missing is None
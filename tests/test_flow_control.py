@@ -0,0 +1,70 @@
+import asyncio
+
+from mcp_server.microbit_client import MicrobitClient
+from microbit_sim.firmware import RX_WINDOW, SimulatedFirmware
+
+
+def test_firmware_counts_bytes_modulo_65536():
+    lines = []
+    firmware = SimulatedFirmware(lines.append)
+    firmware.flow_control = True
+    firmware.rx_consumed = 65530
+    firmware.rx_reported = 65530
+    firmware.received(20)
+    firmware.send_credit(drained=True)
+    assert lines == ["CREDIT|14"]
+
+
+def test_firmware_credits_half_windows_across_the_wrap():
+    lines = []
+    firmware = SimulatedFirmware(lines.append)
+    firmware.flow_control = True
+    firmware.rx_consumed = 65520
+    firmware.rx_reported = 65520
+    firmware.received(RX_WINDOW // 2 - 1)
+    firmware.send_credit(drained=False)
+    assert lines == []
+    firmware.received(1)
+    firmware.send_credit(drained=False)
+    assert lines == [f"CREDIT|{(65520 + RX_WINDOW // 2) & 0xFFFF}"]
+
+
+def test_client_credit_survives_the_wrap():
+    client = MicrobitClient("unused")
+    client.flow_window = 64
+    client._flow_mark = 100
+    # 65550 bytes written since FLOW:, 65546 of them read: the board's
+    # count has wrapped to 10
+    client.bytes_out = 100 + 65550
+    client._dispatch_line("CREDIT|10")
+    assert client._flow_consumed == 10
+    assert client._credit() == 60
+    # Everything read
+    client._dispatch_line(f"CREDIT|{65550 & 0xFFFF}")
+    assert client._credit() == 64
+
+
+def test_burst_stays_within_the_window(on_simulator):
+    async def scenario(simulator, client):
+        assert client.flow_window == RX_WINDOW
+        futures = [
+            await client.send_request(f"MESSAGE:message number {i} " + "x" * 40, ("STATUS|",), coalesce=False)
+            for i in range(40)
+        ]
+        await asyncio.wait_for(asyncio.gather(*futures), 10)
+        return simulator.rx_dropped, client.flow_stats()
+
+    dropped, stats = on_simulator(scenario, uart_buffer=RX_WINDOW)
+    assert dropped == 0
+    assert stats["backlog_bytes"] == 0
+    assert stats["stalls"] == 0
+
+
+def test_burst_overruns_the_buffer_without_flow_control(on_simulator):
+    async def scenario(simulator, client):
+        for i in range(40):
+            await client.send_command(f"MESSAGE:message number {i} " + "x" * 40)
+        await asyncio.sleep(0.5)
+        return simulator.rx_dropped
+
+    assert on_simulator(scenario, client_options={"flow_control": False}, uart_buffer=RX_WINDOW) > 0
@@ -0,0 +1,88 @@
+import pytest
+
+from mcp_server.framing import (
+    FRAME_START,
+    FrameParser,
+    decode_command,
+    decode_response,
+    encode_command,
+    encode_response
+)
+
+COMMANDS = [
+    "IMAGE:00300:03630:36963:03630:00300",
+    "#7#IMAGE:99999:00000:99999:00000:99999",
+    "TEMP:",
+    "#65535#TEMP:",
+    "#3#WAIT_BUTTON:a:2.5",
+    "MUSIC:C4:4,D#5:8,R:2,G",
+    "#12#MELODY:0a1b2c3d:C4:4,E4:4",
+    "PLAY_ID:deadbeef",
+    "STREAM:temp:500",
+    "#9#ANIM:100:2:32:" + ",".join(["0123456789" * 2 + "01234"] * 3),
+    "ANIM_ADD:16:" + ",".join(["9" * 25] * 2),
+]
+
+RESPONSES = [
+    "TEMP|23|9012",
+    "#17#TEMP|-5|4294967295",
+    "BUTTON|a|pressed|1234",
+    "#4#BUTTON|b|released|99",
+    "SAMPLE|temp|21|5000",
+]
+
+
+def _split(frame: bytes) -> bytes:
+    """A frame without its start and length bytes, as FrameParser hands it on."""
+    assert frame[0] == FRAME_START and frame[1] == len(frame) - 2
+    return frame[2:]
+
+
+@pytest.mark.parametrize("command", COMMANDS)
+def test_command_round_trip(command):
+    frame = encode_command(command)
+    assert frame is not None
+    assert decode_command(_split(frame)) == command
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+def test_response_round_trip(response):
+    frame = encode_response(response)
+    assert frame is not None
+    assert decode_response(_split(frame)) == response
+
+
+def test_binary_frames_are_smaller():
+    for command in COMMANDS:
+        assert len(encode_command(command)) < len(command) + 1
+
+
+@pytest.mark.parametrize("command", ["MESSAGE:hi", "IMAGE:123", "#70000#TEMP:", "PROG:Ma;S10"])
+def test_commands_without_encoding_stay_text(command):
+    assert encode_command(command) is None
+
+
+def test_status_replies_stay_text():
+    assert encode_response("#3#STATUS|displayed:x|10") is None
+
+
+def test_parser_splits_mixed_stream_fed_byte_by_byte():
+    stream = (
+        b"STATUS|ready|1\r\n"
+        + encode_response("#2#TEMP|21|100")
+        + b"#3#STATUS|pong|2\n"
+        + encode_response("BUTTON|a|pressed|150")
+    )
+    parser = FrameParser(decode_response)
+    lines = []
+    for i in range(len(stream)):
+        lines.extend(parser.feed(stream[i:i + 1]))
+    assert lines == ["STATUS|ready|1", "#2#TEMP|21|100", "#3#STATUS|pong|2", "BUTTON|a|pressed|150"]
+    assert parser.buffered == 0
+    assert parser.errors == 0
+
+
+def test_parser_counts_undecodable_frames():
+    parser = FrameParser(decode_response)
+    assert parser.feed(bytes([FRAME_START, 3, 0x7F, 0, 0]) + b"STATUS|ok|1\n") == ["STATUS|ok|1"]
+    assert parser.errors == 1
@@ -0,0 +1,112 @@
+import random
+
+from mcp_server.framing import MAX_MELODY_NOTES
+from mcp_server.melody_cache import MelodyCache, melody_id
+from mcp_server.protocol import MAX_LINE_BYTES
+from microbit_sim.firmware import MELODY_CACHE_NOTES, SimulatedFirmware
+
+NOTES = ["C4:4", "D4:4", "E4:8", "F#4:2", "G4", "A4:1", "R:4", "B3:8"]
+
+
+def melody(rng: random.Random) -> list[str]:
+    return [rng.choice(NOTES) for _ in range(rng.randint(1, 60))]
+
+
+def test_melody_id_is_stable_and_ignores_whitespace():
+    assert melody_id(["C4:4", "E4:4"]) == melody_id([" C4:4", "E4:4 "])
+    assert melody_id(["C4:4", "E4:4"]) != melody_id(["E4:4", "C4:4"])
+    assert len(melody_id(["C4:4"])) == 8
+
+
+def test_unvalidated_notes_are_never_cached():
+    assert melody_id(["C4:4", "not a note"]) is None
+    assert melody_id([]) is None
+
+
+def test_least_recently_used_is_evicted_first():
+    cache = MelodyCache(capacity_notes=10)
+    cache.add("a", 4)
+    cache.add("b", 4)
+    cache.touch("a")
+    cache.add("c", 4)
+    assert "a" in cache and "c" in cache and "b" not in cache
+
+
+def test_melody_larger_than_the_store_is_not_kept():
+    cache = MelodyCache(capacity_notes=10)
+    cache.add("a", 4)
+    cache.add("huge", 11)
+    assert "huge" not in cache
+    # The board evicts everything trying to make room
+    assert len(cache) == 0
+
+
+def test_host_mirror_matches_simulated_firmware_store():
+    rng = random.Random(4)
+    firmware = SimulatedFirmware(lambda line: None)
+    cache = MelodyCache(MELODY_CACHE_NOTES)
+    known: dict[str, list[str]] = {}
+    for _ in range(300):
+        if known and rng.random() < 0.4:
+            # Replay: the board moves it to the most recently used end
+            melody_key = rng.choice(list(known))
+            if melody_key in firmware.melodies:
+                firmware.melodies[melody_key] = firmware.melodies.pop(melody_key)
+            cache.touch(melody_key)
+        else:
+            notes = melody(rng)
+            melody_key = melody_id(notes)
+            known[melody_key] = notes
+            firmware.store_melody(melody_key, notes)
+            cache.add(melody_key, len(notes))
+        for key in known:
+            assert (key in cache) == (key in firmware.melodies), key
+
+
+def test_client_cache_stays_in_step_with_the_board(on_simulator):
+    rng = random.Random(7)
+    tunes = [melody(rng) for _ in range(12)]
+
+    async def scenario(simulator, client):
+        for _ in range(40):
+            await client.play_music(rng.choice(tunes))
+        firmware = simulator.firmware
+        return [(melody_id(tune) in client.melodies, melody_id(tune) in firmware.melodies) for tune in tunes], firmware
+
+    membership, firmware = on_simulator(scenario)
+    assert all(host == board for host, board in membership)
+    # Replays went out as PLAY_ID:, so some uploads were saved
+    assert any("PLAY_ID:" in command for command in firmware.commands)
+
+
+def test_store_holds_what_one_melody_frame_carries():
+    assert MelodyCache().capacity_notes == MAX_MELODY_NOTES == MELODY_CACHE_NOTES
+    cache = MelodyCache()
+    assert cache.fits(MAX_MELODY_NOTES, MAX_LINE_BYTES)
+    assert not cache.fits(MAX_MELODY_NOTES + 1)
+    assert not cache.fits(10, MAX_LINE_BYTES + 1)
+
+
+def test_long_melody_over_text_framing_is_played_without_storing_it(on_simulator):
+    notes = ["C4:4"] * 100
+
+    async def scenario(simulator, client):
+        status = await client.play_music(notes)
+        return status, melody_id(notes) in client.melodies, simulator.firmware.commands
+
+    # The MELODY: line would overflow the board's receive buffer; MUSIC: fits
+    status, stored, commands = on_simulator(scenario, client_options={"binary_framing": False})
+    assert status["message"] == "playing:100_notes"
+    assert not stored
+    assert any("#MUSIC:" in command for command in commands)
+    assert not any("MELODY:" in command for command in commands)
+
+
+def test_long_melody_is_stored_when_it_goes_out_as_a_frame(on_simulator):
+    notes = ["C4:4"] * 100
+
+    async def scenario(simulator, client):
+        await client.play_music(notes)
+        return melody_id(notes) in client.melodies, melody_id(notes) in simulator.firmware.melodies
+
+    assert on_simulator(scenario) == (True, True)
@@ -0,0 +1,57 @@
+import asyncio
+import random
+
+from mcp_server.metrics import LatencyHistogram, render_prometheus, serve_prometheus
+from mcp_server.server import MicrobitMCPServer
+from microbit_sim import MicrobitSimulator
+
+
+def test_quantiles_stay_within_the_bucket_precision():
+    rng = random.Random(3)
+    values = sorted(rng.lognormvariate(-4, 1.5) for _ in range(5000))
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * len(values)) - 1]
+        assert abs(histogram.quantile(q) - exact) <= exact / 16 + 1e-6
+    assert histogram.quantile(1.0) == values[-1]
+    # Counters per power of two spanned, not one per value
+    assert len(histogram._buckets) < len(values) / 10
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.5) is None
+    assert histogram.summary() == {"count": 0}
+    histogram.record(0.25)
+    assert histogram.summary()["p99_ms"] == 250.0
+
+
+def test_tool_calls_show_up_in_the_exposition_and_over_http():
+    async def main():
+        async with MicrobitSimulator(baudrate=None) as simulator:
+            server = MicrobitMCPServer(simulator.port)
+            await server.setup()
+            http = None
+            try:
+                await server._timed_call("get_temperature", {})
+                http = await serve_prometheus(lambda: render_prometheus(server.metrics()), "127.0.0.1", 0)
+                reader, writer = await asyncio.open_connection(*http.sockets[0].getsockname()[:2])
+                writer.write(b"GET /metrics HTTP/1.1\r\nHost: test\r\n\r\n")
+                response = await reader.read()
+                writer.close()
+                return render_prometheus(server.metrics()), response.decode()
+            finally:
+                if http:
+                    http.close()
+                await server.close()
+
+    text, response = asyncio.run(asyncio.wait_for(main(), timeout=30))
+    assert 'microbit_tool_calls_total{tool="get_temperature"} 1' in text
+    assert 'microbit_tool_errors_total{tool="get_temperature"} 0' in text
+    assert 'microbit_tool_latency_seconds_count{tool="get_temperature"} 1' in text
+    assert 'microbit_command_latency_seconds_count{device=' in text
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert "microbit_serial_bytes_total" in response
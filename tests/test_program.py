@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from mcp_server.program import (
+    MAX_PROGRAM_DEPTH,
+    MAX_PROGRAM_INSTRUCTIONS,
+    compile_program,
+    format_program_command,
+    parse_program_event
+)
+
+HEART = "09090:99999:99999:09990:00900"
+
+
+def sleep(ms: int = 10) -> dict:
+    return {"op": "sleep", "ms": ms}
+
+
+def test_steps_compile_to_instructions():
+    assert compile_program([
+        {"op": "show_image", "image": HEART},
+        {"op": "scroll", "text": "Hi there"},
+        {"op": "clear"},
+        sleep(250),
+        {"op": "play", "notes": ["C4:4", " E4:8"]},
+        {"op": "wait_for_button", "button": "b", "timeout_ms": 3000},
+        {"op": "wait_for_button"},
+        {"op": "show_temperature"},
+        {"op": "mark", "label": "end"},
+    ]) == [
+        "I0909099999999990999000900",
+        "DHi there",
+        "X",
+        "S250",
+        "PC4:4,E4:8",
+        "Kb:3000",
+        "Kany:0",
+        "T",
+        "Mend",
+    ]
+
+
+def test_loop_end_points_past_its_e():
+    instructions = compile_program([
+        {"op": "mark", "label": "start"},
+        {"op": "repeat", "times": 3, "until_button": "a", "steps": [
+            {"op": "clear"},
+            {"op": "repeat", "steps": [sleep()]},
+            sleep(),
+        ]},
+        {"op": "mark", "label": "after"},
+    ])
+    assert instructions == ["Mstart", "L3:a:8", "X", "L0:-:6", "S10", "E", "S10", "E", "Mafter"]
+    for index, instruction in enumerate(instructions):
+        if instruction.startswith("L"):
+            end = int(instruction.split(":")[2])
+            assert instructions[end - 1] == "E"
+            # The E before end closes this loop: the L/E pairs between them balance
+            body = instructions[index + 1:end - 1]
+            assert sum(op.startswith("L") for op in body) == body.count("E")
+
+
+def test_command_joins_instructions():
+    assert format_program_command(["Ma", "S10"]) == "PROG:Ma;S10"
+    assert format_program_command([]) == "PROG:"
+
+
+@pytest.mark.parametrize("steps, message", [
+    ([], "non-empty list"),
+    ("show", "non-empty list"),
+    ([{"op": "dance"}], "op must be one of"),
+    (["clear"], "op must be one of"),
+    ([{"op": "show_image", "image": "12345"}], "image must be"),
+    ([{"op": "scroll", "text": "a;b"}], "printable ASCII"),
+    ([{"op": "scroll", "text": "café"}], "printable ASCII"),
+    ([{"op": "scroll", "text": "x" * 41}], "printable ASCII"),
+    ([{"op": "sleep", "ms": 0}], "ms must be"),
+    ([{"op": "sleep", "ms": True}], "ms must be"),
+    ([{"op": "sleep"}], "ms must be"),
+    ([{"op": "play", "notes": []}], "notes must be"),
+    ([{"op": "play", "notes": ["H9"]}], "notes must be"),
+    ([{"op": "wait_for_button", "button": "c"}], "button must be"),
+    ([{"op": "wait_for_button", "timeout_ms": -1}], "timeout_ms must be"),
+    ([{"op": "mark", "label": ""}], "label must be"),
+    ([{"op": "repeat", "steps": [{"op": "mark", "label": "x"}]}], "needs a sleep or wait_for_button"),
+    ([{"op": "repeat", "steps": []}], "non-empty list"),
+    ([{"op": "repeat", "times": -1, "steps": [sleep()]}], "times must be"),
+    ([{"op": "repeat", "until_button": "c", "steps": [sleep()]}], "until_button must be"),
+])
+def test_invalid_steps_are_rejected(steps, message):
+    with pytest.raises(ValueError, match=message):
+        compile_program(steps)
+
+
+def test_error_names_the_step():
+    with pytest.raises(ValueError, match=r"steps\[1\]\.steps\[0\]: ms"):
+        compile_program([{"op": "clear"}, {"op": "repeat", "steps": [{"op": "sleep", "ms": 0}]}])
+
+
+def test_nesting_is_limited():
+    steps = [sleep()]
+    for _ in range(MAX_PROGRAM_DEPTH):
+        steps = [{"op": "repeat", "steps": steps}]
+    compile_program(steps)
+    with pytest.raises(ValueError, match="nested"):
+        compile_program([{"op": "repeat", "steps": steps}])
+
+
+def test_size_is_limited():
+    compile_program([{"op": "clear"}] * MAX_PROGRAM_INSTRUCTIONS)
+    with pytest.raises(ValueError, match="instructions"):
+        compile_program([{"op": "clear"}] * (MAX_PROGRAM_INSTRUCTIONS + 1))
+    with pytest.raises(ValueError, match="characters"):
+        compile_program([{"op": "scroll", "text": "x" * 40}] * 12)
+
+
+def test_program_events_are_parsed():
+    assert parse_program_event("prog_started:5") == {"event": "started", "instructions": 5}
+    assert parse_program_event("prog_button:a:347") == {"event": "button", "button": "a", "reaction_ms": 347}
+    assert parse_program_event("prog_temp:-3") == {"event": "temp", "celsius": -3}
+    assert parse_program_event("prog_mark:a:b") == {"event": "mark", "label": "a:b"}
+    assert parse_program_event("prog_done:1200") == {"event": "done", "elapsed_ms": 1200}
+    assert parse_program_event("prog_error:too_long") == {"event": "error", "reason": "too_long"}
+    assert parse_program_event("prog_error:bad_instruction:4") == {
+        "event": "error", "reason": "bad_instruction", "instruction": 4
+    }
+
+
+def test_press_ends_loop_on_the_board(on_simulator):
+    steps = [
+        {"op": "repeat", "until_button": "a", "steps": [
+            {"op": "show_image", "image": HEART}, sleep(200), {"op": "clear"}, sleep(200)
+        ]},
+        {"op": "repeat", "times": 3, "steps": [{"op": "mark", "label": "r"}, sleep(5)]},
+        {"op": "show_temperature"},
+    ]
+
+    async def scenario(simulator, client):
+        run = asyncio.create_task(client.run_program(steps, wait=True, timeout=5))
+        await asyncio.sleep(0.5)
+        simulator.firmware.press("a")
+        return await run
+
+    result = on_simulator(scenario, temperature=19)
+    assert result["status"] == "done"
+    events = [event["event"] for event in result["events"]]
+    assert events == ["started", "button", "mark", "mark", "mark", "temp", "done"]
+    button = result["events"][1]
+    assert button["button"] == "a" and 400 <= button["reaction_ms"] <= 1000
+    assert result["events"][5]["celsius"] == 19
+
+
+def test_timed_out_program_is_stopped_on_the_board(on_simulator):
+    async def scenario(simulator, client):
+        result = await client.run_program([{"op": "wait_for_button", "button": "a"}], wait=True, timeout=0.2)
+        return result, simulator.firmware
+
+    result, firmware = on_simulator(scenario)
+    assert result["status"] == "timeout"
+    assert firmware.program is None
+    assert firmware.cancelled[-1] == (f"#{result['seq']}#", "program")
+
+
+def test_new_program_replaces_the_running_one(on_simulator):
+    async def scenario(simulator, client):
+        first = asyncio.create_task(client.run_program([sleep(5000)], wait=True))
+        await asyncio.sleep(0.1)
+        second = await client.run_program([{"op": "mark", "label": "x"}], wait=True)
+        return await first, second
+
+    first, second = on_simulator(scenario)
+    assert first["status"] == "stopped"
+    assert second["status"] == "done"
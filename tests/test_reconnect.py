@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from mcp_server.microbit_client import MicrobitClient
+from microbit_sim import MicrobitSimulator
+
+
+def run_unplugged(scenario, link: str, **client_options):
+    """Run scenario(simulator, client) with a client on a simulator reachable through link."""
+
+    async def main():
+        async with MicrobitSimulator(baudrate=None, link=link) as simulator:
+            client = MicrobitClient(
+                link, clock_sync_interval=0, reconnect_delay=0.05, ready_timeout=0.5, **client_options
+            )
+            await client.connect()
+            try:
+                return await scenario(simulator, client)
+            finally:
+                await client.close()
+
+    return asyncio.run(asyncio.wait_for(main(), timeout=30))
+
+
+def test_commands_sent_while_unplugged_go_out_after_reconnecting(tmp_path):
+    async def scenario(simulator, client):
+        await simulator.unplug()
+        while client.writer is not None:
+            await asyncio.sleep(0.01)
+
+        image = asyncio.create_task(client.show_image("99999:00000:00000:00000:00000"))
+        reading = asyncio.create_task(client.get_temperature())
+        await asyncio.sleep(0.1)
+        held = client.metrics()["outbox_depth"]
+
+        await simulator.plug()
+        return held, await image, await reading, client.reconnects, simulator.firmware.commands
+
+    held, image, reading, reconnects, commands = run_unplugged(
+        scenario, str(tmp_path / "microbit"), temperature_ttl=0
+    )
+    assert held == 2
+    assert image["message"].startswith("displayed:")
+    assert "temperature_celsius" in reading
+    assert reconnects == 1
+    # The board was reset by the unplug, so it only saw what came after it,
+    # held commands first and in order
+    order = [command.split("#")[-1].split(":")[0] for command in commands]
+    assert order.index("IMAGE") < order.index("TEMP")
+
+
+def test_full_outbox_drops_by_policy(tmp_path):
+    async def scenario(simulator, client):
+        await simulator.unplug()
+        while client.writer is not None:
+            await asyncio.sleep(0.01)
+        await client.send_command("MESSAGE:one")
+        await client.send_command("MESSAGE:two")
+        with pytest.raises(Exception, match="queue is full"):
+            await client.send_command("MESSAGE:three")
+        return client.dropped_commands, [line for line, _ in client._outbox]
+
+    dropped, held = run_unplugged(
+        scenario, str(tmp_path / "microbit"), outbox_size=2, drop_policy="newest"
+    )
+    assert dropped == 1
+    assert held == ["MESSAGE:one", "MESSAGE:two"]
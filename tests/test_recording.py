@@ -0,0 +1,50 @@
+import asyncio
+
+from mcp_server.microbit_client import MicrobitClient
+from mcp_server.recording import Recorder, Replay, read_recording
+
+
+async def session(client: MicrobitClient) -> list:
+    results = [await client.get_temperature()]
+    results.append(await client.scroll_message("Hi", wait=True))
+    results.append(await client.get_temperature())
+    return [result.get("temperature_celsius", result.get("status")) for result in results]
+
+
+def test_replay_answers_like_the_recorded_board(on_simulator, tmp_path):
+    path = str(tmp_path / "session.mbrec")
+    recorder = Recorder(path)
+
+    async def record(simulator, client):
+        await client.close()
+        recorded = MicrobitClient(
+            simulator.port, clock_sync_interval=0, temperature_ttl=0, recording=recorder.stream("board")
+        )
+        await recorded.connect()
+        try:
+            return await session(recorded)
+        finally:
+            await recorded.close()
+
+    recorded = on_simulator(record, temperature=23)
+    recorder.close()
+    assert recorded[0] == recorded[2] == 23
+    assert {name for _, _, name, _ in read_recording(path)} >= {"board"}
+
+    replay = Replay(path, timing="fast")
+    assert replay.devices == ["board"]
+
+    async def replayed():
+        client = MicrobitClient(
+            "board", clock_sync_interval=0, temperature_ttl=0, open_connection=replay.connector("board")
+        )
+        await client.connect()
+        try:
+            return await session(client)
+        finally:
+            await client.close()
+
+    assert asyncio.run(asyncio.wait_for(replayed(), timeout=30)) == recorded
+    summary = replay.describe()
+    assert summary["unmatched_writes"] == 0
+    assert summary["stalls"] == 0
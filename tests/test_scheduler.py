@@ -0,0 +1,127 @@
+from mcp_server.scheduler import INTERACTIVE, NORMAL, CommandScheduler, Resources, classify
+
+
+def submit(scheduler: CommandScheduler, line: str, coalesce: bool = True):
+    command, superseded = scheduler.submit(line, line.encode() + b"\n", coalesce=coalesce)
+    return command, superseded
+
+
+def drain(scheduler: CommandScheduler) -> list[str]:
+    lines = []
+    while (command := scheduler.next()) is not None:
+        scheduler.written(command)
+        lines.append(command.line)
+    return lines
+
+
+def test_classify_ignores_the_sequence_envelope():
+    assert classify("#12#TEMP:") == (Resources.SENSORS, INTERACTIVE, False)
+    assert classify("MUSIC:C4:4") == (Resources.SPEAKER, NORMAL, True)
+    assert classify("IMAGE:00000:00000:00000:00000:00000") == (Resources.DISPLAY, NORMAL, True)
+    assert classify("SOMETHING:new") == (Resources.LINK, NORMAL, False)
+
+
+def test_interactive_commands_overtake_queued_display_updates():
+    scheduler = CommandScheduler()
+    submit(scheduler, "#1#MESSAGE:one", coalesce=False)
+    submit(scheduler, "#2#MESSAGE:two", coalesce=False)
+    submit(scheduler, "#3#TEMP:")
+    submit(scheduler, "#4#STREAM:temp:100")
+    assert drain(scheduler) == ["#3#TEMP:", "#1#MESSAGE:one", "#2#MESSAGE:two", "#4#STREAM:temp:100"]
+
+
+def test_resources_keep_their_order_and_ties_go_to_the_oldest():
+    scheduler = CommandScheduler()
+    submit(scheduler, "#1#MUSIC:C4", coalesce=False)
+    submit(scheduler, "#2#MESSAGE:a", coalesce=False)
+    submit(scheduler, "#3#MUSIC:D4", coalesce=False)
+    submit(scheduler, "#4#MESSAGE:b", coalesce=False)
+    assert drain(scheduler) == ["#1#MUSIC:C4", "#2#MESSAGE:a", "#3#MUSIC:D4", "#4#MESSAGE:b"]
+
+
+def test_withdrawn_command_is_never_written():
+    scheduler = CommandScheduler()
+    first, _ = submit(scheduler, "#1#WAIT_BUTTON:a:10")
+    submit(scheduler, "#2#TEMP:")
+    assert scheduler.withdraw(first)
+    assert first.withdrawn and first.done
+    assert drain(scheduler) == ["#2#TEMP:"]
+    # Only a queued command can be taken back
+    assert not scheduler.withdraw(first)
+
+
+def test_written_command_cannot_be_withdrawn():
+    scheduler = CommandScheduler()
+    command, _ = submit(scheduler, "#1#MUSIC:C4")
+    assert scheduler.next() is command
+    assert not scheduler.withdraw(command)
+
+
+def test_clear_drops_everything_queued():
+    scheduler = CommandScheduler()
+    submit(scheduler, "#1#TEMP:")
+    submit(scheduler, "#2#MESSAGE:x")
+    dropped = scheduler.clear()
+    assert len(dropped) == 2 and all(command.dropped for command in dropped)
+    assert scheduler.next() is None
+    assert scheduler.queued_bytes() == 0
+
+
+def test_latency_is_recorded_per_class():
+    scheduler = CommandScheduler(latency_targets={INTERACTIVE: 0.0})
+    submit(scheduler, "#1#TEMP:")
+    drain(scheduler)
+    interactive = scheduler.stats()["classes"]["interactive"]
+    assert interactive["queue_latency"]["count"] == 1
+    assert interactive["over_target"] == 1
+
+
+
+def test_newer_display_update_supersedes_the_queued_one():
+    scheduler = CommandScheduler()
+    first, _ = submit(scheduler, "#1#IMAGE:11111:11111:11111:11111:11111")
+    second, superseded = submit(scheduler, "#2#MESSAGE:hi")
+    assert superseded == [first]
+    assert first.superseded and first.done
+    assert drain(scheduler) == ["#2#MESSAGE:hi"]
+    assert second.written
+    assert scheduler.stats()["resources"]["display"]["superseded"] == 1
+
+
+def test_commands_without_coalescing_neither_supersede_nor_are_superseded():
+    scheduler = CommandScheduler()
+    submit(scheduler, "#1#IMAGE:11111:11111:11111:11111:11111", coalesce=False)
+    _, superseded = submit(scheduler, "#2#IMAGE:22222:22222:22222:22222:22222")
+    assert superseded == []
+    _, superseded = submit(scheduler, "#3#IMAGE:33333:33333:33333:33333:33333", coalesce=False)
+    assert superseded == []
+    assert len(drain(scheduler)) == 3
+
+
+def test_music_does_not_supersede_display_updates():
+    scheduler = CommandScheduler()
+    submit(scheduler, "#1#IMAGE:11111:11111:11111:11111:11111")
+    _, superseded = submit(scheduler, "#2#MUSIC:C4")
+    assert superseded == []
+
+
+def test_superseded_animation_takes_its_staged_frames_along():
+    frames = ",".join(["1" * 25] * 16)
+    scheduler = CommandScheduler()
+    old = [submit(scheduler, line)[0] for line in (f"#1#ANIM_ADD:0:{frames}", f"#2#ANIM:100:1:{frames}")]
+    new = [submit(scheduler, line)[0] for line in (f"#3#ANIM_ADD:0:{frames}", f"#4#ANIM_ADD:16:{frames}")]
+    _, superseded = submit(scheduler, f"#5#ANIM:100:1:{frames}")
+    assert superseded == old
+    assert not any(command.superseded for command in new)
+    assert [line.partition(":")[0] for line in drain(scheduler)] == ["#3#ANIM_ADD", "#4#ANIM_ADD", "#5#ANIM"]
+
+
+def test_staged_frames_of_a_kept_animation_stay():
+    frames = "1" * 25
+    scheduler = CommandScheduler()
+    submit(scheduler, f"#1#ANIM_ADD:0:{frames}")
+    submit(scheduler, f"#2#ANIM:100:1:{frames}", coalesce=False)
+    submit(scheduler, "#3#IMAGE:11111:11111:11111:11111:11111")
+    _, superseded = submit(scheduler, "#4#MESSAGE:hi")
+    assert [command.line for command in superseded] == ["#3#IMAGE:11111:11111:11111:11111:11111"]
+    assert len(drain(scheduler)) == 3
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from mcp_server.sensor_buffer import SampleRingBuffer
+
+
+def test_oldest_samples_are_overwritten_when_full():
+    buffer = SampleRingBuffer(capacity=3)
+    now = time.time()
+    for i in range(5):
+        buffer.append(float(i), i * 100, now - 5 + i)
+    assert len(buffer) == 3
+    assert [value for _, value in buffer.window(60)] == [2.0, 3.0, 4.0]
+    assert buffer.latest()["value"] == 4.0
+    assert buffer.latest()["timestamp"] == 400
+
+
+def test_window_keeps_only_recent_samples():
+    buffer = SampleRingBuffer(capacity=10)
+    now = time.time()
+    buffer.append(1.0, 0, now - 30)
+    buffer.append(2.0, 1000, now - 5)
+    buffer.append(3.0, 2000, now - 1)
+    assert [value for _, value in buffer.window(10)] == [2.0, 3.0]
+
+
+def test_aggregate_fits_the_slope_per_minute():
+    buffer = SampleRingBuffer(capacity=10)
+    now = time.time()
+    # One degree more every 30 seconds
+    for i in range(4):
+        buffer.append(20.0 + i, i * 30000, now - 90 + i * 30)
+    summary = buffer.aggregate(120)
+    assert summary["count"] == 4
+    assert (summary["min"], summary["max"], summary["mean"]) == (20.0, 23.0, 21.5)
+    assert summary["slope_per_minute"] == 2.0
+
+
+def test_empty_buffer():
+    buffer = SampleRingBuffer(capacity=4)
+    assert buffer.latest() is None
+    assert buffer.aggregate(60) == {"window_seconds": 60, "count": 0}
+    buffer.append(21.0, 0)
+    assert buffer.aggregate(60)["slope_per_minute"] is None
+
+
+def test_streamed_samples_fill_the_buffer_and_answer_temperature_reads(on_simulator):
+    async def scenario(simulator, client):
+        await client.start_stream("temp", 20)
+        await asyncio.sleep(0.3)
+        reading = await client.get_temperature()
+        await client.stop_stream("temp")
+        return len(client.get_stream("temp")), reading, simulator.firmware.commands
+
+    count, reading, commands = on_simulator(scenario, temperature=17)
+    assert count >= 5
+    assert reading["temperature_celsius"] == 17 and reading["cached"]
+    assert not any("TEMP:" in command for command in commands)
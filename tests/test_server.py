@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import anyio
+from mcp import types
+from mcp.shared.memory import create_connected_server_and_client_session
+
+from mcp_server.server import METRICS_URI, MicrobitMCPServer
+from microbit_sim import MicrobitSimulator
+
+
+def test_cancelled_tool_call_stops_the_board_and_the_server_carries_on():
+    async def main():
+        async with MicrobitSimulator(baudrate=None) as simulator:
+            server = MicrobitMCPServer(simulator.port)
+            await server.setup()
+            try:
+                async with create_connected_server_and_client_session(server.app) as session:
+                    outcome = {}
+
+                    async def play():
+                        try:
+                            await session.call_tool("play_music", {"notes": ["C4:8"] * 30, "wait": True})
+                        except Exception as e:
+                            outcome["error"] = str(e)
+
+                    async with anyio.create_task_group() as tg:
+                        request_id = session._request_id
+                        tg.start_soon(play)
+                        await anyio.sleep(0.3)
+                        assert simulator.firmware.music_task is not None
+                        await session.send_notification(types.ClientNotification(types.CancelledNotification(
+                            method="notifications/cancelled",
+                            params=types.CancelledNotificationParams(requestId=request_id, reason="test")
+                        )))
+                        await anyio.sleep(0.3)
+
+                    # The server is still there
+                    temperature = await session.call_tool("get_temperature", {})
+                    metrics = await session.read_resource(METRICS_URI)
+                    return outcome, temperature, json.loads(metrics.contents[0].text), simulator.firmware
+            finally:
+                await server.close()
+
+    outcome, temperature, metrics, firmware = asyncio.run(asyncio.wait_for(main(), timeout=30))
+    assert outcome["error"] == "Request cancelled"
+    assert not temperature.isError
+    assert metrics["tools"]["play_music"]["cancelled"] == 1
+    assert firmware.music_task is None
+    assert firmware.cancelled[-1][1] == "music"
+
+
+def test_tools_are_listed_before_the_board_connects_and_a_call_connects_it(tmp_path):
+    link = str(tmp_path / "microbit")
+
+    async def main():
+        # No board yet: the background connect fails and is retried on first use
+        server = MicrobitMCPServer(link)
+        server.start_setup()
+        try:
+            async with create_connected_server_and_client_session(server.app) as session:
+                tools = await session.list_tools()
+                await server._connect_task
+                connected = server.microbit_client.is_connected()
+                async with MicrobitSimulator(baudrate=None, link=link):
+                    temperature = await session.call_tool("get_temperature", {})
+                    return tools, connected, temperature, server.startup
+        finally:
+            await server.close()
+
+    tools, connected, temperature, startup = asyncio.run(asyncio.wait_for(main(), timeout=30))
+    assert "get_temperature" in [tool.name for tool in tools.tools]
+    assert not connected
+    assert not temperature.isError
+    assert startup["first_list_tools"] is not None
+    assert startup["devices_connected"] is None
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import time
+
+import serial_asyncio
+
+from microbit_sim import MicrobitSimulator
+
+
+async def open_port(port: str):
+    return await serial_asyncio.open_serial_connection(url=port, baudrate=115200)
+
+
+async def read_reply(reader: asyncio.StreamReader, seq: int) -> str:
+    """The next line carrying a sequence envelope, skipping STATUS|ready."""
+    while True:
+        line = (await asyncio.wait_for(reader.readline(), timeout=5)).decode().strip()
+        if line.startswith(f"#{seq}#"):
+            return line
+
+
+def test_board_answers_on_its_pty():
+    async def main():
+        async with MicrobitSimulator(baudrate=None, temperature=30) as simulator:
+            reader, writer = await open_port(simulator.port)
+            try:
+                writer.write(b"#5#TEMP:\n")
+                return await read_reply(reader, 5), simulator.firmware.commands
+            finally:
+                writer.close()
+
+    reply, commands = asyncio.run(main())
+    assert reply.startswith("#5#TEMP|30|")
+    assert commands == ["#5#TEMP:"]
+
+
+def test_bytes_beyond_the_uart_buffer_are_lost():
+    async def main():
+        async with MicrobitSimulator(baudrate=None, uart_buffer=64) as simulator:
+            reader, writer = await open_port(simulator.port)
+            try:
+                writer.write(b"MESSAGE:" + b"x" * 200 + b"\n")
+                await asyncio.sleep(0.2)
+                return simulator.rx_dropped
+            finally:
+                writer.close()
+
+    assert asyncio.run(main()) > 0
+
+
+def test_line_longer_than_the_receive_buffer_is_answered_with_its_sequence_number():
+    async def main():
+        # A UART buffer large enough to take the whole burst, as flow control would pace it
+        async with MicrobitSimulator(baudrate=None, uart_buffer=None) as simulator:
+            reader, writer = await open_port(simulator.port)
+            try:
+                writer.write(b"#9#MESSAGE:" + b"x" * 600 + b"\n#10#TEMP:\n")
+                return await read_reply(reader, 9), await read_reply(reader, 10)
+            finally:
+                writer.close()
+
+    too_long, reply = asyncio.run(main())
+    assert too_long.startswith("#9#STATUS|error:command_too_long|")
+    assert reply.startswith("#10#TEMP|")
+
+
+def test_legacy_loop_reads_one_byte_per_pass():
+    async def main():
+        async with MicrobitSimulator(baudrate=None, legacy_loop=True) as simulator:
+            reader, writer = await open_port(simulator.port)
+            try:
+                started = time.monotonic()
+                writer.write(b"#5#TEMP:\n")
+                await read_reply(reader, 5)
+                return time.monotonic() - started
+            finally:
+                writer.close()
+
+    # Nine bytes at 50 ms a pass
+    assert asyncio.run(main()) >= 0.4
+
+
+def test_unplug_resets_the_board_and_plug_brings_the_link_back(tmp_path):
+    link = str(tmp_path / "microbit")
+
+    async def main():
+        async with MicrobitSimulator(baudrate=None, link=link) as simulator:
+            await simulator.firmware.process_command("#1#PROTO:bin")
+            assert simulator.firmware.binary_out
+            await simulator.unplug()
+            unplugged = os.path.lexists(link), simulator.firmware.binary_out
+            port = await simulator.plug()
+            return unplugged, port, os.path.exists(link)
+
+    unplugged, port, plugged = asyncio.run(main())
+    assert unplugged == (False, False)
+    assert port == link and plugged
+
+
+def test_board_without_the_extras_reports_core_capabilities_only():
+    async def main():
+        async with MicrobitSimulator(baudrate=None, extras=False) as simulator:
+            reader, writer = await open_port(simulator.port)
+            try:
+                writer.write(b"#1#PROG:M1\n#2#IDENTIFY:\n")
+                lines = []
+                while not lines or not lines[-1].startswith("#2#"):
+                    lines.append((await asyncio.wait_for(reader.readline(), timeout=5)).decode().strip())
+                return lines
+            finally:
+                writer.close()
+
+    lines = asyncio.run(main())
+    # PROG: went unanswered
+    assert not any(line.startswith("#1#") for line in lines)
+    assert lines[-1].split("|")[1].split(":")[-1] == "events,ping,flow,cancel"